@@ -1,7 +1,6 @@
 import os
 
 from dotenv import load_dotenv
-from langchain import hub
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain_community.document_loaders import PyPDFLoader
@@ -10,8 +9,16 @@ from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_text_splitters import CharacterTextSplitter
 
+# On-disk embedding cache of the examples
+from embedding_cache import CachedEmbeddings
+from mmap_index import MmapVectorStore
+from local_prompts import load_prompt
+
 load_dotenv()
 
+# "faiss" pickles the index, "mmap" writes numpy files that open without unpickling
+VECTOR_STORE = os.getenv("VECTOR_STORE", "faiss")
+
 if __name__ == "__main__":
     print("Chatting with PDF...")
 
@@ -24,22 +31,33 @@ if __name__ == "__main__":
 
     docs = splitter.split_documents(documents)
 
-    embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    )
 
-    # This will store it in the RAM of the machine
-    vector_store = FAISS.from_documents(docs, embeddings)
+    if VECTOR_STORE == "mmap":
+        # Builds a memory-mapped index on disk
+        vector_store = MmapVectorStore.from_documents(
+            docs, embeddings, directory="mmap_index_react"
+        )
 
-    # We can also store it
-    vector_store.save_local("faiss_index_react")
+        # Opening it again only maps the files, nothing is unpickled
+        vector_store = MmapVectorStore("mmap_index_react", embeddings)
+    else:
+        # This will store it in the RAM of the machine
+        vector_store = FAISS.from_documents(docs, embeddings)
 
-    # Load from local (just to showcase how it works)
-    vector_store = FAISS.load_local(
-        "faiss_index_react", embeddings, allow_dangerous_deserialization=True
-    )
+        # We can also store it
+        vector_store.save_local("faiss_index_react")
+
+        # Load from local (just to showcase how it works)
+        vector_store = FAISS.load_local(
+            "faiss_index_react", embeddings, allow_dangerous_deserialization=True
+        )
 
     llm = ChatOpenAI(model="gpt-4.1-nano")
 
-    retrieval_qa_chat_prompt = hub.pull("langchain-ai/retrieval-qa-chat")
+    retrieval_qa_chat_prompt = load_prompt("langchain-ai/retrieval-qa-chat")
 
     combine_docs_chain = create_stuff_documents_chain(llm, retrieval_qa_chat_prompt)
 
@@ -0,0 +1,270 @@
+"""
+On-disk embedding cache shared by ingestion, retrieval and the tests.
+
+Vectors live in memory-mapped float32 files (one per embedding size) and a
+small SQLite index maps (model name, text hash) to a row of those files, so
+the same text is never embedded twice, across processes and runs. Writers
+hold an exclusive lock of the index from the choice of their rows to their
+commit, readers look a row up and read its vector in one read transaction,
+so no process reads a row while another one overwrites it.
+
+A copy of langgraph/agentic_rag/embedding_cache.py, the examples do not
+import each other; langgraph/agentic_rag/tests/test_copies.py keeps the two
+identical.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "./.embedding_cache")
+# Upper bound of cached vectors per embedding size, least recently used go first
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "200000"))
+
+_MIN_ROWS = 1024
+
+
+class EmbeddingCache:
+    """
+    Size bounded LRU store of float32 vectors
+
+    Args:
+        directory: Where the index and the vector files are kept
+        max_entries: Maximum number of vectors kept per embedding size
+    """
+
+    def __init__(
+        self,
+        directory: str = EMBEDDING_CACHE_DIR,
+        max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._vectors: Dict[int, np.memmap] = {}
+        # Transactions are begun explicitly, see put_many and get_many
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite"),
+            check_same_thread=False,
+            timeout=30,
+            isolation_level=None,
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, dim INTEGER, slot INTEGER, last_used REAL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_lru ON entries (dim, last_used)"
+        )
+
+    def __len__(self) -> int:
+        return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _vector_file(self, dim: int, min_rows: int) -> np.memmap:
+        """
+        The vectors of a size, mapped with at least `min_rows` rows. Another
+        process may have grown the file since it was mapped, it is mapped
+        again then; only a writer, holding the index lock, grows it itself.
+        """
+        matrix = self._vectors.get(dim)
+        if matrix is not None and matrix.shape[0] >= min_rows:
+            return matrix
+        path = os.path.join(self.directory, f"vectors-{dim}.f32")
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        rows = os.path.getsize(path) // row_bytes if os.path.exists(path) else 0
+        if rows < min_rows:
+            # Grows geometrically so appends do not remap the file every time
+            rows = min(max(min_rows, rows * 2, _MIN_ROWS), self.max_entries)
+            with open(path, "ab") as f:
+                f.truncate(rows * row_bytes)
+        self._vectors[dim] = np.memmap(
+            path, dtype=np.float32, mode="r+", shape=(rows, dim)
+        )
+        return self._vectors[dim]
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, List[float]]:
+        """
+        Returns the cached vectors of the given keys, misses are left out
+        """
+        if not keys:
+            return {}
+        found = {}
+        with self._lock:
+            rows = []
+            # The shared lock keeps writers from reusing the rows until they are read
+            self._db.execute("BEGIN")
+            try:
+                for start in range(0, len(keys), 500):
+                    batch = list(keys[start : start + 500])
+                    rows.extend(
+                        self._db.execute(
+                            "SELECT key, dim, slot FROM entries WHERE key IN "
+                            f"({','.join('?' * len(batch))})",
+                            batch,
+                        ).fetchall()
+                    )
+                for key, dim, slot in rows:
+                    found[key] = self._vector_file(dim, slot + 1)[slot].tolist()
+            finally:
+                self._db.execute("COMMIT")
+            if rows:
+                now = time.time()
+                self._db.executemany(
+                    "UPDATE entries SET last_used = ? WHERE key = ?",
+                    [(now, key) for key, _, _ in rows],
+                )
+        return found
+
+    def put_many(self, items: Dict[str, Sequence[float]]) -> None:
+        if not items:
+            return
+        with self._lock:
+            by_dim: Dict[int, Dict[str, Sequence[float]]] = {}
+            for key, vector in items.items():
+                by_dim.setdefault(len(vector), {})[key] = vector
+            now = time.time()
+            for dim, vectors in by_dim.items():
+                all_keys = list(vectors)[-self.max_entries :]
+                for start in range(0, len(all_keys), 500):
+                    keys = all_keys[start : start + 500]
+                    # EXCLUSIVE rather than IMMEDIATE: besides the other writers,
+                    # it waits for the readers of the rows about to be reused
+                    self._db.execute("BEGIN EXCLUSIVE")
+                    try:
+                        slots = self._allocate(dim, keys)
+                        matrix = self._vector_file(dim, max(slots) + 1)
+                        matrix[slots] = np.asarray(
+                            [vectors[k] for k in keys], dtype=np.float32
+                        )
+                        matrix.flush()
+                        self._db.executemany(
+                            "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                            [(key, dim, slot, now) for key, slot in zip(keys, slots)],
+                        )
+                    except BaseException:
+                        self._db.execute("ROLLBACK")
+                        raise
+                    self._db.execute("COMMIT")
+
+    def _allocate(self, dim: int, keys: List[str]) -> List[int]:
+        """
+        Finds a row for every key: its current row, a never used row or the
+        row of the least recently used vectors, in that order. Called inside
+        the write transaction, no other process takes the same rows.
+        """
+        existing = dict(
+            self._db.execute(
+                "SELECT key, slot FROM entries WHERE dim = ? AND key IN "
+                f"({','.join('?' * len(keys))})",
+                [dim, *keys],
+            ).fetchall()
+        )
+        used = self._db.execute(
+            "SELECT COUNT(*) FROM entries WHERE dim = ?", (dim,)
+        ).fetchone()[0]
+        missing = len(keys) - len(existing)
+        fresh = list(range(used, min(used + missing, self.max_entries)))
+        evicted = []
+        if missing > len(fresh):
+            evicted = self._db.execute(
+                "SELECT key, slot FROM entries WHERE dim = ? "
+                f"AND key NOT IN ({','.join('?' * len(keys))}) "
+                "ORDER BY last_used LIMIT ?",
+                [dim, *keys, missing - len(fresh)],
+            ).fetchall()
+            self._db.executemany(
+                "DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted]
+            )
+        free = iter(fresh + [slot for _, slot in evicted])
+        return [existing[key] if key in existing else next(free) for key in keys]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps any LangChain `Embeddings` so each (model, text) pair is only
+    embedded once. Documents and queries share the cache, which holds for
+    symmetric models such as the OpenAI ones.
+
+    Args:
+        embeddings: The embeddings doing the actual work on cache misses
+        cache: Where vectors are stored, the default on-disk cache if not given
+        model_name: Namespace of the keys, read from the wrapped embeddings by default
+        on_lookup: Called with (hit, count) after every lookup, to count the
+            hits and misses
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache: Optional[EmbeddingCache] = None,
+        model_name: Optional[str] = None,
+        on_lookup: Optional[Callable[[bool, int], None]] = None,
+    ):
+        self.embeddings = embeddings
+        self.cache = cache if cache is not None else EmbeddingCache()
+        self.model_name = (
+            model_name
+            or getattr(embeddings, "model", None)
+            or type(embeddings).__name__
+        )
+        self.on_lookup = on_lookup
+
+    def _record(self, hits: int, misses: int) -> None:
+        if self.on_lookup is not None:
+            self.on_lookup(True, hits)
+            self.on_lookup(False, misses)
+
+    def _key(self, text: str) -> str:
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return f"{self.model_name}:{text_hash}"
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        self._record(len(keys) - len(missing), len(missing))
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self.cache.get_many([key])
+        self._record(int(key in found), int(key not in found))
+        if key not in found:
+            found[key] = self.embeddings.embed_query(text)
+            self.cache.put_many(found)
+        return found[key]
+
+    # The cache lookups are local memory-mapped reads, only the misses are awaited
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key(t) for t in texts]
+        found = self.cache.get_many(keys)
+        missing = {k: t for k, t in zip(keys, texts) if k not in found}
+        self._record(len(keys) - len(missing), len(missing))
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing, vectors))
+            self.cache.put_many(computed)
+            found.update(computed)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        found = self.cache.get_many([key])
+        self._record(int(key in found), int(key not in found))
+        if key not in found:
+            found[key] = await self.embeddings.aembed_query(text)
+            self.cache.put_many(found)
+        return found[key]
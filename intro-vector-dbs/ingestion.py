@@ -10,6 +10,9 @@ from langchain_pinecone import PineconeVectorStore
 # Text Splitter (we need to split the text into chunks, to avoid token limits)
 from langchain_text_splitters import CharacterTextSplitter
 
+# On-disk embedding cache of the examples
+from embedding_cache import CachedEmbeddings
+
 load_dotenv()
 
 if __name__ == "__main__":
@@ -33,7 +36,10 @@ if __name__ == "__main__":
 
     # 5. We now need to create the embedding model
     # This will use under the hood the open ai model to create the embeddings
-    embedding_model = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    # Cached on disk, so re-running the ingestion does not embed the chunks again
+    embedding_model = CachedEmbeddings(
+        OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    )
 
     # Store them on Pinecone (our vector db)
     PineconeVectorStore.from_documents(
@@ -0,0 +1,38 @@
+"""
+Local copies of the LangChain hub prompts of these examples, no network fetch
+at run time.
+
+A copy is a JSON file under prompts/ holding the serialized template and the
+sha256 of its content, checked on load. It is the layout of
+langgraph/agentic_rag/prompt_registry.py: refresh a prompt there and copy
+its file over.
+"""
+
+import hashlib
+import json
+import os
+import warnings
+from functools import lru_cache
+
+from langchain_core.load import load
+from langchain_core.prompts import BasePromptTemplate
+
+PROMPTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+
+
+@lru_cache(maxsize=None)
+def load_prompt(name: str) -> BasePromptTemplate:
+    """
+    The local copy of the hub prompt `name`, a drop-in for `hub.pull(name)`
+    """
+    owner, _, repo = name.partition("/")
+    path = os.path.join(PROMPTS_DIR, owner, f"{repo}.json")
+    with open(path, encoding="utf-8") as file:
+        entry = json.load(file)
+    canonical = json.dumps(entry["prompt"], sort_keys=True, separators=(",", ":"))
+    if hashlib.sha256(canonical.encode("utf-8")).hexdigest() != entry["sha256"]:
+        raise ValueError(f"{path} does not match its sha256, it was edited by hand")
+    with warnings.catch_warnings():
+        # langchain_core.load is flagged beta, the prompt classes it revives are not
+        warnings.simplefilter("ignore")
+        return load(entry["prompt"], allowed_objects="core")
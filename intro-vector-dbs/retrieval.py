@@ -1,6 +1,4 @@
 from dotenv import load_dotenv
-# LangChain hub (for pulling pre-built prompts and chains)
-from langchain import hub
 # Chain for combining multiple documents into a single prompt
 from langchain.chains.combine_documents import create_stuff_documents_chain
 # Chain for retrieving relevant documents and then processing them
@@ -11,6 +9,11 @@ from langchain_core.runnables import RunnablePassthrough
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_pinecone import PineconeVectorStore
 
+# On-disk embedding cache of the examples
+from embedding_cache import CachedEmbeddings
+# Local copies of the LangChain hub prompts, no network fetch at run time
+from local_prompts import load_prompt
+
 
 def format_docs(docs):
     return "\n\n".join(doc.page_content for doc in docs)
@@ -31,7 +34,10 @@ if __name__ == "__main__":
 
     # 2. Create embeddings model (same as in ingestion.py)
     # This will convert text to vectors for similarity search
-    embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    # Repeated queries are served from the on-disk embedding cache
+    embeddings = CachedEmbeddings(
+        OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+    )
 
     # 3. Connect to our Pinecone vector store (where we stored the documents)
     vector_store = PineconeVectorStore(
@@ -42,9 +48,9 @@ if __name__ == "__main__":
     # This converts the vector store into a retriever that can be used with chains
     retriever = vector_store.as_retriever()
 
-    # 5. Pull a pre-built prompt template from LangChain hub
+    # 5. Load the pre-built LangChain hub prompt from its vendored local copy
     # This prompt is specifically designed for retrieval-augmented generation (RAG)
-    retrieval_qa_chat_prompt = hub.pull("langchain-ai/retrieval-qa-chat")
+    retrieval_qa_chat_prompt = load_prompt("langchain-ai/retrieval-qa-chat")
 
     # 6. Create a chain that takes a list of documents and formats them into a prompt
     # This chain will "stuff" the retrieved documents into the prompt template
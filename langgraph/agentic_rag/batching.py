@@ -0,0 +1,323 @@
+"""
+De-duplication of concurrent backend calls across requests.
+
+`SingleFlight` runs one call per key at a time: callers asking for a key
+that is already in flight wait for that call instead of making their own,
+and with a capacity the results are shared with later callers too.
+`QueryBatcher` collects the query embeddings asked within one tick and
+embeds them with a single call.
+"""
+
+import asyncio
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Set, Tuple, TypeVar
+
+from langchain_core.embeddings import Embeddings
+
+from graph.metrics import record_cache
+
+# Set to false to run every call, even when an identical one is in flight
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+# Seconds query embeddings are collected before being embedded together, 0 disables batching
+EMBEDDING_BATCH_TICK_S = float(os.getenv("EMBEDDING_BATCH_TICK_S", "0.005"))
+# A batch is embedded right away once it holds this many distinct queries
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+
+T = TypeVar("T")
+_MISSING = object()
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls by key. The first caller of a key runs the
+    call, the ones arriving while it runs get its result (or its exception).
+    Results are forgotten once the call returns unless `capacity` is set, in
+    which case the last `capacity` results are kept for `ttl` seconds.
+
+    Args:
+        name: Label of the lookups in the cache metrics
+        capacity: Number of results kept after their call returned
+        ttl: Seconds a kept result is served
+        clock: Time source, injectable for tests
+    """
+
+    def __init__(
+        self,
+        name: str,
+        capacity: int = 0,
+        ttl: float = math.inf,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._inflight: Dict[Hashable, Future] = {}
+        self._results: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def _cached(self, key: Hashable) -> Any:
+        entry = self._results.get(key)
+        if entry is None:
+            return _MISSING
+        if self.clock() - entry[1] > self.ttl:
+            del self._results[key]
+            return _MISSING
+        self._results.move_to_end(key)
+        return entry[0]
+
+    def _remember(self, key: Hashable, value: Any) -> None:
+        if self.capacity:
+            self._results[key] = (value, self.clock())
+            self._results.move_to_end(key)
+            while len(self._results) > self.capacity:
+                self._results.popitem(last=False)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        The kept result of `key`, without waiting for a call in flight
+        """
+        with self._lock:
+            value = self._cached(key)
+        return default if value is _MISSING else value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._remember(key, value)
+
+    def _join(self, key: Hashable) -> Tuple[Any, Future, bool]:
+        """
+        The kept result of the key, or the future of its call and whether the
+        caller has to make that call
+        """
+        with self._lock:
+            value = self._cached(key)
+            future = self._inflight.get(key) if value is _MISSING else None
+            leader = value is _MISSING and future is None
+            if leader:
+                future = self._inflight[key] = Future()
+                # A running future cannot be cancelled, an async caller giving
+                # up on it only drops its own wrapper
+                future.set_running_or_notify_cancel()
+                self.calls += 1
+            else:
+                self.shared += 1
+        record_cache(self.name, hit=not leader)
+        return value, future, leader
+
+    def _fail(self, key: Hashable, future: Future, error: BaseException) -> None:
+        with self._lock:
+            del self._inflight[key]
+        future.set_exception(error)
+
+    def _succeed(self, key: Hashable, future: Future, value: Any) -> None:
+        with self._lock:
+            del self._inflight[key]
+            self._remember(key, value)
+        future.set_result(value)
+
+    @staticmethod
+    def _abandoned(future: Future) -> bool:
+        """
+        Whether the call of the future was cancelled in its leader, the key is
+        free again and a waiting caller makes the call itself
+        """
+        return future.done() and isinstance(future.exception(), asyncio.CancelledError)
+
+    def do(self, key: Hashable, function: Callable[[], T]) -> T:
+        if not SINGLE_FLIGHT_ENABLED:
+            return function()
+        while True:
+            value, future, leader = self._join(key)
+            if value is not _MISSING:
+                return value
+            if leader:
+                break
+            try:
+                return future.result()
+            except asyncio.CancelledError:
+                if not self._abandoned(future):
+                    raise
+        try:
+            value = function()
+        except BaseException as error:
+            self._fail(key, future, error)
+            raise
+        self._succeed(key, future, value)
+        return value
+
+    async def ado(self, key: Hashable, function: Callable[[], Awaitable[T]]) -> T:
+        """
+        `do` for coroutines, sync and async callers of a key share the same call.
+        A cancelled caller only stops waiting, the others still get the result;
+        a cancelled leader hands the call over to one of the callers waiting.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return await function()
+        while True:
+            value, future, leader = self._join(key)
+            if value is not _MISSING:
+                return value
+            if leader:
+                break
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling() or not self._abandoned(future):
+                    raise
+        try:
+            value = await function()
+            self._succeed(key, future, value)
+            return value
+        finally:
+            # Cancellation included, waiting callers are never left hanging
+            if not future.done():
+                self._fail(key, future, sys.exc_info()[1] or asyncio.CancelledError())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._results.clear()
+
+    def stats(self) -> Dict[str, float]:
+        requests = self.calls + self.shared
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "shared_rate": self.shared / requests if requests else 0.0,
+        }
+
+
+@lru_cache(maxsize=None)
+def get_single_flight(name: str, capacity: int = 0, ttl: float = math.inf) -> SingleFlight:
+    """
+    The process-wide single flight of a kind of call, `name` is also its metrics label
+    """
+    return SingleFlight(name, capacity, ttl)
+
+
+class QueryBatcher(Embeddings):
+    """
+    Embeds the queries asked within `tick` seconds of each other with one
+    `embed_documents` call of the wrapped embeddings, identical queries of a
+    tick are embedded once. The first query of a tick waits for the others,
+    documents go straight through. Assumes a symmetric model, for which a
+    query embeds like a document, as the OpenAI ones do.
+
+    Args:
+        embeddings: The embeddings doing the actual work
+        tick: Seconds queries are collected, 0 embeds every query on its own
+        max_batch: Distinct queries that end a tick early
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        tick: float = EMBEDDING_BATCH_TICK_S,
+        max_batch: int = EMBEDDING_BATCH_SIZE,
+    ):
+        self.embeddings = embeddings
+        self.tick = tick
+        self.max_batch = max_batch
+        self._pending: Dict[str, Future] = {}
+        # Batches being embedded for async callers, referenced until they are done
+        self._flushes: Set[asyncio.Future] = set()
+        self._full = threading.Event()
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.queries = 0
+
+    def __getattr__(self, name: str) -> Any:
+        # Attributes of the wrapped embeddings (model, cache) stay reachable
+        if name == "embeddings":
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def _enqueue(self, text: str) -> Tuple[Future, bool]:
+        """
+        The future of the query and whether the caller opened the tick
+        """
+        with self._lock:
+            self.queries += 1
+            leader = not self._pending
+            future = self._pending.get(text)
+            if future is None:
+                future = self._pending[text] = Future()
+                # Callers of the same query share the future, see SingleFlight._join
+                future.set_running_or_notify_cancel()
+                if len(self._pending) >= self.max_batch:
+                    self._full.set()
+        return future, leader
+
+    def _take(self) -> Dict[str, Future]:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            self._full = threading.Event()
+            self.calls += 1
+        return batch
+
+    @staticmethod
+    def _resolve(batch: Dict[str, Future], vectors: Any) -> None:
+        if isinstance(vectors, BaseException):
+            for future in batch.values():
+                future.set_exception(vectors)
+        else:
+            for future, vector in zip(batch.values(), vectors):
+                future.set_result(vector)
+
+    def embed_query(self, text: str) -> List[float]:
+        if self.tick <= 0:
+            return self.embeddings.embed_query(text)
+        future, leader = self._enqueue(text)
+        if leader:
+            try:
+                self._full.wait(self.tick)
+            finally:
+                batch = self._take()
+                try:
+                    vectors = self.embeddings.embed_documents(list(batch))
+                except BaseException as error:
+                    vectors = error
+                self._resolve(batch, vectors)
+        return future.result()
+
+    async def _aflush(self, batch: Dict[str, Future]) -> None:
+        try:
+            vectors = await self.embeddings.aembed_documents(list(batch))
+        except BaseException as error:
+            vectors = error
+        self._resolve(batch, vectors)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        if self.tick <= 0:
+            return await self.embeddings.aembed_query(text)
+        future, leader = self._enqueue(text)
+        if leader:
+            try:
+                # A full batch does not cut the tick short here, the event would block the loop
+                await asyncio.sleep(self.tick)
+            finally:
+                # The batch is embedded in a task of its own, a cancelled
+                # leader neither strands the queries of its tick nor stops
+                # their call midway
+                flush = asyncio.ensure_future(self._aflush(self._take()))
+                self._flushes.add(flush)
+                flush.add_done_callback(self._flushes.discard)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, float]:
+        return {"calls": self.calls, "queries": self.queries}
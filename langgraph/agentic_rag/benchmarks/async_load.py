@@ -0,0 +1,158 @@
+"""
+Concurrent questions one process sustains with the sync and the async graph.
+
+The real workflows of graph/graph.py run on the fakes of
+benchmarks/graph_scenarios, whose calls wait out a log-normal latency: the
+sync fakes sleep in their thread, the async ones on the event loop. For every
+`--concurrency` level, `--rounds` times that many distinct questions are
+answered that many at a time, by `invoke` on a pool of as many threads and by
+`ainvoke` on one event loop. Reports the throughput, the p50/p95 latency, and
+the peak thread count and resident memory seen while the level ran.
+
+    python -m benchmarks.async_load [--concurrency 16 64 256 1024] [--rounds 2]
+        [--llm-latency 0.2] [--embedding-latency 0.05] [--retriever-threads 32]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List
+from unittest import mock
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+
+from .batching import QUESTIONS
+from .fakes import FakeChatModel, FakeEmbeddings, FakeTavily, lognormal_latency
+from .graph_scenarios import fake_backends, make_respond, percentiles
+
+
+class ResourceSampler:
+    """
+    Samples the thread count and the resident memory of the process in the
+    background, keeps the peaks
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @staticmethod
+    def rss_mb() -> float:
+        try:
+            with open("/proc/self/statm") as statm:
+                pages = int(statm.read().split()[1])
+        except OSError:
+            return 0.0
+        return pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # The sampler itself is not counted
+            self.peak_threads = max(self.peak_threads, threading.active_count() - 1)
+            self.peak_rss_mb = max(self.peak_rss_mb, self.rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "ResourceSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def run_sync(app: Any, inputs: List[Dict[str, Any]], concurrency: int) -> List[float]:
+    def timed(input: Dict[str, Any]) -> float:
+        start = time.perf_counter()
+        app.invoke(input)
+        return time.perf_counter() - start
+
+    with ContextThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(timed, inputs))
+
+
+async def run_async(app: Any, inputs: List[Dict[str, Any]], concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(input: Dict[str, Any]) -> float:
+        async with semaphore:
+            start = time.perf_counter()
+            await app.ainvoke(input)
+            return time.perf_counter() - start
+
+    return await asyncio.gather(*(timed(i) for i in inputs))
+
+
+def measure(
+    run: Callable[[List[Dict[str, Any]]], List[float]],
+    inputs: List[Dict[str, Any]],
+) -> Dict[str, float]:
+    generation_grader._verdicts.clear()
+    sys.modules["graph.nodes.web_search"].get_web_search_cache.cache_clear()
+    with ResourceSampler() as sampler:
+        start = time.perf_counter()
+        latencies = run(inputs)
+        elapsed = time.perf_counter() - start
+    return {
+        "questions_per_s": len(inputs) / elapsed,
+        **percentiles(latencies),
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": sampler.peak_rss_mb,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[16, 64, 256, 1024])
+    parser.add_argument("--rounds", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--retriever-threads", type=int, default=32)
+    args = parser.parse_args()
+
+    respond, _ = make_respond({"datasource": "vectorstore", "ungrounded": 0})
+    llm = FakeChatModel(
+        respond=respond, latency_sampler=lognormal_latency(args.llm_latency, args.sigma, 1)
+    )
+    embeddings = FakeEmbeddings(lognormal_latency(args.embedding_latency, args.sigma, 2))
+    tavily = FakeTavily(latency_sampler=lognormal_latency(args.search_latency, args.sigma, 3))
+    retriever_pool = ContextThreadPoolExecutor(max_workers=args.retriever_threads)
+
+    with fake_backends(llm, embeddings, tavily), mock.patch.object(
+        sys.modules["graph.nodes.retrieve"], "get_blocking_executor", lambda: retriever_pool
+    ):
+        sync_app = graph_module.workflow.compile()
+        async_app = graph_module.async_workflow.compile()
+        print(
+            f"{'mode':<6} {'conc.':>6} {'q/s':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} "
+            f"{'threads':>8} {'RSS (MB)':>9}"
+        )
+        for level in args.concurrency:
+            # Distinct questions, so nothing is shared between concurrent requests
+            inputs = [
+                {"question": f"{QUESTIONS[i % len(QUESTIONS)]} (#{i})"}
+                for i in range(level * args.rounds)
+            ]
+            results = {
+                "sync": measure(lambda i: run_sync(sync_app, i, level), inputs),
+                "async": measure(
+                    lambda i: asyncio.run(run_async(async_app, i, level)), inputs
+                ),
+            }
+            for mode, result in results.items():
+                print(
+                    f"{mode:<6} {level:>6} {result['questions_per_s']:>8.1f} "
+                    f"{result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f} "
+                    f"{result['peak_threads']:>8} {result['peak_rss_mb']:>9.0f}"
+                )
@@ -0,0 +1,86 @@
+"""
+Per document versus batched relevance grading on a fake LLM: number of calls,
+prompt and completion tokens and wall time as the number of chunks grows.
+
+    python -m benchmarks.batched_grading [--latency 0.3] [--token-budget 4000]
+"""
+
+import argparse
+import time
+
+from langchain_core.documents import Document
+
+from graph.chains.retrieval_grader import (
+    ChunkGrade,
+    GradeDocuments,
+    GradeDocumentsBatch,
+    batch_grade_prompt,
+    grade_prompt,
+)
+from graph.nodes.grade_documents import grade_batched, grade_concurrently
+
+from .fakes import FakeChatModel
+
+CHUNK = (
+    "LLM powered autonomous agents combine planning, memory and tool use. "
+    "Short-term memory is in-context learning while long-term memory relies on "
+    "an external vector store with fast maximum inner product search. "
+) * 4
+
+
+def respond(schema, prompt):
+    if schema is GradeDocumentsBatch:
+        count = prompt.count("<chunk id=")
+        return GradeDocumentsBatch(
+            scores=[ChunkGrade(chunk_id=i, binary_score="yes") for i in range(count)]
+        )
+    return GradeDocuments(binary_score="yes")
+
+
+def run(sizes, latency: float, per_1k: float, concurrency: int, token_budget: int) -> None:
+    llm = FakeChatModel(
+        respond=respond, latency=latency, seconds_per_1k_prompt_tokens=per_1k
+    )
+    per_document = grade_prompt | llm.with_structured_output(GradeDocuments)
+    batched = batch_grade_prompt | llm.with_structured_output(GradeDocumentsBatch)
+
+    print(
+        f"{'chunks':>7} {'mode':<13} {'calls':>6} {'prompt tok':>11} "
+        f"{'completion tok':>15} {'wall (s)':>9}"
+    )
+    for n in sizes:
+        documents = [Document(page_content=f"[{i}] {CHUNK}") for i in range(n)]
+        for mode in ["per_document", "batched"]:
+            llm.reset_usage()
+            start = time.perf_counter()
+            if mode == "batched":
+                grade_batched(
+                    batched, "agent memory", documents, token_budget, concurrency
+                )
+            else:
+                grade_concurrently(
+                    per_document, "agent memory", documents, concurrency
+                )
+            elapsed = time.perf_counter() - start
+            usage = llm.usage()
+            print(
+                f"{n:>7} {mode:<13} {usage['calls']:>6} {usage['prompt_tokens']:>11} "
+                f"{usage['completion_tokens']:>15} {elapsed:>9.3f}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--seconds-per-1k-prompt-tokens", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--token-budget", type=int, default=4000)
+    args = parser.parse_args()
+    run(
+        args.sizes,
+        args.latency,
+        args.seconds_per_1k_prompt_tokens,
+        args.concurrency,
+        args.token_budget,
+    )
@@ -0,0 +1,120 @@
+"""
+Backend calls saved by request de-duplication, shared grades and query
+embedding batching under a synthetic concurrent workload.
+
+`--requests` questions drawn from a pool of `--unique` ones (skewed, a few
+questions are asked a lot) hit the real workflow on the fakes of
+benchmarks/graph_scenarios, `--concurrency` at a time. They are answered
+twice: one `invoke` per request with single flight and batching off, then
+through `ServingGraph.batch` with both on. Reports the LLM, embedding and
+search calls of both runs and the wall time.
+
+    python -m benchmarks.batching [--requests 64] [--unique 12] [--concurrency 16]
+        [--llm-latency 0.05] [--embedding-latency 0.02] [--tick 0.005]
+"""
+
+import argparse
+import sys
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+import numpy as np
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+import batching
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+from batching import QueryBatcher, get_single_flight
+from graph.serving import ServingGraph
+
+from .fakes import FakeChatModel, FakeEmbeddings, FakeTavily, lognormal_latency
+from .graph_scenarios import fake_backends, make_respond
+
+QUESTIONS = [
+    "How do agents use long-term memory?",
+    "What is short-term memory in an agent?",
+    "What is chain of thought prompting?",
+    "How does ReAct interleave reasoning and actions?",
+    "What is task decomposition?",
+    "How does Reflexion help agents learn from mistakes?",
+    "How do agents use external tools?",
+    "What is few-shot prompting?",
+    "How does self-consistency improve reasoning?",
+    "What are jailbreak prompts?",
+    "What is an adversarial attack on a language model?",
+    "What is red teaming of a model?",
+    "What is maximum inner product search?",
+    "What is instruction prompting?",
+    "What is the Greedy Coordinate Gradient attack?",
+    "How do agents plan?",
+]
+
+
+def workload(requests: int, unique: int, seed: int = 0) -> List[Dict[str, Any]]:
+    pool = QUESTIONS[:unique]
+    # Zipf-like popularity, the first questions of the pool are asked the most
+    weights = 1 / np.arange(1, len(pool) + 1)
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(len(pool), size=requests, p=weights / weights.sum())
+    return [{"question": pool[i]} for i in picks]
+
+
+def run(serving: bool, inputs: List[Dict[str, Any]], args: argparse.Namespace) -> Dict:
+    respond, _ = make_respond({"datasource": "vectorstore", "ungrounded": 0})
+    llm = FakeChatModel(
+        respond=respond, latency_sampler=lognormal_latency(args.llm_latency, 0.3, seed=1)
+    )
+    fake_embeddings = FakeEmbeddings(lognormal_latency(args.embedding_latency, 0.3, 2))
+    embeddings = QueryBatcher(fake_embeddings, tick=args.tick) if serving else fake_embeddings
+    tavily = FakeTavily(latency_sampler=lognormal_latency(0.1, 0.3, 3))
+
+    get_single_flight.cache_clear()
+    generation_grader._verdicts.clear()
+    sys.modules["graph.nodes.web_search"].get_web_search_cache.cache_clear()
+    with fake_backends(llm, embeddings, tavily), mock.patch.object(
+        batching, "SINGLE_FLIGHT_ENABLED", serving
+    ):
+        app = graph_module.workflow.compile()
+        # Indexing the corpus is not part of the workload
+        fake_embeddings.calls = fake_embeddings.texts = 0
+        start = time.perf_counter()
+        if serving:
+            ServingGraph(app, max_concurrency=args.concurrency).batch(inputs)
+        else:
+            with ContextThreadPoolExecutor(max_workers=args.concurrency) as executor:
+                list(executor.map(app.invoke, inputs))
+        elapsed = time.perf_counter() - start
+
+    return {
+        "llm_calls": llm.usage()["calls"],
+        "embedding_calls": fake_embeddings.calls,
+        "embedded_texts": fake_embeddings.texts,
+        "search_calls": tavily.calls,
+        "wall_s": elapsed,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--unique", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--tick", type=float, default=0.005)
+    args = parser.parse_args()
+
+    inputs = workload(args.requests, min(args.unique, len(QUESTIONS)))
+    distinct = len({i["question"] for i in inputs})
+    print(
+        f"{args.requests} requests, {distinct} distinct questions, "
+        f"{args.concurrency} at a time"
+    )
+    baseline = run(False, inputs, args)
+    served = run(True, inputs, args)
+    print(f"{'':<16} {'baseline':>12} {'served':>8} {'saved':>8}")
+    for metric in baseline:
+        before, after = baseline[metric], served[metric]
+        saved = 1 - after / before if before else 0.0
+        print(f"{metric:<16} {before:>12.2f} {after:>8.2f} {saved:>8.1%}")
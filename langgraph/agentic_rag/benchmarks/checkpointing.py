@@ -0,0 +1,134 @@
+"""
+Checkpoint write overhead of the agentic RAG graph, per step and per run.
+
+The real workflow runs on the zero-latency fakes of benchmarks/graph_scenarios
+three ways: without checkpoints, with the SQLite checkpointer and its default
+serializer, and with the document reference serializer of
+graph/checkpointing.py (the states only hold document references since
+graph/documents.py, benchmarks/state_size compares both layouts). The corpus chunks are padded to `--chunk-chars` so
+the snapshots carry realistic page text. Reports end-to-end p50 per run, the
+time of every checkpoint write (`put` and `put_writes`) and the bytes written.
+
+    python -m benchmarks.checkpointing [--runs 50] [--chunk-chars 1000] [--scenario retry]
+"""
+
+import argparse
+import functools
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+from graph.checkpointing import DocumentRefSerializer, SqliteDocumentStore
+
+from .fakes import FakeChatModel, FakeEmbeddings, FakeTavily
+from .graph_scenarios import CORPUS, SCENARIOS, fake_backends, make_respond
+
+
+class WriteTimer:
+    """
+    Times the checkpoint writes of a saver and counts the serialized bytes
+    """
+
+    def __init__(self, saver: Any):
+        self.durations: List[float] = []
+        self.bytes = 0
+        saver.put = self._timed(saver.put)
+        saver.put_writes = self._timed(saver.put_writes)
+        dumps_typed = saver.serde.dumps_typed
+
+        def counting(obj: Any) -> Any:
+            type_, data = dumps_typed(obj)
+            self.bytes += len(data)
+            return type_, data
+
+        saver.serde.dumps_typed = counting
+
+    def _timed(self, method: Callable) -> Callable:
+        @functools.wraps(method)
+        def timed(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.durations.append(time.perf_counter() - start)
+
+        return timed
+
+
+def make_saver(variant: str, path: str) -> Optional[Any]:
+    if variant == "none":
+        return None
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    conn = sqlite3.connect(path, check_same_thread=False)
+    if variant == "sqlite":
+        return SqliteSaver(conn)
+    return SqliteSaver(conn, serde=DocumentRefSerializer(SqliteDocumentStore(path)))
+
+
+def run(variant: str, args: argparse.Namespace, corpus: List[str]) -> Dict[str, float]:
+    scenario = SCENARIOS[args.scenario]
+    respond, reset = make_respond(scenario)
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "checkpoints.sqlite")
+        saver = make_saver(variant, path)
+        timer = WriteTimer(saver) if saver else None
+        llm = FakeChatModel(respond=respond, latency=0.0)
+        with fake_backends(llm, FakeEmbeddings(), FakeTavily(), corpus):
+            app = graph_module.workflow.compile(checkpointer=saver)
+            web_search_cache = sys.modules["graph.nodes.web_search"].get_web_search_cache
+            end_to_end = []
+            for i in range(args.runs):
+                reset()
+                generation_grader._verdicts.clear()
+                web_search_cache.cache_clear()
+                question = scenario["questions"][i % len(scenario["questions"])]
+                config = {"configurable": {"thread_id": f"run-{i}"}}
+                start = time.perf_counter()
+                app.invoke({"question": question}, config)
+                end_to_end.append(time.perf_counter() - start)
+        result = {"p50_ms": 1000 * statistics.median(end_to_end)}
+        if timer:
+            durations = sorted(timer.durations)
+            result.update(
+                writes=len(durations) / args.runs,
+                write_p50_ms=1000 * statistics.median(durations),
+                write_p95_ms=1000 * durations[int(0.95 * (len(durations) - 1))],
+                write_ms_per_run=1000 * sum(durations) / args.runs,
+                kb_per_run=timer.bytes / 1024 / args.runs,
+                db_kb=os.path.getsize(path) / 1024,
+            )
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="retry")
+    args = parser.parse_args()
+
+    # Every chunk repeats its sentence up to the size of a real chunk
+    corpus = [(text + " ") * max(1, args.chunk_chars // (len(text) + 1)) for text in CORPUS]
+    print(f"{args.runs} runs of the {args.scenario} scenario, {args.chunk_chars} char chunks")
+    print(
+        f"{'variant':<12} {'p50 (ms)':>9} {'writes':>7} {'write p50':>10} "
+        f"{'write p95':>10} {'ms/run':>7} {'KB/run':>8} {'DB (KB)':>8}"
+    )
+    for variant in ("none", "sqlite", "doc-refs"):
+        result = run(variant, args, corpus)
+        if variant == "none":
+            print(f"{variant:<12} {result['p50_ms']:>9.2f}")
+            continue
+        print(
+            f"{variant:<12} {result['p50_ms']:>9.2f} {result['writes']:>7.1f} "
+            f"{result['write_p50_ms']:>10.3f} {result['write_p95_ms']:>10.3f} "
+            f"{result['write_ms_per_run']:>7.2f} {result['kb_per_run']:>8.1f} "
+            f"{result['db_kb']:>8.0f}"
+        )
@@ -0,0 +1,257 @@
+"""
+Local stand-ins for the LLM backed chains, the embeddings and Tavily, used by
+the benchmarks so they run offline and with a controlled latency. The async
+calls wait on the event loop instead of sleeping in the calling thread.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.runnables import Runnable, RunnableLambda
+from pydantic import BaseModel, PrivateAttr
+
+from graph.embeddings import HashingEmbeddings
+from graph.tokens import count_tokens
+
+
+def lognormal_latency(
+    median: float, sigma: float = 0.0, seed: int = 0
+) -> Callable[[], float]:
+    """
+    Latency sampler with a long right tail, like the one of network calls
+
+    Args:
+        median: Median seconds of a call
+        sigma: Spread of the underlying normal, 0 makes every call take `median`
+        seed: Seed of the generator
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+
+    def sample() -> float:
+        with lock:
+            return median * rng.lognormvariate(0.0, sigma) if sigma else median
+
+    return sample
+
+
+def fake_grader(
+    latency: float = 0.05,
+    jitter: float = 0.0,
+    is_relevant: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    seed: int = 0,
+) -> RunnableLambda:
+    """
+    Builds a runnable with the same interface as `retrieval_grader`.
+
+    Args:
+        latency: Seconds every call takes, simulating the LLM round trip
+        jitter: Extra uniformly distributed seconds added to every call
+        is_relevant: Decides the grade from the chain input, everything is relevant by default
+        seed: Seed of the jitter generator
+    """
+    rng = random.Random(seed)
+
+    def grade(inputs: Dict[str, Any]) -> SimpleNamespace:
+        time.sleep(latency + rng.uniform(0, jitter))
+        relevant = is_relevant(inputs) if is_relevant else True
+        return SimpleNamespace(binary_score="yes" if relevant else "no")
+
+    return RunnableLambda(grade)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering from a Python callback, with a latency made of a
+    fixed round trip plus a per prompt token cost. Counts calls and tokens.
+
+    `respond(schema, prompt)` gets the structured output schema (None for
+    plain text calls) and the rendered prompt, and returns an instance of the
+    schema or the text of the answer.
+    """
+
+    respond: Callable[[Optional[Type[BaseModel]], str], Any]
+    latency: float = 0.05
+    # Overrides `latency` with a draw per call, see `lognormal_latency`
+    latency_sampler: Optional[Callable[[], float]] = None
+    seconds_per_1k_prompt_tokens: float = 0.0
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _prompt_tokens: int = PrivateAttr(default=0)
+    _completion_tokens: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def usage(self) -> Dict[str, int]:
+        return {
+            "calls": self._calls,
+            "prompt_tokens": self._prompt_tokens,
+            "completion_tokens": self._completion_tokens,
+        }
+
+    def reset_usage(self) -> None:
+        with self._lock:
+            self._calls = self._prompt_tokens = self._completion_tokens = 0
+
+    def _call(self, schema: Optional[Type[BaseModel]], prompt: str) -> Any:
+        answer, _, _ = self._call_with_usage(schema, prompt)
+        return answer
+
+    def _delay(self, prompt_tokens: int) -> float:
+        latency = self.latency_sampler() if self.latency_sampler else self.latency
+        return latency + self.seconds_per_1k_prompt_tokens * prompt_tokens / 1000
+
+    def _call_with_usage(
+        self, schema: Optional[Type[BaseModel]], prompt: str
+    ) -> Tuple[Any, int, int]:
+        prompt_tokens = count_tokens(prompt)
+        time.sleep(self._delay(prompt_tokens))
+        return self._answer(schema, prompt, prompt_tokens)
+
+    async def _acall_with_usage(
+        self, schema: Optional[Type[BaseModel]], prompt: str
+    ) -> Tuple[Any, int, int]:
+        prompt_tokens = count_tokens(prompt)
+        await asyncio.sleep(self._delay(prompt_tokens))
+        return self._answer(schema, prompt, prompt_tokens)
+
+    def _answer(
+        self, schema: Optional[Type[BaseModel]], prompt: str, prompt_tokens: int
+    ) -> Tuple[Any, int, int]:
+        answer = self.respond(schema, prompt)
+        completion_tokens = count_tokens(
+            answer.model_dump_json() if schema else str(answer)
+        )
+        with self._lock:
+            self._calls += 1
+            self._prompt_tokens += prompt_tokens
+            self._completion_tokens += completion_tokens
+        return answer, prompt_tokens, completion_tokens
+
+    @staticmethod
+    def _render(messages: List[BaseMessage]) -> str:
+        return "\n".join(f"{m.type}: {m.content}" for m in messages)
+
+    def _generate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs
+    ) -> ChatResult:
+        return self._result(*self._call_with_usage(None, self._render(messages)))
+
+    async def _agenerate(
+        self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs
+    ) -> ChatResult:
+        return self._result(*await self._acall_with_usage(None, self._render(messages)))
+
+    def _result(self, text: str, prompt_tokens: int, completion_tokens: int) -> ChatResult:
+        # Reported like the OpenAI client does, so the request budgets count it
+        message = AIMessage(
+            content=text,
+            usage_metadata={
+                "input_tokens": prompt_tokens,
+                "output_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            response_metadata={"model_name": self._llm_type},
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def with_structured_output(self, schema: Type[BaseModel], **kwargs) -> Runnable:
+        def structured(prompt: Any) -> Any:
+            messages = prompt.to_messages() if hasattr(prompt, "to_messages") else prompt
+            return self._call(schema, self._render(messages))
+
+        async def astructured(prompt: Any) -> Any:
+            messages = prompt.to_messages() if hasattr(prompt, "to_messages") else prompt
+            answer, _, _ = await self._acall_with_usage(schema, self._render(messages))
+            return answer
+
+        return RunnableLambda(structured, afunc=astructured)
+
+
+class FakeEmbeddings(Embeddings):
+    """
+    Local hashing embeddings that take as long as a round trip to an embedding
+    API, one call per `embed_documents` batch. Counts calls and texts.
+    """
+
+    def __init__(self, latency_sampler: Callable[[], float] = lambda: 0.0):
+        self.embeddings = HashingEmbeddings()
+        self.model = self.embeddings.model
+        self.latency_sampler = latency_sampler
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.texts = 0
+
+    def _record(self, texts: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.texts += texts
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.latency_sampler())
+        self._record(len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_sampler())
+        self._record(1)
+        return self.embeddings.embed_query(text)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await asyncio.sleep(self.latency_sampler())
+        self._record(len(texts))
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency_sampler())
+        self._record(1)
+        return self.embeddings.embed_query(text)
+
+
+class FakeTavily:
+    """
+    Stands in for `TavilySearch`, answers every query with `max_results`
+    canned results in the Tavily response layout
+    """
+
+    def __init__(
+        self, max_results: int = 3, latency_sampler: Callable[[], float] = lambda: 0.0
+    ):
+        self.max_results = max_results
+        self.latency_sampler = latency_sampler
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def invoke(self, query: str) -> Dict[str, Any]:
+        time.sleep(self.latency_sampler())
+        return self._results(query)
+
+    async def ainvoke(self, query: str) -> Dict[str, Any]:
+        await asyncio.sleep(self.latency_sampler())
+        return self._results(query)
+
+    def _results(self, query: str) -> Dict[str, Any]:
+        with self._lock:
+            self.calls += 1
+        return {
+            "query": query,
+            "results": [
+                {
+                    "url": f"https://example.com/{i}",
+                    "title": f"Result {i}",
+                    "content": f"Web result {i} about {query}",
+                    "score": 1 - i / 10,
+                }
+                for i in range(self.max_results)
+            ],
+        }
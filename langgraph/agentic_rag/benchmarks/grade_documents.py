@@ -0,0 +1,50 @@
+"""
+Latency of the grade_documents node against a fake grader as the number of
+retrieved chunks grows.
+
+    python -m benchmarks.grade_documents --latency 0.05
+"""
+
+import argparse
+import time
+
+from langchain_core.documents import Document
+
+from graph.nodes.grade_documents import grade_concurrently
+
+from .fakes import fake_grader
+
+
+def run(sizes, latency: float, concurrency: int, min_relevant: int) -> None:
+    grader = fake_grader(latency=latency)
+    print(f"{'chunks':>8} {'sequential (s)':>16} {'concurrent (s)':>16} {'speedup':>9}")
+    for n in sizes:
+        documents = [Document(page_content=f"chunk {i}") for i in range(n)]
+
+        start = time.perf_counter()
+        grade_concurrently(grader, "question", documents, max_concurrency=1)
+        sequential = time.perf_counter() - start
+
+        start = time.perf_counter()
+        grade_concurrently(
+            grader,
+            "question",
+            documents,
+            max_concurrency=concurrency,
+            min_relevant=min_relevant,
+        )
+        concurrent = time.perf_counter() - start
+
+        print(
+            f"{n:>8} {sequential:>16.3f} {concurrent:>16.3f} {sequential / concurrent:>8.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--min-relevant", type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.latency, args.concurrency, args.min_relevant)
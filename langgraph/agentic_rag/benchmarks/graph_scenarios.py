@@ -0,0 +1,319 @@
+"""
+End-to-end benchmark of the compiled agentic RAG workflow on fake backends.
+
+The real `workflow` of graph/graph.py runs with a fake chat model, fake
+embeddings and a fake Tavily whose latencies follow log-normal distributions,
+and whose routing and grading outcomes follow the scenario:
+
+    rag    routed to the vector store, every chunk relevant, answered at once
+    web    routed to web search, answered at once
+    retry  routed to the vector store, the first generation is not grounded
+
+Reports end-to-end and per node (and router) p50/p95/p99 in milliseconds,
+plus LLM calls and tokens per request. A router runs inside the node it
+leaves, `init` includes `route_question` for instance.
+
+`--output` saves the results as JSON and `--baseline` compares them with an
+earlier run, exiting with 1 when an end-to-end percentile regressed by more
+than `--max-regression`. Only the tiktoken vocabulary has to be available
+locally.
+
+    python -m benchmarks.graph_scenarios [--runs 50] [--llm-latency 0.05] [--sigma 0.3]
+        [--output results.json] [--baseline baseline.json] [--max-regression 0.2]
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from unittest import mock
+from uuid import UUID
+
+import numpy as np
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_core.vectorstores import InMemoryVectorStore
+
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+from graph.chains.answer_grader import GradeAnswer
+from graph.chains.hallucination_grader import GradeHallucinations
+from graph.chains.llm import use_llm
+from graph.chains.retrieval_grader import (
+    ChunkGrade,
+    GradeDocuments,
+    GradeDocumentsBatch,
+)
+from graph.chains.router import RouterQuery
+from hybrid_retrieval import BM25Index, HybridRetriever
+
+from .fakes import FakeChatModel, FakeEmbeddings, FakeTavily, lognormal_latency
+
+CORPUS = [
+    "LLM powered autonomous agents combine planning, memory and tool use.",
+    "Short-term memory is in-context learning within the prompt window.",
+    "Long-term memory keeps information in an external vector store.",
+    "Maximum inner product search retrieves the closest memories quickly.",
+    "Task decomposition breaks a hard task into smaller, simpler steps.",
+    "Reflexion lets agents learn from mistakes through self reflection.",
+    "ReAct interleaves reasoning traces with actions in an environment.",
+    "Tool use lets agents call external APIs such as calculators or search.",
+    "Chain of thought prompting asks the model to reason step by step.",
+    "Few-shot prompting shows examples of the task in the prompt.",
+    "Self-consistency samples several reasoning paths and takes a vote.",
+    "Instruction prompting describes the task directly to the model.",
+    "Adversarial attacks craft inputs that make a model misbehave.",
+    "Jailbreak prompts try to bypass the safety training of a model.",
+    "Greedy Coordinate Gradient searches adversarial suffix tokens.",
+    "Red teaming probes a model for harmful outputs before release.",
+]
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "rag": {
+        "datasource": "vectorstore",
+        "ungrounded": 0,
+        "questions": [
+            "How do agents use long-term memory?",
+            "What is chain of thought prompting?",
+            "How does ReAct interleave reasoning and actions?",
+        ],
+    },
+    "web": {
+        "datasource": "websearch",
+        "ungrounded": 0,
+        "questions": [
+            "Who won the last football world cup?",
+            "What is the weather in Paris today?",
+        ],
+    },
+    "retry": {
+        "datasource": "vectorstore",
+        "ungrounded": 1,
+        "questions": [
+            "What are jailbreak prompts?",
+            "How does self-consistency improve reasoning?",
+        ],
+    },
+}
+
+ROUTERS = {
+    graph_module.route_question.__name__,
+    graph_module.decide_to_generate.__name__,
+    graph_module.grade_generation_grounded_in_documents_and_question.__name__,
+}
+_DRAFT = re.compile(r"Draft (\d+):")
+
+
+class NodeTimer(BaseCallbackHandler):
+    """
+    Records the wall time of every node and router run of the graph
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, List[float]] = defaultdict(list)
+        self._started: Dict[UUID, tuple] = {}
+
+    def on_chain_start(
+        self,
+        serialized: Optional[Dict[str, Any]],
+        inputs: Any,
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        name = kwargs.get("name")
+        if name in ROUTERS or name == (metadata or {}).get("langgraph_node"):
+            self._started[run_id] = (name, time.perf_counter())
+
+    def on_chain_end(self, outputs: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started:
+            self.durations[started[0]].append(time.perf_counter() - started[1])
+
+    on_chain_error = on_chain_end
+
+
+def make_respond(scenario: Dict[str, Any]):
+    """
+    Answers of the fake chat model, following the outcomes of the scenario
+    """
+    drafts = {"count": 0}
+
+    def respond(schema, prompt: str) -> Any:
+        if schema is RouterQuery:
+            return RouterQuery(datasource=scenario["datasource"])
+        if schema is GradeDocuments:
+            return GradeDocuments(binary_score="yes")
+        if schema is GradeDocumentsBatch:
+            count = prompt.count("<chunk id=")
+            return GradeDocumentsBatch(
+                scores=[ChunkGrade(chunk_id=i, binary_score="yes") for i in range(count)]
+            )
+        if schema is GradeHallucinations:
+            draft = _DRAFT.search(prompt)
+            grounded = draft is None or int(draft.group(1)) > scenario["ungrounded"]
+            return GradeHallucinations(binary_score=grounded)
+        if schema is GradeAnswer:
+            return GradeAnswer(binary_score=True)
+        drafts["count"] += 1
+        return f"Draft {drafts['count']}: a concise answer grounded in the context."
+
+    def reset() -> None:
+        drafts["count"] = 0
+
+    return respond, reset
+
+
+@contextmanager
+def fake_backends(
+    llm: FakeChatModel,
+    embeddings: FakeEmbeddings,
+    tavily: FakeTavily,
+    corpus: List[str] = CORPUS,
+) -> Iterator[None]:
+    """
+    Points every external call of the graph at the fakes, retrieval searches `corpus`
+    """
+    store = InMemoryVectorStore(embeddings)
+    ids = [str(i) for i in range(len(corpus))]
+    documents = [Document(id=i, page_content=text) for i, text in zip(ids, corpus)]
+    store.add_documents(documents, ids=ids)
+    index = BM25Index()
+    index.add(ids, documents)
+    retriever = HybridRetriever(vectorstore=store, index=index, k=8)
+    nodes = {name: sys.modules[f"graph.nodes.{name}"] for name in ("retrieve", "rerank")}
+    web_search = sys.modules["graph.nodes.web_search"]
+
+    with ExitStack() as stack:
+        stack.enter_context(use_llm(llm))
+        for target, attribute, value in [
+            (nodes["retrieve"], "get_retriever", lambda: retriever),
+            (nodes["rerank"], "get_embeddings", lambda: embeddings),
+            (web_search, "get_web_search_tool", lambda: tavily),
+            # Every question goes through the (fake) LLM router, nothing is logged
+            (graph_module, "get_local_router", lambda: mock.Mock(route=lambda q: None)),
+            (graph_module, "log_decision", lambda question, datasource: None),
+        ]:
+            stack.enter_context(mock.patch.object(target, attribute, value))
+        yield
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return {"p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "count": len(values)}
+
+
+def run_scenario(name: str, runs: int, args: argparse.Namespace) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    respond, reset = make_respond(scenario)
+    llm = FakeChatModel(
+        respond=respond,
+        latency_sampler=lognormal_latency(args.llm_latency, args.sigma, seed=1),
+        seconds_per_1k_prompt_tokens=args.per_1k_tokens,
+    )
+    embeddings = FakeEmbeddings(lognormal_latency(args.embedding_latency, args.sigma, 2))
+    tavily = FakeTavily(latency_sampler=lognormal_latency(args.search_latency, args.sigma, 3))
+
+    with fake_backends(llm, embeddings, tavily):
+        app = graph_module.workflow.compile()
+        timer = NodeTimer()
+        end_to_end: List[float] = []
+        for i in range(args.warmup + runs):
+            if i == args.warmup:
+                # Corpus embedding and warm up calls are not part of the results
+                timer.durations.clear()
+                llm.reset_usage()
+                embeddings.calls = tavily.calls = 0
+            # Every request starts cold, nothing is reused from the previous one
+            reset()
+            generation_grader._verdicts.clear()
+            web_search_cache = sys.modules["graph.nodes.web_search"].get_web_search_cache
+            web_search_cache.cache_clear()
+            question = scenario["questions"][i % len(scenario["questions"])]
+            start = time.perf_counter()
+            app.invoke({"question": question}, {"callbacks": [timer]})
+            end_to_end.append(time.perf_counter() - start)
+
+    usage = llm.usage()
+    return {
+        "end_to_end": percentiles(end_to_end[args.warmup :]),
+        "nodes": {n: percentiles(d) for n, d in sorted(timer.durations.items())},
+        "llm_calls": usage["calls"] / runs,
+        "prompt_tokens": usage["prompt_tokens"] / runs,
+        "completion_tokens": usage["completion_tokens"] / runs,
+        "embedding_calls": embeddings.calls / runs,
+        "search_calls": tavily.calls / runs,
+    }
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> bool:
+    """
+    Prints the change of every end-to-end percentile and of the LLM usage
+
+    Returns:
+        Whether every end-to-end percentile is within `max_regression` of the baseline
+    """
+    ok = True
+    print(f"\n{'scenario':<8} {'metric':<18} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        rows = [(k, before["end_to_end"][k], result["end_to_end"][k], True)
+                for k in ("p50_ms", "p95_ms", "p99_ms")]  # fmt: skip
+        rows += [(k, before[k], result[k], False)
+                 for k in ("llm_calls", "prompt_tokens", "completion_tokens")]  # fmt: skip
+        for metric, old, new, gated in rows:
+            change = (new - old) / old if old else 0.0
+            flag = ""
+            if gated and change > max_regression:
+                ok, flag = False, "  REGRESSION"
+            print(f"{name:<8} {metric:<18} {old:>10.2f} {new:>10.2f} {change:>+8.1%}{flag}")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    parser.add_argument("--per-1k-tokens", type=float, default=0.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.01)
+    parser.add_argument("--search-latency", type=float, default=0.1)
+    parser.add_argument("--sigma", type=float, default=0.3)
+    parser.add_argument("--output")
+    parser.add_argument("--baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "scenarios": {}}
+    for name in args.scenarios:
+        result = results["scenarios"][name] = run_scenario(name, args.runs, args)
+        e2e = result["end_to_end"]
+        print(
+            f"\n{name}: end to end p50 {e2e['p50_ms']:.1f} ms, p95 {e2e['p95_ms']:.1f} ms, "
+            f"p99 {e2e['p99_ms']:.1f} ms | {result['llm_calls']:.1f} LLM calls, "
+            f"{result['prompt_tokens']:.0f} prompt + {result['completion_tokens']:.0f} "
+            f"completion tokens, {result['search_calls']:.1f} searches per request"
+        )
+        print(f"  {'node':<52} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'runs':>6}")
+        for node, stats in result["nodes"].items():
+            print(
+                f"  {node:<52} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                f"{stats['p99_ms']:>9.2f} {stats['count']:>6}"
+            )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(results, baseline, args.max_regression):
+            sys.exit(1)
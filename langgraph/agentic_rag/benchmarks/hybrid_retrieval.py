@@ -0,0 +1,85 @@
+"""
+Query latency and recall@k of the vector, BM25 and hybrid retrievers on a
+recorded question set.
+
+Every line of the question set holds a question and a phrase that a relevant
+chunk of the ingested posts contains (matched case sensitively). Recall@k is
+the share of questions with such a chunk among the top k results. Runs against
+the persisted Chroma collection, run `python ingestion.py` first; query
+embeddings go through the embedding cache so repeated runs are offline.
+
+    python -m benchmarks.hybrid_retrieval [--k 4] [--fetch-k 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from langchain_core.documents import Document
+
+from hybrid_retrieval import HybridRetriever
+from ingestion import get_bm25_index, get_vectorstore
+
+QUESTIONS_PATH = os.path.join(
+    os.path.dirname(__file__), "data", "retrieval_questions.jsonl"
+)
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(
+    retrieve: Callable[[str], List[Document]], rows: List[Dict[str, str]]
+) -> Dict[str, float]:
+    latencies, hits = [], 0
+    for row in rows:
+        start = time.perf_counter()
+        documents = retrieve(row["question"])
+        latencies.append(time.perf_counter() - start)
+        hits += any(row["expected"] in d.page_content for d in documents)
+    latencies.sort()
+    return {
+        "recall": hits / len(rows),
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--fetch-k", type=int, default=20)
+    args = parser.parse_args()
+
+    rows = load_questions()
+    vectorstore = get_vectorstore()
+    start = time.perf_counter()
+    index = get_bm25_index()
+    print(
+        f"{len(rows)} recorded questions, BM25 index of {len(index)} chunks "
+        f"built in {time.perf_counter() - start:.3f}s"
+    )
+    hybrid = HybridRetriever(
+        vectorstore=vectorstore, index=index, k=args.k, fetch_k=args.fetch_k
+    )
+    retrievers = {
+        "vector": lambda q: vectorstore.similarity_search(q, k=args.k),
+        "bm25": lambda q: [index.get(i) for i, _ in index.search(q, k=args.k)],
+        "hybrid": hybrid.invoke,
+    }
+    # Embeds every question once so the timings do not include cold cache misses
+    for row in rows:
+        vectorstore.similarity_search(row["question"], k=1)
+
+    print(f"{'retriever':<10} {f'recall@{args.k}':>10} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    for name, retrieve in retrievers.items():
+        result = evaluate(retrieve, rows)
+        print(
+            f"{name:<10} {result['recall']:>10.1%} "
+            f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+        )
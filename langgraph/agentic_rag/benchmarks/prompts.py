@@ -0,0 +1,85 @@
+"""
+Startup cost of getting the hub prompts, pulling them from the hub against
+the local copies of prompt_registry, each source measured in a fresh
+interpreter: import time and time to have every prompt of HUB_PROMPTS in
+hand. The prompt classes are imported before the clock starts, every
+caller imports them anyway. The local copies are also timed once warm, the
+cost of every later `load_prompt` in the same process. A hub that cannot be
+reached is reported with its error (and the time it took to fail), the
+startup a process without the local copies gets when the hub is down.
+
+    python -m benchmarks.prompts [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import timeit
+
+from prompt_registry import HUB_PROMPTS, load_prompt
+
+AGENTIC_RAG_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SOURCES = {
+    "hub": (
+        "from langsmith import Client; pull = Client().pull_prompt",
+        "lambda name: pull(name, dangerously_pull_public_prompt=True)",
+    ),
+    "load_prompt": ("from prompt_registry import load_prompt", "load_prompt"),
+}
+
+PROBE = """
+import json, sys, time
+from langchain_core.prompts import ChatPromptTemplate
+statement, getter, names = sys.argv[1], sys.argv[2], sys.argv[3:]
+start = time.perf_counter()
+exec(statement)
+imported = time.perf_counter()
+result = {"import_s": imported - start}
+try:
+    for name in names:
+        eval(getter)(name)
+except Exception as error:
+    result["error"] = f"{type(error).__name__}: {error}"[:80]
+result["load_s"] = time.perf_counter() - imported
+print(json.dumps(result))
+"""
+
+
+def measure(source: str) -> dict:
+    statement, getter = SOURCES[source]
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, statement, getter, *HUB_PROMPTS],
+        cwd=AGENTIC_RAG_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode:
+        raise RuntimeError(f"{source} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'source':<12} {'import (s)':>11} {'prompts (s)':>12} {'total (s)':>10}")
+    for source in SOURCES:
+        runs = [measure(source) for _ in range(args.runs)]
+        median = {
+            key: statistics.median(r[key] for r in runs) for key in ("import_s", "load_s")
+        }
+        error = next((r["error"] for r in runs if "error" in r), "")
+        print(
+            f"{source:<12} {median['import_s']:>11.3f} {median['load_s']:>12.3f} "
+            f"{median['import_s'] + median['load_s']:>10.3f}  {error}"
+        )
+
+    for name in HUB_PROMPTS:
+        load_prompt(name)
+    warm = timeit.timeit(lambda: [load_prompt(n) for n in HUB_PROMPTS], number=10000) / 10000
+    print(f"load_prompt warm, every prompt: {warm * 1e6:.2f} µs")
@@ -0,0 +1,78 @@
+"""
+End-to-end benchmark of the real workflow on the responses of a cassette.
+
+With `--record` the questions are answered by the real backends (the API
+keys and an ingested store needed) and every chat, embedding, search and
+retrieval call is written to the cassette. Without it the same questions
+are replayed offline, each response taking as long as it did when recorded
+(none with `--no-latency`, which leaves the time spent in the graph itself).
+The questions are asked one at a time and every run starts cold, so a replay
+makes exactly the requests of the recording.
+
+Reports end-to-end and per node p50/p95/p99 in milliseconds, like
+benchmarks/graph_scenarios but on real prompts and answers.
+
+    python -m benchmarks.replay cassette.json [--record] [--runs 5] [--no-latency]
+"""
+
+import argparse
+import sys
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+from cassettes import RECORD, REPLAY, Cassette, use_cassette
+
+from .batching import QUESTIONS
+from .graph_scenarios import NodeTimer, percentiles
+
+
+def run(cassette: Cassette, questions: List[str], runs: int) -> Dict[str, Any]:
+    # Every question goes through the LLM router, the local one learns from
+    # the logged decisions and would route a replay differently
+    with use_cassette(cassette), mock.patch.object(
+        graph_module, "get_local_router", lambda: mock.Mock(route=lambda q: None)
+    ), mock.patch.object(graph_module, "log_decision", lambda question, datasource: None):
+        app = graph_module.workflow.compile()
+        timer = NodeTimer()
+        end_to_end: List[float] = []
+        for _ in range(runs):
+            for question in questions:
+                generation_grader._verdicts.clear()
+                sys.modules["graph.nodes.web_search"].get_web_search_cache.cache_clear()
+                start = time.perf_counter()
+                app.invoke({"question": question}, {"callbacks": [timer]})
+                end_to_end.append(time.perf_counter() - start)
+    return {
+        "end_to_end": percentiles(end_to_end),
+        "nodes": {n: percentiles(d) for n, d in sorted(timer.durations.items())},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("cassette")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--questions", nargs="+", default=QUESTIONS[:4])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--no-latency", action="store_true")
+    args = parser.parse_args()
+
+    cassette = Cassette(
+        args.cassette, RECORD if args.record else REPLAY, latency=not args.no_latency
+    )
+    result = run(cassette, args.questions, 1 if args.record else args.runs)
+    print(f"{len(cassette.interactions)} distinct calls in {args.cassette}")
+    e2e = result["end_to_end"]
+    print(
+        f"end to end p50 {e2e['p50_ms']:.1f} ms, p95 {e2e['p95_ms']:.1f} ms, "
+        f"p99 {e2e['p99_ms']:.1f} ms over {e2e['count']} questions"
+    )
+    print(f"  {'node':<52} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'runs':>6}")
+    for node, stats in result["nodes"].items():
+        print(
+            f"  {node:<52} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+            f"{stats['p99_ms']:>9.2f} {stats['count']:>6}"
+        )
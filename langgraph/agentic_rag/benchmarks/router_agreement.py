@@ -0,0 +1,137 @@
+"""
+Agreement of the local router with the LLM router on a recorded question set.
+
+Every line of the question set holds a question and the datasource the LLM
+router picked for it. `--record` asks the live LLM router again (needs the
+OpenAI key) and rewrites the labels.
+
+The local router is evaluated twice: trained on the seed examples only, and
+trained on the seeds plus every other recorded decision (leave one out), the
+way it is trained from the decision log in production. Its threshold is
+calibrated at every fit unless `--threshold` fixes it.
+
+`--embeddings openai` classifies on the OpenAI embeddings the router uses in
+production, replayed from benchmarks/data/router_embeddings.json; with
+`--record` the seeds and the questions are embedded again and written there.
+`--embeddings hashing` needs neither. The default is the LOCAL_ROUTER_EMBEDDINGS
+of graph/chains/local_router.py.
+
+    python -m benchmarks.router_agreement [--embeddings openai] [--record]
+        [--threshold 0.05] [--min-agreement 0.97]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from cassettes import RECORD, REPLAY, Cassette, CassetteEmbeddings
+from graph.chains.local_router import (
+    LOCAL_ROUTER_EMBEDDINGS,
+    LOCAL_ROUTER_MIN_AGREEMENT,
+    LOCAL_ROUTER_THRESHOLD,
+    SEED_EXAMPLES,
+    LocalRouter,
+)
+from graph.embeddings import HashingEmbeddings
+
+QUESTIONS_PATH = os.path.join(os.path.dirname(__file__), "data", "router_questions.jsonl")
+EMBEDDINGS_PATH = os.path.join(os.path.dirname(__file__), "data", "router_embeddings.json")
+
+
+def load_questions(path: str = QUESTIONS_PATH) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def record(path: str = QUESTIONS_PATH) -> None:
+    from graph.chains.router import get_question_router
+
+    rows = load_questions(path)
+    for row in rows:
+        row["datasource"] = get_question_router().invoke(
+            {"question": row["question"]}
+        ).datasource
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+def get_embeddings(name: str, record: bool) -> Embeddings:
+    if name == "hashing":
+        return HashingEmbeddings()
+    if not record and not os.path.exists(EMBEDDINGS_PATH):
+        raise SystemExit(f"No {EMBEDDINGS_PATH}, record it with --record (needs the OpenAI key)")
+    from langchain_openai import OpenAIEmbeddings
+
+    cassette = Cassette(EMBEDDINGS_PATH, RECORD if record else REPLAY, latency=False)
+    return CassetteEmbeddings(cassette, OpenAIEmbeddings() if record else None)
+
+
+def evaluate(
+    rows: List[Dict[str, str]],
+    embeddings: Embeddings,
+    threshold: Optional[float],
+    min_agreement: float,
+    leave_one_out: bool,
+) -> Dict:
+    covered = agreed = agreed_overall = 0
+    elapsed = 0.0
+    thresholds = []
+
+    def fit(examples) -> LocalRouter:
+        router = LocalRouter(embeddings, threshold, min_agreement).fit(*zip(*examples))
+        thresholds.append(router.threshold)
+        return router
+
+    router = fit(SEED_EXAMPLES)
+    for i, row in enumerate(rows):
+        if leave_one_out:
+            logged = [(r["question"], r["datasource"]) for j, r in enumerate(rows) if j != i]
+            router = fit(SEED_EXAMPLES + logged)
+        start = time.perf_counter()
+        datasource, confidence = router.predict(row["question"])
+        elapsed += time.perf_counter() - start
+        agreed_overall += datasource == row["datasource"]
+        if confidence >= router.threshold:
+            covered += 1
+            agreed += datasource == row["datasource"]
+    return {
+        "agreement_all": agreed_overall / len(rows),
+        "coverage": covered / len(rows),
+        "agreement_confident": agreed / covered if covered else float("nan"),
+        "threshold": statistics.median(thresholds),
+        "mean_latency_ms": 1000 * elapsed / len(rows),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--embeddings", choices=["openai", "hashing"], default=LOCAL_ROUTER_EMBEDDINGS
+    )
+    parser.add_argument("--threshold", type=float, default=LOCAL_ROUTER_THRESHOLD)
+    parser.add_argument("--min-agreement", type=float, default=LOCAL_ROUTER_MIN_AGREEMENT)
+    parser.add_argument("--record", action="store_true")
+    args = parser.parse_args()
+
+    if args.record:
+        record()
+    rows = load_questions()
+    embeddings = get_embeddings(args.embeddings, args.record)
+    threshold = "calibrated" if args.threshold is None else args.threshold
+    print(f"{len(rows)} recorded questions, {args.embeddings} embeddings, threshold {threshold}")
+    print(
+        f"{'training set':<16} {'agreement':>10} {'coverage':>9} "
+        f"{'agreement when confident':>25} {'threshold':>10} {'latency (ms)':>13}"
+    )
+    for name, leave_one_out in [("seeds", False), ("seeds + log", True)]:
+        result = evaluate(rows, embeddings, args.threshold, args.min_agreement, leave_one_out)
+        print(
+            f"{name:<16} {result['agreement_all']:>10.1%} {result['coverage']:>9.1%} "
+            f"{result['agreement_confident']:>25.1%} {result['threshold']:>10.3f} "
+            f"{result['mean_latency_ms']:>13.3f}"
+        )
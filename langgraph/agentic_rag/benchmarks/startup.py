@@ -0,0 +1,82 @@
+"""
+Cold start cost of every graph entry point, each one measured in a fresh
+interpreter: import time, time to compile the app on first use and, with
+--invoke (needs the API keys), time to the first app.invoke.
+
+    python -m benchmarks.startup [--invoke] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LANGGRAPH_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+AGENTIC_RAG_DIR = os.path.join(LANGGRAPH_DIR, "agentic_rag")
+
+ENTRY_POINTS = {
+    "agentic_rag": (
+        AGENTIC_RAG_DIR,
+        "graph.graph",
+        {"question": "What is agent memory?"},
+    ),
+    "react_agent": (
+        LANGGRAPH_DIR,
+        "main",
+        {"messages": [{"role": "user", "content": "What is 3 tripled?"}]},
+    ),
+    "reflection_agent": (
+        LANGGRAPH_DIR,
+        "reflection_agent",
+        {"messages": [{"role": "user", "content": "Improve this tweet: hello"}]},
+    ),
+}
+
+PROBE = """
+import importlib, json, sys, time
+module, payload, invoke = sys.argv[1], json.loads(sys.argv[2]), sys.argv[3] == "1"
+start = time.perf_counter()
+entry = importlib.import_module(module)
+imported = time.perf_counter()
+app = entry.get_app()
+compiled = time.perf_counter()
+result = {"import_s": imported - start, "compile_s": compiled - imported}
+if invoke:
+    app.invoke(payload)
+    result["first_invoke_s"] = time.perf_counter() - compiled
+print(json.dumps(result))
+"""
+
+
+def measure(name: str, invoke: bool) -> dict:
+    cwd, module, payload = ENTRY_POINTS[name]
+    completed = subprocess.run(
+        [sys.executable, "-c", PROBE, module, json.dumps(payload), "1" if invoke else "0"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode:
+        raise RuntimeError(f"{name} failed:\n{completed.stderr}")
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--invoke", action="store_true")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'entry point':<18} {'import (s)':>11} {'compile (s)':>12} {'1st invoke (s)':>15}")
+    for name in ENTRY_POINTS:
+        runs = [measure(name, args.invoke) for _ in range(args.runs)]
+        median = {
+            key: statistics.median(r[key] for r in runs) for key in runs[0]
+        }
+        first_invoke = median.get("first_invoke_s")
+        print(
+            f"{name:<18} {median['import_s']:>11.3f} {median['compile_s']:>12.3f} "
+            f"{first_invoke if first_invoke is not None else float('nan'):>15.3f}"
+        )
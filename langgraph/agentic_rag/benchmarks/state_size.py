@@ -0,0 +1,102 @@
+"""
+Size of the graph state per step, with document references against full
+documents.
+
+The real workflow runs on the zero-latency fakes of benchmarks/graph_scenarios
+with the corpus chunks padded to `--chunk-chars`. Every step streams the
+update its node wrote and the state after it; both are serialized the way a
+checkpointer writes them (JsonPlusSerializer), once as they are (references)
+and once with the references replaced by their documents, the layout the
+state had before graph/documents.py. Reports the bytes per node update, per
+state and per run, and how many distinct documents back the references.
+The generate node used to write the documents back with every draft, the
+documents column leaves that out and so understates the old layout.
+
+    python -m benchmarks.state_size [--runs 20] [--chunk-chars 1000] [--scenario retry]
+"""
+
+import argparse
+import statistics
+import sys
+from collections import defaultdict
+from typing import Any, Dict, List
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+import graph.chains.generation_grader as generation_grader
+import graph.graph as graph_module
+from graph.documents import get_document_store, load_documents
+
+from .fakes import FakeChatModel, FakeEmbeddings, FakeTavily
+from .graph_scenarios import CORPUS, SCENARIOS, fake_backends, make_respond
+
+SERDE = JsonPlusSerializer()
+
+
+def size(values: Dict[str, Any], expand: bool) -> int:
+    if expand and values.get("documents"):
+        values = {**values, "documents": load_documents(values["documents"])}
+    return len(SERDE.dumps_typed(values)[1])
+
+
+def measure(args: argparse.Namespace, corpus: List[str]) -> Dict[str, Any]:
+    scenario = SCENARIOS[args.scenario]
+    respond, reset = make_respond(scenario)
+    updates: Dict[str, Dict[str, List[int]]] = defaultdict(lambda: defaultdict(list))
+    states: Dict[str, List[int]] = defaultdict(list)
+    references = 0
+    with fake_backends(FakeChatModel(respond=respond), FakeEmbeddings(), FakeTavily(), corpus):
+        app = graph_module.workflow.compile()
+        web_search_cache = sys.modules["graph.nodes.web_search"].get_web_search_cache
+        for i in range(args.runs):
+            reset()
+            generation_grader._verdicts.clear()
+            web_search_cache.cache_clear()
+            question = scenario["questions"][i % len(scenario["questions"])]
+            for mode, chunk in app.stream(
+                {"question": question}, stream_mode=["updates", "values"]
+            ):
+                if mode == "values":
+                    for layout in ("refs", "documents"):
+                        states[layout].append(size(chunk, layout == "documents"))
+                    references += len(chunk.get("documents") or [])
+                    continue
+                for node, update in chunk.items():
+                    for layout in ("refs", "documents"):
+                        updates[node][layout].append(size(update or {}, layout == "documents"))
+    return {"updates": updates, "states": states, "references": references}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--scenario", choices=list(SCENARIOS), default="retry")
+    args = parser.parse_args()
+
+    # Every chunk repeats its sentence up to the size of a real chunk
+    corpus = [(text + " ") * max(1, args.chunk_chars // (len(text) + 1)) for text in CORPUS]
+    result = measure(args, corpus)
+    print(f"{args.runs} runs of the {args.scenario} scenario, {args.chunk_chars} char chunks")
+    print(f"{'bytes per':<22} {'documents':>10} {'refs':>8} {'ratio':>7}")
+    rows = [(f"{node} update", sizes) for node, sizes in sorted(result["updates"].items())]
+    rows.append(("state (each step)", result["states"]))
+    for label, sizes in rows:
+        before, after = statistics.mean(sizes["documents"]), statistics.mean(sizes["refs"])
+        print(f"{label:<22} {before:>10.0f} {after:>8.0f} {before / after:>6.1f}x")
+    per_run = {
+        layout: (
+            sum(sum(s[layout]) for s in result["updates"].values())
+            + sum(result["states"][layout])
+        )
+        / args.runs
+        for layout in ("documents", "refs")
+    }
+    print(
+        f"{'run (updates + states)':<22} {per_run['documents']:>10.0f} "
+        f"{per_run['refs']:>8.0f} {per_run['documents'] / per_run['refs']:>6.1f}x"
+    )
+    print(
+        f"{result['references']} document references in the states, "
+        f"{len(get_document_store())} distinct documents in the store"
+    )
@@ -0,0 +1,181 @@
+"""
+Build time, open time, query latency, RSS and recall@k of the memory-mapped
+IVF index against Chroma and FAISS (HNSW) on synthetic clustered vectors.
+
+Every backend is built in one subprocess and served from another, so the
+open time and the RSS are those of a fresh worker that opens the stored index
+and answers the queries. Recall is measured against exact search. Chroma and
+FAISS are optional, backends whose package is missing are skipped.
+
+    python -m benchmarks.vector_stores [--n 20000] [--dim 1536] [--queries 200] [--k 10]
+"""
+
+import argparse
+import importlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+# Backend name -> module it needs, imported before anything is timed
+BACKENDS = {"mmap": "mmap_index", "chroma": "chromadb", "faiss": "faiss"}
+
+
+def make_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 100), dim)).astype(np.float32)
+    vectors = centers[rng.integers(len(centers), size=n)]
+    vectors += 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def build(backend: str, path: str, vectors: np.ndarray) -> None:
+    ids = [str(i) for i in range(len(vectors))]
+    if backend == "mmap":
+        from mmap_index import write_index
+
+        write_index(path, ids, [""] * len(ids), [{}] * len(ids), vectors)
+    elif backend == "chroma":
+        import chromadb
+
+        client = chromadb.PersistentClient(path=path)
+        collection = client.create_collection("bench", metadata={"hnsw:space": "ip"})
+        batch = client.get_max_batch_size()
+        for start in range(0, len(ids), batch):
+            collection.add(
+                ids=ids[start : start + batch],
+                embeddings=vectors[start : start + batch],
+            )
+    else:
+        import faiss
+
+        index = faiss.IndexHNSWFlat(vectors.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(vectors)
+        faiss.write_index(index, os.path.join(path, "index.faiss"))
+
+
+def open_index(backend: str, path: str, k: int) -> Callable[[np.ndarray], List[int]]:
+    if backend == "mmap":
+        from mmap_index import MmapIndex
+
+        index = MmapIndex(path)
+        return lambda q: [int(index.record(r)["id"]) for r, _ in index.search(q, k)]
+    if backend == "chroma":
+        import chromadb
+
+        collection = chromadb.PersistentClient(path=path).get_collection("bench")
+        return lambda q: [
+            int(i)
+            for i in collection.query(query_embeddings=[q], n_results=k)["ids"][0]
+        ]
+    import faiss
+
+    index = faiss.read_index(os.path.join(path, "index.faiss"))
+    return lambda q: [int(i) for i in index.search(q[None, :], k)[1][0]]
+
+
+def worker(backend: str, phase: str, workdir: str, n: int, dim: int, k: int) -> Dict:
+    path = os.path.join(workdir, backend)
+    os.makedirs(path, exist_ok=True)
+    if phase == "build":
+        vectors = make_vectors(n, dim)
+        start = time.perf_counter()
+        build(backend, path, vectors)
+        return {"build_s": time.perf_counter() - start}
+
+    queries = np.load(os.path.join(workdir, "queries.npy"))
+    truth = np.load(os.path.join(workdir, "truth.npy"))
+    importlib.import_module(BACKENDS[backend])
+    baseline = rss_mb()
+    start = time.perf_counter()
+    search = open_index(backend, path, k)
+    open_s = time.perf_counter() - start
+    latencies, recalled = [], 0
+    for query, exact in zip(queries, truth):
+        start = time.perf_counter()
+        found = search(query)
+        latencies.append(time.perf_counter() - start)
+        recalled += len(set(found) & set(exact.tolist()))
+    latencies.sort()
+    return {
+        "open_ms": 1000 * open_s,
+        "p50_ms": 1000 * statistics.median(latencies),
+        "p95_ms": 1000 * latencies[int(0.95 * (len(latencies) - 1))],
+        "rss_mb": rss_mb() - baseline,
+        "recall": recalled / truth.size,
+    }
+
+
+def run(backend: str, phase: str, workdir: str, args: argparse.Namespace) -> Dict:
+    command = [
+        sys.executable, "-m", "benchmarks.vector_stores",
+        "--worker", backend, phase, workdir,
+        "--n", str(args.n), "--dim", str(args.dim), "--k", str(args.k),
+    ]  # fmt: skip
+    done = subprocess.run(command, capture_output=True, text=True)
+    if done.returncode:
+        raise RuntimeError(done.stderr.strip().splitlines()[-1])
+    return json.loads(done.stdout.strip().splitlines()[-1])
+
+
+def ground_truth(
+    workdir: str, n: int, dim: int, queries: int, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    vectors = make_vectors(n, dim)
+    rng = np.random.default_rng(1)
+    picked = vectors[rng.integers(n, size=queries)]
+    query_vectors = picked + 0.1 * rng.normal(size=picked.shape).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    truth = np.argsort(-(query_vectors @ vectors.T), axis=1)[:, :k]
+    np.save(os.path.join(workdir, "queries.npy"), query_vectors.astype(np.float32))
+    np.save(os.path.join(workdir, "truth.npy"), truth)
+    return query_vectors, truth
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--worker", nargs=3, metavar=("BACKEND", "PHASE", "DIR"))
+    args = parser.parse_args()
+
+    if args.worker:
+        backend, phase, workdir = args.worker
+        print(json.dumps(worker(backend, phase, workdir, args.n, args.dim, args.k)))
+        sys.exit()
+
+    print(f"{args.n} vectors of {args.dim} dimensions, {args.queries} queries")
+    print(
+        f"{'backend':<8} {'build (s)':>10} {'open (ms)':>10} {'p50 (ms)':>9} "
+        f"{'p95 (ms)':>9} {'RSS (MB)':>9} {f'recall@{args.k}':>10}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        ground_truth(workdir, args.n, args.dim, args.queries, args.k)
+        for backend in BACKENDS:
+            try:
+                result = run(backend, "build", workdir, args)
+                result.update(run(backend, "serve", workdir, args))
+            except RuntimeError as error:
+                print(f"{backend:<8} skipped: {error}")
+                continue
+            print(
+                f"{backend:<8} {result['build_s']:>10.2f} {result['open_ms']:>10.2f} "
+                f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f} "
+                f"{result['rss_mb']:>9.1f} {result['recall']:>10.1%}"
+            )
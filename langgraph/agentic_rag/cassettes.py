@@ -0,0 +1,446 @@
+"""
+Record and replay of the chat model, embedding, search and retrieval calls.
+
+A cassette is a JSON file of interactions keyed by the sha256 of their
+normalized request: keys sorted, whitespace runs collapsed, so neither dict
+order nor prompt reflowing changes a key. Concurrent calls replay the same
+whatever order they arrive in, and a request made several times (a retry)
+replays its recorded responses in turn.
+
+    record  every call goes through and is written down, replacing the cassette
+    replay  every call is answered from the cassette, nothing goes over the
+            network and no API key is needed; a call that was not recorded
+            raises `CassetteMiss`
+
+Chat models are recorded at the HTTP layer of the shared OpenAI clients
+(graph/chains/clients.py), under streaming and structured output. The
+embeddings, the Tavily tool and the retriever are wrapped as objects, the
+embeddings one text at a time so the query batching does not change the
+keys. Each response keeps the time it took, `latency` sleeps it again on
+replay, which turns a cassette into a benchmark fixture with real latencies.
+
+`CASSETTE=run.json CASSETTE_MODE=record python main.py` records a run, the
+tests and the benchmarks switch cassettes with `use_cassette`.
+"""
+
+import asyncio
+import hashlib
+import importlib
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from pydantic import ConfigDict
+
+RECORD = "record"
+REPLAY = "replay"
+
+# Cassette every backend call of the process goes through, unset for none
+CASSETTE = os.getenv("CASSETTE")
+# "replay" answers from the cassette, "record" calls the backends and writes it
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", REPLAY)
+# Set to true to sleep the recorded latency of every replayed response
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "false").lower() == "true"
+
+# Response headers worth keeping, the others carry account details or no longer apply
+_KEPT_HEADERS = ("content-type",)
+_SPACES = re.compile(r"\s+")
+
+
+class CassetteMiss(LookupError):
+    """
+    A replayed call that the cassette has no recording of
+    """
+
+
+def normalize(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in sorted(value.items())}
+    if isinstance(value, (list, tuple)):
+        return [normalize(v) for v in value]
+    if isinstance(value, str):
+        return _SPACES.sub(" ", value).strip()
+    return value
+
+
+def request_key(kind: str, request: Any) -> str:
+    canonical = json.dumps(
+        {"kind": kind, "request": normalize(request)}, sort_keys=True, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class Cassette:
+    """
+    Recorded responses by request key, written to `path` after every new one
+
+    Args:
+        path: The JSON file of the interactions
+        mode: RECORD or REPLAY
+        latency: Replayed responses take as long as they did when recorded
+        sleep: Waits out the recorded latency, injectable for tests
+    """
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = REPLAY,
+        latency: bool = False,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode {mode!r}, use {RECORD!r} or {REPLAY!r}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.sleep = sleep
+        self._lock = threading.Lock()
+        # Times each key was replayed, its responses are handed out in turn
+        self._plays: Dict[str, int] = {}
+        self.interactions: Dict[str, Dict[str, Any]] = {}
+        if mode == REPLAY:
+            with open(path, encoding="utf-8") as file:
+                self.interactions = json.load(file)["interactions"]
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == RECORD
+
+    def play(self, kind: str, request: Any) -> Tuple[Any, float]:
+        """
+        The next recorded response of a request and the seconds it took
+
+        Raises:
+            CassetteMiss: The request was never recorded
+        """
+        key = request_key(kind, request)
+        with self._lock:
+            interaction = self.interactions.get(key)
+            if interaction is None:
+                summary = json.dumps(normalize(request))[:200]
+                raise CassetteMiss(
+                    f"No {kind} recording in {self.path} for {summary}, "
+                    f"record it again with CASSETTE_MODE={RECORD}"
+                )
+            played = self._plays.get(key, 0)
+            self._plays[key] = played + 1
+        responses = interaction["responses"]
+        recorded = responses[played % len(responses)]
+        return recorded["response"], recorded["elapsed_s"]
+
+    def record(self, kind: str, request: Any, response: Any, elapsed: float) -> None:
+        self.record_many(kind, [(request, response)], elapsed)
+
+    def record_many(
+        self, kind: str, interactions: List[Tuple[Any, Any]], elapsed: float
+    ) -> None:
+        """
+        Records the (request, response) pairs answered together by one call
+        """
+        with self._lock:
+            for request, response in interactions:
+                interaction = self.interactions.setdefault(
+                    request_key(kind, request),
+                    {"kind": kind, "request": normalize(request), "responses": []},
+                )
+                interaction["responses"].append({"response": response, "elapsed_s": elapsed})
+            self._save()
+
+    def _save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(
+                {"version": 1, "interactions": self.interactions},
+                file,
+                indent=1,
+                sort_keys=True,
+            )
+            file.write("\n")
+        os.replace(tmp_path, self.path)
+
+    def call(self, kind: str, request: Any, fn: Callable[[], Any]) -> Any:
+        """
+        The response of `fn`, recorded, or its recording; it has to be JSON
+        serializable
+        """
+        if not self.recording:
+            response, elapsed = self.play(kind, request)
+            if self.latency:
+                self.sleep(elapsed)
+            return response
+        start = time.perf_counter()
+        response = fn()
+        self.record(kind, request, response, time.perf_counter() - start)
+        return response
+
+    async def acall(self, kind: str, request: Any, fn: Callable[[], Awaitable[Any]]) -> Any:
+        if not self.recording:
+            response, elapsed = self.play(kind, request)
+            if self.latency:
+                await asyncio.sleep(elapsed)
+            return response
+        start = time.perf_counter()
+        response = await fn()
+        self.record(kind, request, response, time.perf_counter() - start)
+        return response
+
+
+def _http_request(request: httpx.Request) -> Dict[str, Any]:
+    body = request.read().decode("utf-8", errors="replace")
+    try:
+        body = json.loads(body) if body else None
+    except ValueError:
+        pass
+    return {"method": request.method, "path": request.url.raw_path.decode(), "body": body}
+
+
+def _recorded(response: httpx.Response) -> Dict[str, Any]:
+    return {
+        "status": response.status_code,
+        "headers": {k: response.headers[k] for k in _KEPT_HEADERS if k in response.headers},
+        "body": response.text,
+    }
+
+
+def _response(request: httpx.Request, recorded: Dict[str, Any]) -> httpx.Response:
+    return httpx.Response(
+        recorded["status"],
+        headers=recorded["headers"],
+        content=recorded["body"].encode("utf-8"),
+        request=request,
+    )
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """
+    Records the requests sent through `transport`, or answers them from the
+    cassette without it. Streamed responses are read in full before they are
+    handed over.
+    """
+
+    def __init__(self, cassette: Cassette, transport: httpx.BaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        def send() -> Dict[str, Any]:
+            response = self.transport.handle_request(request)
+            try:
+                response.read()
+            finally:
+                response.close()
+            return _recorded(response)
+
+        return _response(request, self.cassette.call("http", _http_request(request), send))
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncCassetteTransport(httpx.AsyncBaseTransport):
+    def __init__(self, cassette: Cassette, transport: httpx.AsyncBaseTransport):
+        self.cassette = cassette
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        async def send() -> Dict[str, Any]:
+            response = await self.transport.handle_async_request(request)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+            return _recorded(response)
+
+        recorded = await self.cassette.acall("http", _http_request(request), send)
+        return _response(request, recorded)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class CassetteEmbeddings(Embeddings):
+    """
+    Embeddings recorded one text at a time, so a text replays the same
+    whichever batch it was embedded in
+
+    Args:
+        cassette: Where the vectors are recorded
+        embeddings: The embeddings doing the actual work, not needed to replay
+    """
+
+    def __init__(self, cassette: Cassette, embeddings: Optional[Embeddings] = None):
+        self.cassette = cassette
+        self.embeddings = embeddings
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "embeddings" or self.embeddings is None:
+            raise AttributeError(name)
+        return getattr(self.embeddings, name)
+
+    def _replay(self, texts: List[str]) -> Tuple[List[List[float]], float]:
+        played = [self.cassette.play("embedding", {"text": t}) for t in texts]
+        # The texts of a call were embedded together, the call took the longest of them
+        latency = max((e for _, e in played), default=0.0) if self.cassette.latency else 0.0
+        return [vector for vector, _ in played], latency
+
+    def _record(self, texts: List[str], vectors: List[List[float]], elapsed: float) -> None:
+        self.cassette.record_many(
+            "embedding",
+            [({"text": t}, list(v)) for t, v in zip(texts, vectors)],
+            elapsed,
+        )
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not self.cassette.recording:
+            vectors, latency = self._replay(texts)
+            if latency:
+                self.cassette.sleep(latency)
+            return vectors
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self._record(texts, vectors, time.perf_counter() - start)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        if not self.cassette.recording:
+            vectors, latency = self._replay(texts)
+            if latency:
+                await asyncio.sleep(latency)
+            return vectors
+        start = time.perf_counter()
+        vectors = await self.embeddings.aembed_documents(texts)
+        self._record(texts, vectors, time.perf_counter() - start)
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class CassetteSearch:
+    """
+    Records the responses of a search tool such as `TavilySearch`
+
+    Args:
+        cassette: Where the responses are recorded
+        tool: The tool doing the actual search, not needed to replay
+    """
+
+    def __init__(self, cassette: Cassette, tool: Optional[Any] = None):
+        self.cassette = cassette
+        self.tool = tool
+
+    def invoke(self, query: Any) -> Any:
+        return self.cassette.call("search", {"query": query}, lambda: self.tool.invoke(query))
+
+    async def ainvoke(self, query: Any) -> Any:
+        return await self.cassette.acall(
+            "search", {"query": query}, lambda: self.tool.ainvoke(query)
+        )
+
+
+def _to_json(documents: List[Document]) -> List[Dict[str, Any]]:
+    return [
+        {"id": d.id, "page_content": d.page_content, "metadata": d.metadata}
+        for d in documents
+    ]
+
+
+class CassetteRetriever(BaseRetriever):
+    """
+    Records the documents a retriever returns, replaying them needs neither
+    the vector store nor the query embeddings
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    cassette: Cassette
+    retriever: Optional[BaseRetriever] = None
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        recorded = self.cassette.call(
+            "retriever",
+            {"query": query},
+            lambda: _to_json(
+                self.retriever.invoke(query, {"callbacks": run_manager.get_child()})
+            ),
+        )
+        return [Document(**d) for d in recorded]
+
+    async def _aget_relevant_documents(
+        self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        async def retrieve() -> List[Dict[str, Any]]:
+            documents = await self.retriever.ainvoke(
+                query, {"callbacks": run_manager.get_child()}
+            )
+            return _to_json(documents)
+
+        recorded = await self.cassette.acall("retriever", {"query": query}, retrieve)
+        return [Document(**d) for d in recorded]
+
+
+_override: Optional[Cassette] = None
+
+# Getters that build their backends around the cassette, module -> getters
+_CASSETTE_GETTERS = {
+    "graph.chains.clients": ["get_client_registry"],
+    "ingestion": ["get_embeddings", "get_retriever"],
+    "graph.nodes.web_search": ["get_web_search_tool"],
+}
+
+
+@lru_cache(maxsize=None)
+def get_cassette() -> Optional[Cassette]:
+    """
+    The cassette of the process, set by `use_cassette` or by CASSETTE, if any
+    """
+    if _override is not None:
+        return _override
+    if not CASSETTE:
+        return None
+    return Cassette(CASSETTE, CASSETTE_MODE, latency=CASSETTE_LATENCY)
+
+
+def _clear_backends() -> None:
+    # Imported here, these modules build their backends around get_cassette
+    from graph.chains.llm import _clear_chains
+
+    get_cassette.cache_clear()
+    for module, getters in _CASSETTE_GETTERS.items():
+        for getter in getters:
+            getattr(importlib.import_module(module), getter).cache_clear()
+    _clear_chains()
+
+
+@contextmanager
+def use_cassette(cassette: Cassette) -> Iterator[Cassette]:
+    """
+    Every backend built inside the block records to or replays from `cassette`
+    """
+    global _override
+    previous, _override = _override, cassette
+    _clear_backends()
+    try:
+        yield cassette
+    finally:
+        _override = previous
+        _clear_backends()
@@ -0,0 +1,61 @@
+import os
+import time
+from typing import Optional
+
+from graph.chains.generation_grader import NOT_SUPPORTED, NOT_USEFUL
+from graph.state import GraphState
+
+
+def _optional_env(name: str) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+# Default per request budgets, every one of them can be overridden in the input state
+MAX_REGENERATIONS = int(os.getenv("MAX_REGENERATIONS", "3"))
+MAX_WEB_SEARCHES = int(os.getenv("MAX_WEB_SEARCHES", "2"))
+# Wall clock seconds a request may take, unbounded when not set
+REQUEST_DEADLINE_S = _optional_env("REQUEST_DEADLINE_S")
+# Total LLM tokens a request may spend, unbounded when not set
+MAX_TOKENS_PER_REQUEST = _optional_env("MAX_TOKENS_PER_REQUEST")
+
+ANSWERED = "answered"
+DEADLINE = "deadline"
+MAX_TOKENS = "max_tokens"
+REGENERATIONS = "max_regenerations"
+WEB_SEARCHES = "max_web_searches"
+
+
+def out_of_time_or_tokens(state: GraphState) -> Optional[str]:
+    """
+    Returns the request wide budget that is exhausted, if any
+    """
+    deadline = state.get("deadline")
+    if deadline is not None and time.time() >= deadline:
+        return DEADLINE
+    max_tokens = state.get("max_tokens")
+    if max_tokens is not None and state.get("tokens_used", 0) >= max_tokens:
+        return MAX_TOKENS
+    return None
+
+
+def web_search_exhausted(state: GraphState) -> bool:
+    limit = state.get("max_web_searches", MAX_WEB_SEARCHES)
+    return state.get("web_searches", 0) >= limit
+
+
+def exhausted_budget(state: GraphState, verdict: Optional[str]) -> Optional[str]:
+    """
+    Returns the budget that keeps the graph from acting on the verdict, if any:
+    regenerating after "not supported" or searching the web after "not useful"
+    """
+    if reason := out_of_time_or_tokens(state):
+        return reason
+    regenerations = state.get("generations", 0) - 1
+    if verdict == NOT_SUPPORTED and regenerations >= state.get(
+        "max_regenerations", MAX_REGENERATIONS
+    ):
+        return REGENERATIONS
+    if verdict == NOT_USEFUL and web_search_exhausted(state):
+        return WEB_SEARCHES
+    return None
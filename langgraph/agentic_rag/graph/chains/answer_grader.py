@@ -1,7 +1,11 @@
+from functools import lru_cache
+from typing import Any
+
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain_core.runnables import RunnableSequence
-from langchain_openai import ChatOpenAI
+
+from graph.chains.llm import get_llm
 
 
 class GradeAnswer(BaseModel):
@@ -11,9 +15,6 @@ class GradeAnswer(BaseModel):
     )
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
-structured_llm_grader = llm.with_structured_output(GradeAnswer)
-
 system = """You are a grader assessing whether an answer addresses / resolves a question \n 
      Give a binary score 'yes' or 'no'. Yes' means that the answer resolves the question."""
 answer_prompt = ChatPromptTemplate.from_messages(
@@ -23,4 +24,16 @@ answer_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-answer_grader: RunnableSequence = answer_prompt | structured_llm_grader
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_answer_grader() -> RunnableSequence:
+    structured_llm_grader = get_llm().with_structured_output(GradeAnswer)
+    return answer_prompt | structured_llm_grader
+
+
+def __getattr__(name: str) -> Any:
+    # Keeps `from graph.chains.answer_grader import answer_grader` working
+    # without building the chain at import time
+    if name == "answer_grader":
+        return get_answer_grader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
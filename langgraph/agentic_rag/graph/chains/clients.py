@@ -0,0 +1,537 @@
+"""
+Process-wide HTTP clients of the OpenAI models.
+
+Every chat model of a model name shares one keep-alive connection pool (sync
+and async) and one limiter. The limiter keeps the requests and the tokens per
+minute under the account limits with two token buckets: a call over budget
+waits its turn in the transport, and a call that would wait longer than
+`LLM_MAX_QUEUE_WAIT_S`, or find `LLM_MAX_QUEUE` calls already waiting, gets a
+local 429 instead of reaching the provider. The OpenAI client handles that
+429 like one from the API: it backs off for the `retry-after` and raises
+`RateLimitError` once its retries are spent. With a cassette (cassettes.py)
+the requests are recorded, or replayed without reaching the limiter.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from functools import lru_cache
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+
+from cassettes import AsyncCassetteTransport, Cassette, CassetteTransport, get_cassette
+from graph.metrics import (
+    LLM_IN_FLIGHT,
+    LLM_QUEUE_DEPTH,
+    LLM_QUEUE_WAIT,
+    LLM_SHED,
+    get_metrics,
+)
+
+# Requests per minute allowed per model
+LLM_RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "500"))
+# Prompt and completion tokens per minute allowed per model
+LLM_TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "200000"))
+# Per model overrides of both limits, JSON such as {"gpt-4.1-nano": [500, 200000]}
+LLM_RATE_LIMITS = json.loads(os.getenv("LLM_RATE_LIMITS", "{}"))
+# Calls allowed to wait for the limiter per model, the next ones are shed
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+# A call that would wait longer than this for its turn is shed instead
+LLM_MAX_QUEUE_WAIT_S = float(os.getenv("LLM_MAX_QUEUE_WAIT_S", "30"))
+# Connections per model pool, and how many of them are kept alive when idle
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "32"))
+
+# Completion tokens charged for a call that does not cap them
+DEFAULT_COMPLETION_TOKENS = 256
+# Rough size of a token in characters, the limiter does not run the tokenizer
+CHARS_PER_TOKEN = 4
+
+
+class Overloaded(Exception):
+    """
+    The call was shed by the limiter, it can be retried after `retry_after` seconds
+    """
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"{model} is over its rate limit, retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills at `per_minute` / 60 per second up to `capacity`. Taking more than
+    what is left is allowed: the bucket goes negative and the next callers
+    wait for it to refill, which serves them in arrival order.
+
+    Args:
+        per_minute: Refill rate
+        capacity: Largest burst, a minute worth of budget by default
+        clock: Time source, injectable for tests
+    """
+
+    def __init__(
+        self,
+        per_minute: float,
+        capacity: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = per_minute / 60
+        self.capacity = capacity if capacity is not None else per_minute
+        self.clock = clock
+        self.level = self.capacity
+        self.updated = clock()
+
+    def _refill(self) -> None:
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """
+        Seconds until `amount` can be taken, a call larger than the capacity
+        only waits for a full bucket
+        """
+        self._refill()
+        deficit = min(amount, self.capacity) - self.level
+        return deficit / self.rate if deficit > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self._refill()
+        self.level -= min(amount, self.capacity)
+
+
+class ModelLimiter:
+    """
+    Request and token budgets of one model, with its queue and in-flight gauges
+
+    Args:
+        model: The model name, label of the metrics
+        rpm: Requests per minute
+        tpm: Tokens per minute
+        max_queue: Calls allowed to wait at the same time
+        max_wait: Longest wait accepted before shedding, in seconds
+        clock: Time source, injectable for tests
+        sleep: Blocking sleep, injectable for tests
+    """
+
+    def __init__(
+        self,
+        model: str,
+        rpm: float = LLM_RPM_LIMIT,
+        tpm: float = LLM_TPM_LIMIT,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_wait: float = LLM_MAX_QUEUE_WAIT_S,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.model = model
+        self.requests = TokenBucket(rpm, clock=clock)
+        self.tokens = TokenBucket(tpm, clock=clock)
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+        self.blocked_until = 0.0
+        self.queued = 0
+        self.in_flight = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def _publish(self) -> None:
+        metrics = get_metrics()
+        metrics.set(LLM_QUEUE_DEPTH, self.queued, model=self.model)
+        metrics.set(LLM_IN_FLIGHT, self.in_flight, model=self.model)
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Takes the budget of a call and joins the queue if it has to wait
+
+        Returns:
+            The seconds the call has to wait before it is sent
+
+        Raises:
+            Overloaded: The wait would be too long or the queue is full
+        """
+        with self._lock:
+            wait = max(
+                self.requests.wait_time(1),
+                self.tokens.wait_time(tokens),
+                self.blocked_until - self.clock(),
+            )
+            if wait > self.max_wait or (wait > 0 and self.queued >= self.max_queue):
+                self.shed += 1
+                get_metrics().inc(LLM_SHED, model=self.model)
+                raise Overloaded(self.model, wait)
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            if wait > 0:
+                self.queued += 1
+                self._publish()
+        get_metrics().observe(LLM_QUEUE_WAIT, wait, model=self.model)
+        return wait
+
+    def _admit(self, queued: bool, sent: bool = True) -> None:
+        with self._lock:
+            self.queued -= queued
+            self.in_flight += sent
+            self._publish()
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._publish()
+
+    def acquire(self, tokens: int) -> None:
+        """
+        Blocks until the call may be sent, it is then in flight until `release`
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                self.sleep(wait)
+            except BaseException:
+                self._admit(queued=True, sent=False)
+                raise
+        self._admit(queued=wait > 0)
+
+    async def aacquire(self, tokens: int) -> None:
+        wait = self.reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except BaseException:
+                # Cancelled while waiting, the budget it took is not given back
+                self._admit(queued=True, sent=False)
+                raise
+        self._admit(queued=wait > 0)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds every call for `seconds`, after the provider answered with a 429
+        """
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+    def stats(self) -> Dict[str, float]:
+        return {"queued": self.queued, "in_flight": self.in_flight, "shed": self.shed}
+
+
+def estimate_tokens(request: httpx.Request) -> int:
+    """
+    Tokens a chat or embedding request will be charged, estimated from the
+    size of its prompt plus its completion cap
+    """
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 0
+    if not isinstance(body, dict):
+        return 0
+    if "input" in body:
+        # Embeddings: text, texts, or texts already turned into token ids
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        return sum(
+            len(i) if isinstance(i, list) else len(str(i)) // CHARS_PER_TOKEN + 1
+            for i in inputs
+        )
+    prompt_chars = sum(
+        len(json.dumps(message.get("content", ""))) for message in body.get("messages", [])
+    )
+    completion = (
+        body.get("max_completion_tokens")
+        or body.get("max_tokens")
+        or DEFAULT_COMPLETION_TOKENS
+    )
+    return prompt_chars // CHARS_PER_TOKEN + completion
+
+
+def _shed_response(request: httpx.Request, error: Overloaded) -> httpx.Response:
+    return httpx.Response(
+        429,
+        headers={"retry-after": f"{error.retry_after:.3f}", "x-shed-by": "local-limiter"},
+        json={"error": {"message": str(error), "type": "rate_limit", "code": "shed"}},
+        request=request,
+    )
+
+
+def _retry_after(response: httpx.Response) -> float:
+    try:
+        return float(response.headers.get("retry-after", "1"))
+    except ValueError:
+        return 1.0
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    # A streamed completion is in flight until its body is closed
+    def __init__(self, stream: httpx.SyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield from self._stream
+
+    def close(self) -> None:
+        try:
+            self._stream.close()
+        finally:
+            if self._release:
+                self._release, release = None, self._release
+                release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release:
+                self._release, release = None, self._release
+                release()
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+    )
+
+
+class LimitedTransport(httpx.BaseTransport):
+    """
+    Sends the requests of a model through its limiter and its connection pool
+    """
+
+    def __init__(self, limiter: ModelLimiter, transport: Optional[httpx.BaseTransport] = None):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport(limits=_pool_limits())
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            self.limiter.acquire(estimate_tokens(request))
+        except Overloaded as error:
+            return _shed_response(request, error)
+        try:
+            response = self.transport.handle_request(request)
+        except BaseException:
+            self.limiter.release()
+            raise
+        if response.status_code == 429:
+            self.limiter.pause(_retry_after(response))
+        response.stream = _ReleasingStream(response.stream, self.limiter.release)
+        return response
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(
+        self, limiter: ModelLimiter, transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.limiter = limiter
+        self.transport = transport or httpx.AsyncHTTPTransport(limits=_pool_limits())
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        try:
+            await self.limiter.aacquire(estimate_tokens(request))
+        except Overloaded as error:
+            return _shed_response(request, error)
+        try:
+            response = await self.transport.handle_async_request(request)
+        except BaseException:
+            self.limiter.release()
+            raise
+        if response.status_code == 429:
+            self.limiter.pause(_retry_after(response))
+        response.stream = _AsyncReleasingStream(response.stream, self.limiter.release)
+        return response
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+class LoopTransports(httpx.AsyncBaseTransport):
+    """
+    One async transport per event loop, built by `factory` on the first
+    request made from the loop: a pooled connection belongs to the loop that
+    opened it, and a second `asyncio.run` must not reuse the pool of the first.
+    The transports of closed loops are dropped when another loop shows up.
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self.factory = factory
+        self._transports: Dict[asyncio.AbstractEventLoop, httpx.AsyncBaseTransport] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._transports)
+
+    def _transport(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            transport = self._transports.get(loop)
+            if transport is None:
+                for closed in [other for other in self._transports if other.is_closed()]:
+                    del self._transports[closed]
+                transport = self._transports[loop] = self.factory()
+        return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self) -> None:
+        """
+        Closes the transport of the running loop
+        """
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+    def close(self) -> None:
+        """
+        Closes the transports of the loops that are neither running nor
+        closed, and forgets every other one: the pool of a running loop can
+        only be closed from it (`aclose`), that of a closed loop not at all
+        """
+        with self._lock:
+            transports, self._transports = self._transports, {}
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            # Another loop cannot be run from inside this one
+            return
+        for loop, transport in transports.items():
+            if not loop.is_closed() and not loop.is_running():
+                loop.run_until_complete(transport.aclose())
+
+
+class ClientRegistry:
+    """
+    One limiter and one pair of pooled HTTP clients per model name, built on
+    first use. The async client keeps a connection pool per event loop.
+
+    Args:
+        limits: (requests, tokens) per minute by model, LLM_RATE_LIMITS by default
+        cassette: Records the requests of every client, or replays them
+        **limiter_kwargs: Passed to every `ModelLimiter`
+    """
+
+    def __init__(
+        self,
+        limits: Optional[Dict[str, Tuple[float, float]]] = None,
+        cassette: Optional[Cassette] = None,
+        **limiter_kwargs,
+    ):
+        self.limits = limits if limits is not None else LLM_RATE_LIMITS
+        self.cassette = cassette
+        self.limiter_kwargs = limiter_kwargs
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._clients: Dict[str, httpx.Client] = {}
+        self._async_clients: Dict[str, httpx.AsyncClient] = {}
+        self._async_transports: Dict[str, LoopTransports] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, model: str) -> ModelLimiter:
+        with self._lock:
+            if model not in self._limiters:
+                rpm, tpm = self.limits.get(model, (LLM_RPM_LIMIT, LLM_TPM_LIMIT))
+                self._limiters[model] = ModelLimiter(model, rpm, tpm, **self.limiter_kwargs)
+            return self._limiters[model]
+
+    def http_client(self, model: str) -> httpx.Client:
+        limiter = self.limiter(model)
+        with self._lock:
+            if model not in self._clients:
+                transport: httpx.BaseTransport = LimitedTransport(limiter)
+                if self.cassette is not None:
+                    transport = CassetteTransport(self.cassette, transport)
+                self._clients[model] = httpx.Client(transport=transport, timeout=None)
+            return self._clients[model]
+
+    def async_http_client(self, model: str) -> httpx.AsyncClient:
+        limiter = self.limiter(model)
+
+        def transport() -> httpx.AsyncBaseTransport:
+            limited: httpx.AsyncBaseTransport = AsyncLimitedTransport(limiter)
+            if self.cassette is not None:
+                return AsyncCassetteTransport(self.cassette, limited)
+            return limited
+
+        with self._lock:
+            if model not in self._async_clients:
+                transports = self._async_transports[model] = LoopTransports(transport)
+                self._async_clients[model] = httpx.AsyncClient(
+                    transport=transports, timeout=None
+                )
+            return self._async_clients[model]
+
+    def chat_model(self, model: str, **kwargs: Any) -> ChatOpenAI:
+        """
+        A chat model on the shared pools and limiter of `model`, the OpenAI
+        client still applies its own timeout per request
+        """
+        if self.cassette is not None and not self.cassette.recording:
+            # Replayed requests never reach the API, any key will do
+            kwargs.setdefault("api_key", os.getenv("OPENAI_API_KEY") or "replay")
+        return ChatOpenAI(
+            model=model,
+            http_client=self.http_client(model),
+            http_async_client=self.async_http_client(model),
+            **kwargs,
+        )
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {model: limiter.stats() for model, limiter in limiters.items()}
+
+    def _take_clients(self) -> Tuple[List[httpx.Client], List[LoopTransports]]:
+        with self._lock:
+            clients, self._clients = self._clients, {}
+            transports, self._async_transports = self._async_transports, {}
+            self._async_clients = {}
+        return list(clients.values()), list(transports.values())
+
+    def close(self) -> None:
+        """
+        Closes the sync pools, and the async pools of the loops not running
+        """
+        clients, transports = self._take_clients()
+        for client in clients:
+            client.close()
+        for transport in transports:
+            transport.close()
+
+    async def aclose(self) -> None:
+        """
+        Closes the sync pools and every async pool, those of the running loop
+        included
+        """
+        clients, transports = self._take_clients()
+        for client in clients:
+            client.close()
+        for transport in transports:
+            await transport.aclose()
+            transport.close()
+
+
+@lru_cache(maxsize=None)
+def get_client_registry() -> ClientRegistry:
+    return ClientRegistry(cassette=get_cassette())
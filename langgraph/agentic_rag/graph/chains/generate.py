@@ -1,28 +1,41 @@
+from functools import lru_cache
 from typing import Any, Dict
 
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from langchain import hub
 from langchain_core.output_parsers import StrOutputParser
-from langchain_openai import ChatOpenAI
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableSequence
 
+from graph.chains.llm import get_llm
 from graph.state import GraphState
+from prompt_registry import load_prompt
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
 
-prompt = hub.pull("rlm/rag-prompt")
+@lru_cache(maxsize=None)
+def get_rag_prompt() -> ChatPromptTemplate:
+    # Vendored copy of the hub prompt, see prompt_registry.py to refresh it
+    return load_prompt("rlm/rag-prompt")
 
-generation_chain = prompt | llm | StrOutputParser()
+
+@lru_cache(maxsize=None)
+def get_generation_chain() -> RunnableSequence:
+    return get_rag_prompt() | get_llm() | StrOutputParser()
+
+
+def __getattr__(name: str) -> Any:
+    if name == "generation_chain":
+        return get_generation_chain()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def generate(state: GraphState) -> Dict[str, Any]:
     """
     Generates a response to the user's question
     """
-    print("--- GENERATE NODE ---")
     question = state["question"]
     documents = state["documents"]
-    result = generation_chain.invoke({"question": question, "context": documents})
+    result = get_generation_chain().invoke({"question": question, "context": documents})
     return {"generation": result, "question": question, "documents": documents}
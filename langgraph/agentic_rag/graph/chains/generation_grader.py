@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Sequence, Tuple
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from batching import get_single_flight
+from graph.chains.answer_grader import get_answer_grader
+from graph.chains.hallucination_grader import get_hallucination_grader
+from graph.metrics import record_cache
+
+USEFUL = "useful"
+NOT_USEFUL = "not useful"
+NOT_SUPPORTED = "not supported"
+
+# Runs the hallucination and answer graders at the same time instead of one after the other
+CONCURRENT_GENERATION_GRADING = (
+    os.getenv("CONCURRENT_GENERATION_GRADING", "false").lower() == "true"
+)
+# Number of verdicts remembered, so re-entering the grading edge costs no LLM call
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "1024"))
+
+_verdicts: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_verdicts_lock = threading.Lock()
+
+
+def _hash(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def documents_hash(documents: Sequence[Any]) -> str:
+    return _hash(*(getattr(d, "page_content", str(d)) for d in documents))
+
+
+def _grade(question: str, documents: Sequence[Any], generation: str, concurrent: bool) -> str:
+    hallucination_input = {"documents": documents, "generation": generation}
+    answer_input = {"question": question, "generation": generation}
+
+    if not concurrent:
+        if not get_hallucination_grader().invoke(hallucination_input).binary_score:
+            return NOT_SUPPORTED
+        answer = get_answer_grader().invoke(answer_input)
+        return USEFUL if answer.binary_score else NOT_USEFUL
+
+    executor = ContextThreadPoolExecutor(max_workers=2)
+    supported = False
+    try:
+        grounded = executor.submit(get_hallucination_grader().invoke, hallucination_input)
+        answer = executor.submit(get_answer_grader().invoke, answer_input)
+        if not grounded.result().binary_score:
+            # Same decision as the sequential path, the answer grade does not matter
+            return NOT_SUPPORTED
+        supported = True
+        return USEFUL if answer.result().binary_score else NOT_USEFUL
+    finally:
+        # Returns without waiting for the answer grader once the verdict is known
+        executor.shutdown(wait=supported, cancel_futures=True)
+
+
+async def _agrade(
+    question: str, documents: Sequence[Any], generation: str, concurrent: bool
+) -> str:
+    hallucination_input = {"documents": documents, "generation": generation}
+    answer_input = {"question": question, "generation": generation}
+
+    if not concurrent:
+        grounded = await get_hallucination_grader().ainvoke(hallucination_input)
+        if not grounded.binary_score:
+            return NOT_SUPPORTED
+        answer = await get_answer_grader().ainvoke(answer_input)
+        return USEFUL if answer.binary_score else NOT_USEFUL
+
+    answer = asyncio.ensure_future(get_answer_grader().ainvoke(answer_input))
+    # Marks a failure of a grade nobody awaits as retrieved
+    answer.add_done_callback(lambda f: f.cancelled() or f.exception())
+    try:
+        grounded = await get_hallucination_grader().ainvoke(hallucination_input)
+        if not grounded.binary_score:
+            return NOT_SUPPORTED
+        return USEFUL if (await answer).binary_score else NOT_USEFUL
+    finally:
+        # The answer grade does not matter once the generation is not grounded
+        answer.cancel()
+
+
+def _cached_verdict(key: Tuple[str, str]) -> Optional[str]:
+    with _verdicts_lock:
+        if key in _verdicts:
+            _verdicts.move_to_end(key)
+            record_cache("verdict", hit=True)
+            return _verdicts[key]
+    record_cache("verdict", hit=False)
+    return None
+
+
+def _remember_verdict(key: Tuple[str, str], verdict: str) -> None:
+    with _verdicts_lock:
+        _verdicts[key] = verdict
+        while len(_verdicts) > VERDICT_CACHE_SIZE:
+            _verdicts.popitem(last=False)
+
+
+def grade_generation(
+    question: str,
+    documents: Sequence[Any],
+    generation: str,
+    concurrent: bool = CONCURRENT_GENERATION_GRADING,
+) -> str:
+    """
+    Grades a generation against the documents (hallucination) and the question
+    (answer). Verdicts are cached per (question + generation hash, documents hash).
+
+    Returns:
+        "useful", "not useful" (grounded but not answering) or "not supported" (not grounded)
+    """
+    key = (_hash(question, generation), documents_hash(documents))
+    verdict = _cached_verdict(key)
+    if verdict is None:
+        # Concurrent requests grading the same generation share one grading
+        verdict = get_single_flight("verdict").do(
+            key, lambda: _grade(question, documents, generation, concurrent)
+        )
+        _remember_verdict(key, verdict)
+    return verdict
+
+
+async def agrade_generation(
+    question: str,
+    documents: Sequence[Any],
+    generation: str,
+    concurrent: bool = CONCURRENT_GENERATION_GRADING,
+) -> str:
+    key = (_hash(question, generation), documents_hash(documents))
+    verdict = _cached_verdict(key)
+    if verdict is None:
+        verdict = await get_single_flight("verdict").ado(
+            key, lambda: _agrade(question, documents, generation, concurrent)
+        )
+        _remember_verdict(key, verdict)
+    return verdict
@@ -1,9 +1,11 @@
+from functools import lru_cache
+from typing import Any
+
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from langchain_core.runnables import RunnableSequence
-from langchain_openai import ChatOpenAI
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+from graph.chains.llm import get_llm
 
 
 class GradeHallucinations(BaseModel):
@@ -14,8 +16,6 @@ class GradeHallucinations(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(GradeHallucinations)
-
 system = """You are a grader assessing whether an LLM generation is grounded in / supported by a set of retrieved facts. \n 
      Give a binary score 'yes' or 'no'. 'Yes' means that the answer is grounded in / supported by the set of facts."""
 hallucination_prompt = ChatPromptTemplate.from_messages(
@@ -25,4 +25,14 @@ hallucination_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-hallucination_grader: RunnableSequence = hallucination_prompt | structured_llm_grader
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_hallucination_grader() -> RunnableSequence:
+    structured_llm_grader = get_llm().with_structured_output(GradeHallucinations)
+    return hallucination_prompt | structured_llm_grader
+
+
+def __getattr__(name: str) -> Any:
+    if name == "hallucination_grader":
+        return get_hallucination_grader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
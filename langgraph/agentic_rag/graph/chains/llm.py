@@ -0,0 +1,59 @@
+import importlib
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Iterator, Optional
+
+from langchain_core.language_models import BaseChatModel
+
+from graph.chains.clients import get_client_registry
+
+DEFAULT_MODEL = "gpt-4.1-nano"
+
+# Chain builders that bake the chat model in, module -> cached getters
+_CHAIN_GETTERS = {
+    "graph.chains.answer_grader": ["get_answer_grader"],
+    "graph.chains.generate": ["get_generation_chain"],
+    "graph.chains.hallucination_grader": ["get_hallucination_grader"],
+    "graph.chains.retrieval_grader": [
+        "get_retrieval_grader",
+        "get_batch_retrieval_grader",
+    ],
+    "graph.chains.router": ["get_question_router"],
+}
+
+_override: Optional[BaseChatModel] = None
+
+
+@lru_cache(maxsize=None)
+def get_llm(model: str = DEFAULT_MODEL) -> BaseChatModel:
+    """
+    Returns the chat model client shared by every chain, built on first use,
+    on the pooled and rate limited connections of its model
+    """
+    if _override is not None:
+        return _override
+    # Streamed calls report their token usage too, the request budgets count it
+    return get_client_registry().chat_model(model, stream_usage=True)
+
+
+def _clear_chains() -> None:
+    get_llm.cache_clear()
+    for module, getters in _CHAIN_GETTERS.items():
+        for getter in getters:
+            getattr(importlib.import_module(module), getter).cache_clear()
+
+
+@contextmanager
+def use_llm(llm: BaseChatModel) -> Iterator[BaseChatModel]:
+    """
+    Every chain built inside the block uses `llm` instead of the OpenAI
+    client, the benchmarks and the tests run the real chains on fakes this way
+    """
+    global _override
+    previous, _override = _override, llm
+    _clear_chains()
+    try:
+        yield llm
+    finally:
+        _override = previous
+        _clear_chains()
@@ -0,0 +1,313 @@
+"""
+Local routing of the questions the LLM router would send to an obvious
+datasource.
+
+`LocalRouter` is a nearest centroid classifier over the query embeddings of
+ingestion.get_embeddings, trained on seed examples and on the decisions of
+the LLM router. Those embeddings are cached on disk, so training only embeds
+new questions, and the vector of a routed question is the one retrieval
+looks up next. The decisions are written to ROUTER_LOG_PATH by a background
+thread, never on the request path, the log keeps the last
+ROUTER_LOG_MAX_DECISIONS of them and the router is retrained in the
+background after every ROUTER_RETRAIN_EVERY.
+
+The router only answers when the margin between the two closest datasources
+is at least its threshold. Unless LOCAL_ROUTER_THRESHOLD sets one, the
+threshold is calibrated on the training set at every fit: the smallest
+margin above which the leave one out predictions agree with the labels at
+least LOCAL_ROUTER_MIN_AGREEMENT of the time. The coverage then follows from
+how well the embeddings separate the datasources.
+
+benchmarks/router_agreement.py measures the coverage and the agreement with
+the LLM router on benchmarks/data/router_questions.jsonl. With the local
+hashing embeddings (LOCAL_ROUTER_EMBEDDINGS=hashing), a bag of words that
+separates the datasources poorly, the router decides 32.5% of the questions
+trained on the seeds (100% agreement) and 47.5% trained on the log too
+(94.7%): most questions take the LLM router. The OpenAI embeddings are
+measured with `--embeddings openai --record`, which needs the API key.
+"""
+
+import json
+import logging
+import os
+import queue
+import threading
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from graph.embeddings import HashingEmbeddings
+
+logger = logging.getLogger(__name__)
+
+_PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# "openai", the cached query embeddings of ingestion.py, or "hashing", local bag of words
+LOCAL_ROUTER_EMBEDDINGS = os.getenv("LOCAL_ROUTER_EMBEDDINGS", "openai")
+# Minimum similarity margin between the two closest datasources to skip the
+# LLM router, calibrated on the training set when not set
+LOCAL_ROUTER_THRESHOLD: Optional[float] = (
+    float(os.environ["LOCAL_ROUTER_THRESHOLD"])
+    if os.getenv("LOCAL_ROUTER_THRESHOLD")
+    else None
+)
+# Agreement with the LLM router the calibrated threshold aims for
+LOCAL_ROUTER_MIN_AGREEMENT = float(os.getenv("LOCAL_ROUTER_MIN_AGREEMENT", "0.97"))
+# Every decision of the LLM router is appended here and used as training data
+ROUTER_LOG_PATH = os.getenv(
+    "ROUTER_LOG_PATH", os.path.join(_PROJECT_DIR, ".router_decisions.jsonl")
+)
+# Decisions kept in the log, the oldest are dropped once it holds twice as many
+ROUTER_LOG_MAX_DECISIONS = int(os.getenv("ROUTER_LOG_MAX_DECISIONS", "10000"))
+# The local router is retrained after this many new decisions, 0 only trains it at startup
+ROUTER_RETRAIN_EVERY = int(os.getenv("ROUTER_RETRAIN_EVERY", "100"))
+
+# Questions the router prompt unambiguously sends to each datasource
+SEED_EXAMPLES: List[Tuple[str, str]] = [
+    ("What is agent memory?", "vectorstore"),
+    ("How do LLM powered autonomous agents plan?", "vectorstore"),
+    ("What types of memory can an agent use?", "vectorstore"),
+    ("How does task decomposition work for agents?", "vectorstore"),
+    ("What is the ReAct framework for agents?", "vectorstore"),
+    ("How do agents use external tools?", "vectorstore"),
+    ("What is chain of thought prompting?", "vectorstore"),
+    ("What is few-shot prompt engineering?", "vectorstore"),
+    ("How does in-context learning with prompts work?", "vectorstore"),
+    ("What are adversarial attacks on LLMs?", "vectorstore"),
+    ("How does a jailbreak prompt attack a language model?", "vectorstore"),
+    ("What is prompt injection?", "vectorstore"),
+    ("Who won the last football world cup?", "websearch"),
+    ("What is the weather in Tokyo today?", "websearch"),
+    ("What is the capital of France?", "websearch"),
+    ("Latest news about the stock market", "websearch"),
+    ("How do I bake sourdough bread?", "websearch"),
+    ("Who is the president of the United States?", "websearch"),
+    ("What movies are playing this weekend?", "websearch"),
+    ("What are the results of the Inter Miami soccer team?", "websearch"),
+    ("How tall is Mount Everest?", "websearch"),
+    ("What is the price of bitcoin?", "websearch"),
+    ("Best restaurants in Buenos Aires", "websearch"),
+    ("When is the next solar eclipse?", "websearch"),
+]
+
+
+def _read_lines(path: str) -> List[str]:
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [line for line in f if line.strip()]
+
+
+def load_logged_decisions(path: str = ROUTER_LOG_PATH) -> List[Tuple[str, str]]:
+    records = [json.loads(line) for line in _read_lines(path)]
+    return [(r["question"], r["datasource"]) for r in records]
+
+
+class DecisionLog:
+    """
+    Appends the decisions of the LLM router to `path` from a background
+    thread, a request only puts its decision on a queue
+
+    Args:
+        path: The JSON lines log
+        max_decisions: Decisions kept, the log is cut back to them once it
+            holds twice as many
+        retrain_every: New decisions after which `on_retrain` runs (in the
+            writer thread), 0 never
+        on_retrain: Trains the router again on the log
+    """
+
+    def __init__(
+        self,
+        path: str = ROUTER_LOG_PATH,
+        max_decisions: int = ROUTER_LOG_MAX_DECISIONS,
+        retrain_every: int = ROUTER_RETRAIN_EVERY,
+        on_retrain: Optional[Callable[[], None]] = None,
+    ):
+        self.path = path
+        self.max_decisions = max_decisions
+        self.retrain_every = retrain_every
+        self.on_retrain = on_retrain
+        self._queue: "queue.Queue[Dict[str, str]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._lines: Optional[int] = None
+        self._since_retrain = 0
+
+    def log(self, question: str, datasource: str) -> None:
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._run, name="router-decision-log", daemon=True
+                )
+                self._writer.start()
+        self._queue.put({"question": question, "datasource": datasource})
+
+    def flush(self) -> None:
+        """
+        Waits until every logged decision is written
+        """
+        self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Could not log %d router decisions", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[Dict[str, str]]) -> None:
+        if self._lines is None:
+            self._lines = len(_read_lines(self.path))
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.writelines(json.dumps(record) + "\n" for record in batch)
+        self._lines += len(batch)
+        if self._lines > 2 * self.max_decisions:
+            self._compact()
+        self._since_retrain += len(batch)
+        if self.retrain_every and self._since_retrain >= self.retrain_every:
+            self._since_retrain = 0
+            if self.on_retrain is not None:
+                self.on_retrain()
+
+    def _compact(self) -> None:
+        lines = _read_lines(self.path)[-self.max_decisions :]
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+        os.replace(tmp_path, self.path)
+        self._lines = len(lines)
+
+
+def _retrain() -> None:
+    # The next request gets the router trained here, not one trained on its path
+    get_local_router.cache_clear()
+    get_local_router()
+
+
+@lru_cache(maxsize=None)
+def get_decision_log() -> DecisionLog:
+    return DecisionLog(on_retrain=_retrain)
+
+
+def log_decision(question: str, datasource: str) -> None:
+    get_decision_log().log(question, datasource)
+
+
+class LocalRouter:
+    """
+    Nearest centroid classifier over question embeddings, decides between the
+    datasources without calling the LLM
+
+    Args:
+        embeddings: Embeds the questions, local hashing embeddings by default
+        threshold: Minimum margin for `route` to answer, calibrated by `fit`
+            when None
+        min_agreement: Leave one out agreement the calibrated threshold keeps
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        threshold: Optional[float] = LOCAL_ROUTER_THRESHOLD,
+        min_agreement: float = LOCAL_ROUTER_MIN_AGREEMENT,
+    ):
+        self.embeddings = embeddings or HashingEmbeddings()
+        self.threshold = threshold
+        self.min_agreement = min_agreement
+        self.labels: List[str] = []
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+
+    @staticmethod
+    def _normalize(matrix: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+    def fit(self, questions: Sequence[str], labels: Sequence[str]) -> "LocalRouter":
+        vectors = self._normalize(
+            np.asarray(self.embeddings.embed_documents(list(questions)), np.float32)
+        )
+        labels = np.asarray(labels)
+        self.labels = sorted(set(labels))
+        sums = np.stack([vectors[labels == label].sum(axis=0) for label in self.labels])
+        self.centroids = self._normalize(sums)
+        if self.threshold is None:
+            self.threshold = self._calibrate(vectors, labels, sums)
+        return self
+
+    def _calibrate(
+        self, vectors: np.ndarray, labels: np.ndarray, sums: np.ndarray
+    ) -> float:
+        """
+        The smallest margin above which the leave one out predictions on the
+        training set agree with their labels at least `min_agreement` of the
+        time, infinite (never answer) when none does
+        """
+        similarities = vectors @ self.centroids.T
+        own = np.asarray([self.labels.index(label) for label in labels])
+        for k in range(len(self.labels)):
+            rows = own == k
+            if rows.sum() < 2:
+                # Without its only example the datasource has no centroid
+                similarities[rows, k] = -np.inf
+                continue
+            # Similarity to the centroid of the other examples of the same
+            # datasource: (sum - v) . v / |sum - v|, with |v| = 1
+            dots = vectors[rows] @ sums[k]
+            norms = np.sqrt(np.maximum(sums[k] @ sums[k] - 2 * dots + 1, 1e-12))
+            similarities[rows, k] = (dots - 1) / norms
+        ranked = np.sort(similarities, axis=1)
+        margins = ranked[:, -1] - ranked[:, -2]
+        correct = similarities.argmax(axis=1) == own
+        order = np.argsort(-margins, kind="stable")
+        agreement = np.cumsum(correct[order]) / np.arange(1, len(order) + 1)
+        confident = np.nonzero(agreement >= self.min_agreement)[0]
+        return float(margins[order][confident[-1]]) if confident.size else float("inf")
+
+    def predict(self, question: str) -> Tuple[str, float]:
+        """
+        Returns the closest datasource and the margin over the runner up
+        """
+        vector = self._normalize(
+            np.asarray(self.embeddings.embed_query(question), np.float32)
+        )
+        similarities = self.centroids @ vector
+        order = np.argsort(similarities)[::-1]
+        margin = similarities[order[0]] - (
+            similarities[order[1]] if len(order) > 1 else 0.0
+        )
+        return self.labels[order[0]], float(margin)
+
+    def route(self, question: str) -> Optional[str]:
+        """
+        The datasource when the router is confident enough, None to fall back to the LLM
+        """
+        datasource, confidence = self.predict(question)
+        return datasource if confidence >= self.threshold else None
+
+
+def get_router_embeddings() -> Embeddings:
+    if LOCAL_ROUTER_EMBEDDINGS == "hashing":
+        return HashingEmbeddings()
+    # Imported here, ingestion pulls in the vector store clients
+    from ingestion import get_embeddings
+
+    return get_embeddings()
+
+
+@lru_cache(maxsize=None)
+def get_local_router() -> LocalRouter:
+    examples = SEED_EXAMPLES + load_logged_decisions()
+    questions, labels = zip(*examples)
+    return LocalRouter(get_router_embeddings()).fit(questions, labels)
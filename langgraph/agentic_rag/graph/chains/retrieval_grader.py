@@ -1,8 +1,16 @@
+import os
+from functools import lru_cache
+from typing import Any, List, Sequence
+
 from langchain.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
+from graph.chains.llm import get_llm
+from graph.tokens import count_tokens
+
+# Maximum tokens of chunk text sent in a single batched grading call
+BATCH_GRADER_TOKEN_BUDGET = int(os.getenv("BATCH_GRADER_TOKEN_BUDGET", "4000"))
 
 
 class GradeDocuments(BaseModel):
@@ -15,8 +23,6 @@ class GradeDocuments(BaseModel):
     )
 
 
-structured_llm_grader = llm.with_structured_output(GradeDocuments)
-
 system_prompt = """You are a grader assessing relevance of a retrieved document to a user question. \n 
 If the document contains keyword(s) or semantic meaning related to the question, grade it as relevant. \n
 The document must contain information about the question, but it's not necessary to be a direct quote. \n
@@ -30,4 +36,86 @@ grade_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-retrieval_grader = grade_prompt | structured_llm_grader
+
+@lru_cache(maxsize=None)
+def get_retrieval_grader() -> RunnableSequence:
+    structured_llm_grader = get_llm().with_structured_output(GradeDocuments)
+    return grade_prompt | structured_llm_grader
+
+
+class ChunkGrade(BaseModel):
+    """
+    Binary relevance score of one chunk.
+    """
+
+    chunk_id: int = Field(description="Id of the chunk, as given in the prompt")
+    binary_score: str = Field(
+        description="Chunk is relevant to the question, 'yes' or 'no'"
+    )
+
+
+class GradeDocumentsBatch(BaseModel):
+    """
+    Binary relevance scores of every retrieved chunk.
+    """
+
+    scores: List[ChunkGrade] = Field(description="One score per chunk id")
+
+
+batch_system_prompt = """You are a grader assessing relevance of retrieved chunks to a user question. \n
+Every chunk is wrapped in <chunk id="..."> tags. Grade each chunk on its own. \n
+If a chunk contains keyword(s) or semantic meaning related to the question, grade it as relevant. \n
+The chunk must contain information about the question, but it's not necessary to be a direct quote. \n
+Return one binary score 'yes' or 'no' for every chunk id."""
+
+
+batch_grade_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", batch_system_prompt),
+        ("human", "Retrived chunks:\n\n{chunks}\n\n User question: {question}"),
+    ]
+)
+
+
+def _page_content(document: Any) -> str:
+    return getattr(document, "page_content", str(document))
+
+
+def format_chunks(documents: Sequence[Any]) -> str:
+    return "\n\n".join(
+        f'<chunk id="{i}">\n{_page_content(d)}\n</chunk>' for i, d in enumerate(documents)
+    )
+
+
+def split_into_batches(
+    documents: Sequence[Any], token_budget: int = BATCH_GRADER_TOKEN_BUDGET
+) -> List[List[int]]:
+    """
+    Greedily packs the documents, in order, into batches of at most
+    `token_budget` tokens. A document larger than the budget gets a batch on its own.
+
+    Returns:
+        The document indexes of every batch
+    """
+    batches: List[List[int]] = []
+    used = 0
+    for i, document in enumerate(documents):
+        tokens = count_tokens(_page_content(document))
+        if not batches or used + tokens > token_budget:
+            batches.append([])
+            used = 0
+        batches[-1].append(i)
+        used += tokens
+    return batches
+
+
+@lru_cache(maxsize=None)
+def get_batch_retrieval_grader() -> RunnableSequence:
+    structured_llm_grader = get_llm().with_structured_output(GradeDocumentsBatch)
+    return batch_grade_prompt | structured_llm_grader
+
+
+def __getattr__(name: str) -> Any:
+    if name == "retrieval_grader":
+        return get_retrieval_grader()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
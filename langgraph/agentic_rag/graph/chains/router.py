@@ -1,8 +1,11 @@
-from typing import Literal
+from functools import lru_cache
+from typing import Any, Literal
 
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
+
+from graph.chains.llm import get_llm
 
 
 class RouterQuery(BaseModel):
@@ -14,9 +17,6 @@ class RouterQuery(BaseModel):
     )
 
 
-llm = ChatOpenAI(model="gpt-4.1-nano")
-structured_llm_router = llm.with_structured_output(RouterQuery)
-
 system = """You are an expert at routing a user question to a vectorstore or web search.
 The vectorstore contains documents related to agents, prompt engineering, and adversarial attacks.
 Use the vectorstore for questions on these topics. For all else, use web-search."""
@@ -27,4 +27,14 @@ route_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-question_router = route_prompt | structured_llm_router
\ No newline at end of file
+
+@lru_cache(maxsize=None)
+def get_question_router() -> RunnableSequence:
+    structured_llm_router = get_llm().with_structured_output(RouterQuery)
+    return route_prompt | structured_llm_router
+
+
+def __getattr__(name: str) -> Any:
+    if name == "question_router":
+        return get_question_router()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
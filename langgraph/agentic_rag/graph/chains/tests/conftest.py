@@ -0,0 +1,35 @@
+import os
+from typing import Iterator
+
+import pytest
+
+from cassettes import CASSETTE_MODE, REPLAY, Cassette, use_cassette
+
+CASSETTE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes")
+# Hand-written responses, not recordings: they only exercise the plumbing
+STAND_IN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stand_ins")
+
+
+@pytest.fixture(scope="module", autouse=True)
+def cassette(request) -> Iterator[Cassette]:
+    """
+    Every chain of the module replays `cassettes/<module>.json`, run with
+    CASSETTE_MODE=record (the API keys and an ingested store needed) to
+    record it against the real APIs.
+
+    Until a recording is committed, the module replays `stand_ins/<module>.json`
+    instead: excerpts of the ingested posts and answers written for the
+    tests (the "chatcmpl-stand-in" responses). The tests are then
+    plumbing-only: they check that the prompts, structured outputs and
+    retriever are wired together, the grades they assert are the ones the
+    stand-in hands out, not verdicts of the graders. Its latencies are not
+    those of the APIs either, benchmarks/replay needs a real recording.
+    """
+    name = request.module.__name__.rsplit(".", 1)[-1]
+    path = os.path.join(CASSETTE_DIR, f"{name}.json")
+    if CASSETTE_MODE == REPLAY and not os.path.exists(path):
+        path = os.path.join(STAND_IN_DIR, f"{name}.json")
+        if not os.path.exists(path):
+            pytest.skip(f"No cassette for {name}, record it with CASSETTE_MODE=record")
+    with use_cassette(Cassette(path, CASSETTE_MODE)) as cassette:
+        yield cassette
@@ -0,0 +1,305 @@
+"""
+Opt-in durable checkpoints of the graph runs in SQLite.
+
+With CHECKPOINT_DB set, every run of a question gets a thread of its own and
+a snapshot of the state is written after every step. A question asked again
+while its last run is unfinished (the process died, the caller gave up)
+resumes after the last completed node instead of retrieving, grading and
+searching again. Otherwise it starts over in a new thread, so nothing of the
+earlier run (documents, verdict, fallback answer) leaks into the new one, and
+two concurrent requests for a question never write to the same thread.
+
+The state carries references to the documents of graph/documents.py, not
+their text: every document is written once to a content-addressed table
+next to the checkpoints, the durable copy of the process document store.
+Documents still found in a state are stored by reference too.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Iterator, MutableMapping, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import BaseCheckpointSaver
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph.state import CompiledStateGraph
+
+from graph.documents import document_ref, get_document_store
+
+# Path of the SQLite checkpoint database, checkpointing is off when unset
+CHECKPOINT_DB = os.getenv("CHECKPOINT_DB")
+# Documents kept in memory after being written or read, saves a query per reference
+DOCUMENT_CACHE_SIZE = int(os.getenv("CHECKPOINT_DOCUMENT_CACHE_SIZE", "1024"))
+
+_REF = "__document__"
+
+
+def thread_id_for(question: str) -> str:
+    """
+    The key of a question, case and repeated whitespace do not matter; the
+    threads of its runs start with it
+    """
+    normalized = " ".join(question.lower().split())
+    return "q-" + hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+class QuestionThreads:
+    """
+    The thread of the last run of every question, in a SQLite table next to
+    the checkpoints so another process resumes it too
+
+    Args:
+        path: The SQLite database, usually the checkpoint database itself
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS question_threads ("
+            "question TEXT PRIMARY KEY, thread_id TEXT)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+
+    def get(self, question: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT thread_id FROM question_threads WHERE question = ?", (question,)
+            ).fetchone()
+        return default if row is None else row[0]
+
+    def __setitem__(self, question: str, thread_id: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO question_threads VALUES (?, ?)",
+                (question, thread_id),
+            )
+            self._conn.commit()
+
+
+class SqliteDocumentStore:
+    """
+    Content-addressed documents in a SQLite table, a document is stored once
+    however many snapshots refer to it
+
+    Args:
+        path: The SQLite database, usually the checkpoint database itself
+        cache_size: Documents kept in memory
+    """
+
+    def __init__(self, path: str, cache_size: int = DOCUMENT_CACHE_SIZE):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "ref TEXT PRIMARY KEY, id TEXT, page_content TEXT, metadata TEXT)"
+        )
+        self._conn.commit()
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[str, Document]" = OrderedDict()
+        self.cache_size = cache_size
+
+    def _remember(self, ref: str, document: Document) -> None:
+        self._cache[ref] = document
+        self._cache.move_to_end(ref)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def put(self, document: Document) -> str:
+        ref = document_ref(document)
+        with self._lock:
+            if ref not in self._cache:
+                metadata = json.dumps(document.metadata, sort_keys=True, default=str)
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?)",
+                    (ref, document.id, document.page_content, metadata),
+                )
+                self._conn.commit()
+            self._remember(ref, document)
+        return ref
+
+    def get(self, ref: str) -> Document:
+        with self._lock:
+            document = self._cache.get(ref)
+            if document is None:
+                row = self._conn.execute(
+                    "SELECT id, page_content, metadata FROM documents WHERE ref = ?",
+                    (ref,),
+                ).fetchone()
+                if row is None:
+                    raise KeyError(f"Document {ref} is not in the checkpoint database")
+                document = Document(
+                    id=row[0], page_content=row[1], metadata=json.loads(row[2])
+                )
+            self._remember(ref, document)
+        return document
+
+
+class DocumentRefSerializer(SerializerProtocol):
+    """
+    Serializes like `serde` with every `Document` replaced by a reference to
+    the `SqliteDocumentStore`
+
+    Args:
+        store: Where the documents go
+        serde: Serializes what is left, JsonPlusSerializer by default
+    """
+
+    def __init__(
+        self, store: SqliteDocumentStore, serde: Optional[SerializerProtocol] = None
+    ):
+        self.store = store
+        self.serde = serde or JsonPlusSerializer()
+
+    def _to_refs(self, obj: Any) -> Any:
+        if isinstance(obj, Document):
+            return {_REF: self.store.put(obj)}
+        # Exact types only, named tuples and other subclasses are serialized as is
+        if type(obj) is dict:
+            return {k: self._to_refs(v) for k, v in obj.items()}
+        if type(obj) in (list, tuple):
+            return type(obj)(self._to_refs(v) for v in obj)
+        return obj
+
+    def _from_refs(self, obj: Any) -> Any:
+        if type(obj) is dict:
+            if len(obj) == 1 and _REF in obj:
+                return self.store.get(obj[_REF])
+            return {k: self._from_refs(v) for k, v in obj.items()}
+        if type(obj) in (list, tuple):
+            return type(obj)(self._from_refs(v) for v in obj)
+        return obj
+
+    def dumps_typed(self, obj: Any) -> Tuple[str, bytes]:
+        return self.serde.dumps_typed(self._to_refs(obj))
+
+    def loads_typed(self, data: Tuple[str, bytes]) -> Any:
+        return self._from_refs(self.serde.loads_typed(data))
+
+
+@lru_cache(maxsize=None)
+def get_checkpointer(path: Optional[str] = None) -> BaseCheckpointSaver:
+    """
+    The SQLite checkpointer of `path` (CHECKPOINT_DB by default), with its
+    documents stored by reference. The document store of the process writes
+    through to the same database from then on.
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError as error:
+        raise ImportError(
+            "Checkpointing needs langgraph-checkpoint-sqlite, "
+            "pip install langgraph-checkpoint-sqlite"
+        ) from error
+
+    path = path or CHECKPOINT_DB
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    documents = SqliteDocumentStore(path)
+    get_document_store().backing = documents
+    return SqliteSaver(conn, serde=DocumentRefSerializer(documents))
+
+
+@lru_cache(maxsize=None)
+def get_question_threads(path: Optional[str] = None) -> QuestionThreads:
+    """
+    The question threads of `path` (CHECKPOINT_DB by default)
+    """
+    return QuestionThreads(path or CHECKPOINT_DB)
+
+
+class CheckpointedGraph:
+    """
+    Runs every question in a thread of its own (unless the config names one)
+    and resumes the unfinished last run of a question instead of starting
+    over, any other attribute is forwarded to the compiled graph
+
+    Args:
+        app: The agentic RAG graph compiled with a checkpointer
+        threads: The last thread of every question by `thread_id_for` key,
+            kept in memory when not given
+    """
+
+    def __init__(
+        self,
+        app: CompiledStateGraph,
+        threads: Optional[MutableMapping[str, str]] = None,
+    ):
+        self.app = app
+        self.threads = {} if threads is None else threads
+        # Threads a run of this process is writing to, never resumed by another
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.app, name)
+
+    def thread_of(self, question: str) -> Optional[str]:
+        """
+        The thread of the last run of a question
+        """
+        return self.threads.get(thread_id_for(question))
+
+    def _claim_thread(self, question: str) -> str:
+        key = thread_id_for(question)
+        with self._lock:
+            thread_id = self.threads.get(key)
+            if (
+                thread_id is None
+                or thread_id in self._running
+                or not self.app.get_state({"configurable": {"thread_id": thread_id}}).next
+            ):
+                thread_id = f"{key}-{uuid.uuid4().hex[:12]}"
+                self.threads[key] = thread_id
+            self._running.add(thread_id)
+        return thread_id
+
+    def _release(self, config: RunnableConfig) -> None:
+        with self._lock:
+            self._running.discard(config["configurable"]["thread_id"])
+
+    def _prepare(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig]
+    ) -> Tuple[Optional[Dict[str, Any]], RunnableConfig]:
+        config = dict(config or {})
+        configurable = dict(config.get("configurable") or {})
+        if "thread_id" not in configurable:
+            configurable["thread_id"] = self._claim_thread(input["question"])
+        config["configurable"] = configurable
+
+        snapshot = self.app.get_state(config)
+        if not snapshot.next:
+            return input, config
+        # The resumed run gets the whole deadline again, not what was left of it
+        values = snapshot.values
+        if values.get("deadline") is not None:
+            now = time.time()
+            deadline_s = values["deadline"] - values["started_at"]
+            self.app.update_state(config, {"started_at": now, "deadline": now + deadline_s})
+        return None, config
+
+    def invoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Dict[str, Any]:
+        input, config = self._prepare(input, config)
+        try:
+            return self.app.invoke(input, config, **kwargs)
+        finally:
+            self._release(config)
+
+    def stream(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Iterator[Any]:
+        input, config = self._prepare(input, config)
+        try:
+            yield from self.app.stream(input, config, **kwargs)
+        finally:
+            self._release(config)
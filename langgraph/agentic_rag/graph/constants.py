@@ -3,3 +3,6 @@ RETRIEVE = "retrieve"
 GRADE_DOCUMENTS = "grade_documents"
 WEBSEARCH = "websearch"
 GENERATE = "generate"
+INIT = "init"
+GRADE_GENERATION = "grade_generation"
+RERANK = "rerank"
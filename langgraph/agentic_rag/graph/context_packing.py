@@ -0,0 +1,142 @@
+import hashlib
+import os
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, List, Sequence
+
+from langchain_core.documents import Document
+
+from ingestion import get_splitter_encoding
+
+# Maximum tokens of document text put in the generation and hallucination prompts
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Word shingle overlap (Jaccard) above which two chunks count as near duplicates
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+
+_WORD = re.compile(r"\w+")
+_SHINGLE_SIZE = 3
+
+
+def _page_content(document: Any) -> str:
+    return getattr(document, "page_content", None) or str(document)
+
+
+def _shingles(text: str) -> frozenset:
+    words = _WORD.findall(text.lower())
+    if len(words) < _SHINGLE_SIZE:
+        return frozenset([" ".join(words)])
+    return frozenset(
+        " ".join(words[i : i + _SHINGLE_SIZE])
+        for i in range(len(words) - _SHINGLE_SIZE + 1)
+    )
+
+
+def _jaccard(a: frozenset, b: frozenset) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+@dataclass
+class PackedContext:
+    """
+    The documents that made it into the prompt and what packing saved
+
+    Attributes:
+        documents: Kept documents, in the order they were given
+        tokens_before: Tokens of all the documents given to the packer
+        tokens_after: Tokens of the kept documents
+        duplicates: Documents dropped as exact or near duplicates
+        over_budget: Documents dropped because the budget was full
+    """
+
+    documents: List[Any] = field(default_factory=list)
+    tokens_before: int = 0
+    tokens_after: int = 0
+    duplicates: int = 0
+    over_budget: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class ContextPacker:
+    """
+    Removes exact and near-duplicate chunks and greedily fills a token budget
+    with the rest. The documents come ranked by the retriever and the rerank
+    node (MMR), they are kept in that order and the first of two duplicates
+    wins. Chunks that do not fit are skipped so smaller, less relevant ones
+    can still fill the gap; the first chunk is truncated when it is larger
+    than the budget.
+
+    Args:
+        token_budget: Maximum tokens of the packed documents
+        near_duplicate_threshold: Jaccard similarity of word shingles above which
+            a chunk is dropped in favour of a more relevant one
+        encoding: Tokenizer with encode / decode, the one ingestion splits the
+            chunks with by default
+    """
+
+    def __init__(
+        self,
+        token_budget: int = CONTEXT_TOKEN_BUDGET,
+        near_duplicate_threshold: float = NEAR_DUPLICATE_THRESHOLD,
+        encoding: Any = None,
+    ):
+        self.token_budget = token_budget
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._encoding = encoding
+
+    @property
+    def encoding(self) -> Any:
+        # Loading the tiktoken vocabulary is deferred to the first packing
+        return self._encoding if self._encoding is not None else get_splitter_encoding()
+
+    def pack(self, documents: Sequence[Any]) -> PackedContext:
+        texts = [_page_content(d) for d in documents]
+        tokens = [self.encoding.encode(t, disallowed_special=()) for t in texts]
+        packed = PackedContext(tokens_before=sum(len(t) for t in tokens))
+        if not documents:
+            return packed
+
+        seen_hashes = set()
+        kept_shingles: List[frozenset] = []
+        remaining = self.token_budget
+        for i, document in enumerate(documents):
+            normalized = " ".join(texts[i].split()).lower()
+            digest = hashlib.sha256(normalized.encode("utf-8")).digest()
+            shingles = _shingles(texts[i])
+            if digest in seen_hashes or any(
+                _jaccard(shingles, kept) >= self.near_duplicate_threshold
+                for kept in kept_shingles
+            ):
+                packed.duplicates += 1
+                continue
+            seen_hashes.add(digest)
+
+            size = len(tokens[i])
+            if size > remaining:
+                if packed.documents:
+                    packed.over_budget += 1
+                    continue
+                # Nothing fits yet, the most relevant chunk is cut down to the budget
+                size = remaining
+                document = _with_content(
+                    document, self.encoding.decode(tokens[i][:remaining])
+                )
+            kept_shingles.append(shingles)
+            packed.documents.append(document)
+            packed.tokens_after += size
+            remaining -= size
+        return packed
+
+
+def _with_content(document: Any, content: str) -> Any:
+    if isinstance(document, Document):
+        return document.model_copy(update={"page_content": content})
+    return content
+
+
+@lru_cache(maxsize=None)
+def get_context_packer() -> ContextPacker:
+    return ContextPacker()
@@ -0,0 +1,117 @@
+"""
+Process-wide store of the documents the graph runs refer to.
+
+The graph state carries references instead of documents: the sha256 of a
+document's id, text and metadata. A state update then copies a list of short
+strings, and a checkpoint snapshot writes them, whatever the size of the
+pages. A document is interned on the way in, the same chunk retrieved by
+every concurrent run is one object in memory. Nodes materialize the text
+they work on with `load_documents`.
+
+The store keeps the `DOCUMENT_STORE_SIZE` documents used last. Once a
+checkpointer is built (graph/checkpointing.py), every document is also
+written to its database, so a run resumed by another process finds its
+documents. Without one, the references of a finished run are only good until
+they are evicted: load its documents right away, as the semantic cache does
+for the answers it keeps.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, List, Optional, Sequence
+
+from langchain_core.documents import Document
+
+# Documents kept in memory, least recently used go first
+DOCUMENT_STORE_SIZE = int(os.getenv("DOCUMENT_STORE_SIZE", "50000"))
+
+
+def document_ref(document: Document) -> str:
+    """
+    Content address of a document, the same id, text and metadata always get
+    the same reference, in every process
+    """
+    metadata = json.dumps(document.metadata, sort_keys=True, default=str)
+    payload = json.dumps([document.id, document.page_content, metadata])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class DocumentStore:
+    """
+    Interned documents by reference, size bounded
+
+    Args:
+        max_entries: Documents kept in memory
+        backing: Durable copy of every document with the same `put` and
+            `get`, asked for the ones evicted or stored by another process
+    """
+
+    def __init__(
+        self, max_entries: int = DOCUMENT_STORE_SIZE, backing: Optional[Any] = None
+    ):
+        self.max_entries = max_entries
+        self.backing = backing
+        self._documents: "OrderedDict[str, Document]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def __contains__(self, ref: str) -> bool:
+        return ref in self._documents
+
+    def _remember(self, ref: str, document: Document) -> None:
+        self._documents[ref] = document
+        self._documents.move_to_end(ref)
+        while len(self._documents) > self.max_entries:
+            self._documents.popitem(last=False)
+
+    def put(self, document: Document) -> str:
+        ref = document_ref(document)
+        with self._lock:
+            if ref in self._documents:
+                self._documents.move_to_end(ref)
+                return ref
+            self._remember(ref, document)
+        if self.backing is not None:
+            self.backing.put(document)
+        return ref
+
+    def get(self, ref: str) -> Document:
+        with self._lock:
+            document = self._documents.get(ref)
+            if document is not None:
+                self._documents.move_to_end(ref)
+                return document
+        if self.backing is None:
+            raise KeyError(f"Document {ref} is not in the document store")
+        document = self.backing.get(ref)
+        with self._lock:
+            self._remember(ref, document)
+        return document
+
+
+@lru_cache(maxsize=None)
+def get_document_store() -> DocumentStore:
+    return DocumentStore()
+
+
+def store_documents(documents: Sequence[Document]) -> List[str]:
+    """
+    The references of the documents, stored
+    """
+    store = get_document_store()
+    return [store.put(d) for d in documents]
+
+
+def load_documents(refs: Sequence[Any]) -> List[Document]:
+    """
+    The documents of references, documents given as such (states checkpointed
+    before references, or built by a caller) are returned as they are
+    """
+    store = get_document_store()
+    return [r if isinstance(r, Document) else store.get(r) for r in refs]
@@ -0,0 +1,47 @@
+import hashlib
+import re
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+# Words carrying no topic, they would make every question look alike
+STOP_WORDS = frozenset(
+    "a about an and are as at be best by can come comes do does for from get "
+    "good how i in is it me my next of on or out should that the this to use "
+    "was what when where which who why will with work works you your".split()
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Local bag of words embeddings: word unigrams and bigrams hashed into a
+    fixed number of dimensions, log scaled and L2 normalized. No network, no
+    model, deterministic across processes.
+
+    Args:
+        n_features: Size of the vectors
+        stop_words: Words left out of the features
+    """
+
+    def __init__(self, n_features: int = 4096, stop_words=STOP_WORDS):
+        self.n_features = n_features
+        self.stop_words = stop_words
+        self.model = f"hashing-{n_features}"
+
+    def _index(self, feature: str) -> int:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "little") % self.n_features
+
+    def embed_query(self, text: str) -> List[float]:
+        words = [w for w in _TOKEN.findall(text.lower()) if w not in self.stop_words]
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        counts = np.zeros(self.n_features)
+        np.add.at(counts, [self._index(f) for f in features], 1.0)
+        vector = np.log1p(counts)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(t) for t in texts]
@@ -1,99 +1,272 @@
+import logging
+from functools import lru_cache
+from typing import Any, Callable, Dict
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
 from langgraph.graph import END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 
+from graph.budgets import out_of_time_or_tokens, web_search_exhausted
+from graph.checkpointing import (
+    CHECKPOINT_DB,
+    CheckpointedGraph,
+    get_checkpointer,
+    get_question_threads,
+)
+from graph.metrics import get_metrics_handler, instrument_node, instrument_router
+from batching import get_single_flight
+from graph.semantic_cache import SemanticCache, SemanticCachedGraph
+from graph.serving import ServingGraph
+from graph.speculation import SPECULATIVE_MODE, get_speculator
 from graph.state import GraphState
+from ingestion import get_embeddings
+
+from .constants import (
+    GENERATE,
+    GRADE_DOCUMENTS,
+    GRADE_GENERATION,
+    INIT,
+    RERANK,
+    RETRIEVE,
+    WEBSEARCH,
+)
+from .nodes import (
+    agenerate,
+    agrade_documents,
+    agrade_generation_node,
+    ainit_budgets,
+    arerank,
+    aretrieve_node,
+    aweb_search,
+    generate,
+    grade_documents,
+    grade_generation_node,
+    init_budgets,
+    rerank,
+    retrieve_node,
+    web_search,
+)
+from .nodes.retrieve import retrieve_documents
+from .nodes.web_search import search_web
 
-from .constants import GENERATE, GRADE_DOCUMENTS, RETRIEVE, WEBSEARCH
-from .nodes import generate, grade_documents, retrieve_node, web_search
+from graph.chains.generation_grader import NOT_SUPPORTED, NOT_USEFUL, USEFUL
+from graph.chains.local_router import get_local_router, log_decision
+from graph.chains.router import get_question_router, RouterQuery
 
-from graph.chains.answer_grader import answer_grader
-from graph.chains.hallucination_grader import hallucination_grader
-from graph.chains.router import question_router, RouterQuery
+logger = logging.getLogger(__name__)
 
 
-def route_question(state: GraphState) -> str:
-    print("---ROUTE QUESTION---")
+def _route_locally(state: GraphState) -> Any:
     question = state["question"]
-    source: RouterQuery = question_router.invoke({"question": question})
-    if source.datasource == WEBSEARCH:
-        print("---ROUTE QUESTION TO WEB SEARCH---")
+    if state.get("speculative", SPECULATIVE_MODE):
+        # Both sources are fetched while the routing and grading decisions are made
+        speculator = get_speculator()
+        speculator.start(RETRIEVE, question, lambda: retrieve_documents(question))
+        speculator.start(WEBSEARCH, question, lambda: search_web(question))
+    # The local router answers confident cases without a network round trip
+    return get_local_router().route(question)
+
+
+def _follow_route(state: GraphState, datasource: str) -> str:
+    if datasource == WEBSEARCH and web_search_exhausted(state):
+        logger.debug("Web search budget exhausted, falling back to RAG")
+        datasource = "vectorstore"
+    if datasource == WEBSEARCH:
+        get_speculator().discard(RETRIEVE, state["question"])
         return WEBSEARCH
-    elif source.datasource == "vectorstore":
-        print("---ROUTE QUESTION TO RAG---")
+    elif datasource == "vectorstore":
         return RETRIEVE
 
 
+@instrument_router
+def route_question(state: GraphState) -> str:
+    question = state["question"]
+    datasource = _route_locally(state)
+    if datasource is None:
+        # Requests asking the same question at the same time share one router call
+        source: RouterQuery = get_single_flight("router").do(
+            question, lambda: get_question_router().invoke({"question": question})
+        )
+        datasource = source.datasource
+        log_decision(question, datasource)
+    return _follow_route(state, datasource)
+
+
+@instrument_router
+async def aroute_question(state: GraphState) -> str:
+    question = state["question"]
+    datasource = _route_locally(state)
+    if datasource is None:
+        source: RouterQuery = await get_single_flight("router").ado(
+            question, lambda: get_question_router().ainvoke({"question": question})
+        )
+        datasource = source.datasource
+        log_decision(question, datasource)
+    return _follow_route(state, datasource)
+
+
+@instrument_router
 def decide_to_generate(state: GraphState) -> str:
     """
     Decides whether to generate a response or not
     """
-    return WEBSEARCH if state["web_search"] else GENERATE
+    if state["web_search"]:
+        if not (web_search_exhausted(state) or out_of_time_or_tokens(state)):
+            return WEBSEARCH
+        logger.debug("Budget exhausted, generating from the relevant documents")
+    # The retrieved documents are good enough, a speculative search is not needed
+    get_speculator().discard(WEBSEARCH, state["question"])
+    return GENERATE
 
 
+@instrument_router
 def grade_generation_grounded_in_documents_and_question(state: GraphState) -> str:
-    print("---CHECK HALLUCINATIONS---")
-    question = state["question"]
-    documents = state["documents"]
-    generation = state["generation"]
+    """
+    Follows the verdict of the grade_generation node, unless it ended the run
+    """
+    if state.get("stop_reason"):
+        return END
+    return state["verdict"]
+
+
+# The two routers below only read the state, as coroutines the async graph
+# runs them on the loop instead of handing them to a thread
+
+
+@instrument_router
+async def adecide_to_generate(state: GraphState) -> str:
+    return decide_to_generate.__wrapped__(state)
+
+
+@instrument_router
+async def agrade_generation_grounded_in_documents_and_question(state: GraphState) -> str:
+    return grade_generation_grounded_in_documents_and_question.__wrapped__(state)
+
+
+def build_workflow(
+    nodes: Dict[str, Callable],
+    route: Callable,
+    decide: Callable,
+    follow_verdict: Callable,
+) -> StateGraph:
+    """
+    Wires the nodes and routers of the agentic RAG graph, sync or async
+    """
+    workflow = StateGraph(GraphState)
+    for name, node in nodes.items():
+        workflow.add_node(name, instrument_node(name)(node))
 
-    score = hallucination_grader.invoke(
-        {"documents": documents, "generation": generation}
+    workflow.set_entry_point(INIT)
+    workflow.add_conditional_edges(
+        INIT,
+        route,
+        {
+            WEBSEARCH: WEBSEARCH,
+            RETRIEVE: RETRIEVE,
+        },
+    )
+    workflow.add_edge(RETRIEVE, RERANK)
+    workflow.add_edge(RERANK, GRADE_DOCUMENTS)
+    workflow.add_conditional_edges(
+        GRADE_DOCUMENTS,
+        decide,
+        {
+            WEBSEARCH: WEBSEARCH,
+            GENERATE: GENERATE,
+        },
     )
 
-    if hallucination_grade := score.binary_score:
-        print("---DECISION: GENERATION IS GROUNDED IN DOCUMENTS---")
-        print("---GRADE GENERATION vs QUESTION---")
-        score = answer_grader.invoke({"question": question, "generation": generation})
-        if answer_grade := score.binary_score:
-            print("---DECISION: GENERATION ADDRESSES QUESTION---")
-            return "useful"
-        else:
-            print("---DECISION: GENERATION DOES NOT ADDRESS QUESTION---")
-            return "not useful"
-    else:
-        print("---DECISION: GENERATION IS NOT GROUNDED IN DOCUMENTS, RE-TRY---")
-        return "not supported"
-
-
-workflow = StateGraph(GraphState)
-
-workflow.add_node(RETRIEVE, retrieve_node)
-workflow.add_node(GRADE_DOCUMENTS, grade_documents)
-workflow.add_node(GENERATE, generate)
-workflow.add_node(WEBSEARCH, web_search)
-
-workflow.set_conditional_entry_point(
-    route_question,
+    workflow.add_edge(GENERATE, GRADE_GENERATION)
+    workflow.add_conditional_edges(
+        GRADE_GENERATION,
+        follow_verdict,
+        {
+            NOT_SUPPORTED: GENERATE,
+            USEFUL: END,
+            NOT_USEFUL: WEBSEARCH,
+            END: END,
+        },
+    )
+    workflow.add_edge(WEBSEARCH, GENERATE)
+    return workflow
+
+
+workflow = build_workflow(
     {
-        WEBSEARCH: WEBSEARCH,
-        RETRIEVE: RETRIEVE,
+        INIT: init_budgets,
+        RETRIEVE: retrieve_node,
+        RERANK: rerank,
+        GRADE_DOCUMENTS: grade_documents,
+        GENERATE: generate,
+        WEBSEARCH: web_search,
+        GRADE_GENERATION: grade_generation_node,
     },
-)
-workflow.add_edge(RETRIEVE, GRADE_DOCUMENTS)
-workflow.add_conditional_edges(
-    GRADE_DOCUMENTS,
+    route_question,
     decide_to_generate,
-    {
-        WEBSEARCH: WEBSEARCH,
-        GENERATE: GENERATE,
-    },
+    grade_generation_grounded_in_documents_and_question,
 )
 
-workflow.add_conditional_edges(
-    GENERATE,
-    grade_generation_grounded_in_documents_and_question,
+# Same graph, every node and router a coroutine: one process serves many
+# questions on a single event loop instead of a thread per question
+async_workflow = build_workflow(
     {
-        "not supported": GENERATE,
-        "useful": END,
-        "not useful": WEBSEARCH,
+        INIT: ainit_budgets,
+        RETRIEVE: aretrieve_node,
+        RERANK: arerank,
+        GRADE_DOCUMENTS: agrade_documents,
+        GENERATE: agenerate,
+        WEBSEARCH: aweb_search,
+        GRADE_GENERATION: agrade_generation_node,
     },
+    aroute_question,
+    adecide_to_generate,
+    agrade_generation_grounded_in_documents_and_question,
 )
-workflow.add_edge(WEBSEARCH, GENERATE)
-workflow.add_edge(GENERATE, END)
 
-app = workflow.compile()
 
-app.get_graph().draw_mermaid_png(output_file_path="graph.png")
+@lru_cache(maxsize=None)
+def get_app() -> CompiledStateGraph:
+    """
+    Compiles the workflow on first use, run render.py to draw graph.png. Every
+    LLM call of a run is recorded in the metrics. With CHECKPOINT_DB set, the
+    runs are checkpointed and an unfinished run of a question is resumed.
+    """
+    checkpointer = get_checkpointer() if CHECKPOINT_DB else None
+    app = workflow.compile(checkpointer=checkpointer)
+    app = app.with_config(callbacks=[get_metrics_handler()])
+    return CheckpointedGraph(app, get_question_threads()) if checkpointer else app
+
+
+@lru_cache(maxsize=None)
+def get_async_app() -> CompiledStateGraph:
+    """
+    The async workflow compiled like `get_app`, for `ainvoke`, `astream` and
+    `abatch`. Not checkpointed: the SQLite checkpointer is sync only.
+    """
+    return async_workflow.compile().with_config(callbacks=[get_metrics_handler()])
+
+
+@lru_cache(maxsize=None)
+def get_cached_app() -> SemanticCachedGraph:
+    """
+    The compiled graph behind the semantic answer cache
+    """
+    return SemanticCachedGraph(get_app(), SemanticCache(get_embeddings()))
+
+
+@lru_cache(maxsize=None)
+def get_serving_app() -> ServingGraph:
+    """
+    The cached graph behind request de-duplication, use its `batch` to serve
+    many questions at once
+    """
+    return ServingGraph(get_cached_app())
+
+
+def __getattr__(name: str) -> Any:
+    if name == "app":
+        return get_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
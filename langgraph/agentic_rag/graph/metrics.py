@@ -0,0 +1,356 @@
+"""
+In-memory metrics of the graph: histograms of node, router and LLM wall time,
+counters of tokens, cache lookups and routing decisions, gauges of the LLM
+client queues.
+
+Recording a value is a dict lookup and a bisect under a lock, cheap enough
+to stay on in production. `Metrics.to_prometheus` renders the Prometheus
+text exposition format, `Metrics.to_json_lines` one JSON object per series.
+"""
+
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+# Set to 0 to turn every recording into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+NODE_DURATION = "node_duration_seconds"
+NODE_ERRORS = "node_errors_total"
+ROUTE_DECISIONS = "route_decisions_total"
+LLM_DURATION = "llm_duration_seconds"
+LLM_ERRORS = "llm_errors_total"
+LLM_PROMPT_TOKENS = "llm_prompt_tokens_total"
+LLM_COMPLETION_TOKENS = "llm_completion_tokens_total"
+CACHE_LOOKUPS = "cache_lookups_total"
+LLM_QUEUE_DEPTH = "llm_queue_depth"
+LLM_IN_FLIGHT = "llm_in_flight_requests"
+LLM_QUEUE_WAIT = "llm_queue_wait_seconds"
+LLM_SHED = "llm_requests_shed_total"
+
+Labels = Tuple[Tuple[str, str], ...]
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus layout, `counts[i]` is the
+    number of values in (buckets[i - 1], buckets[i]], the last one is +Inf
+    """
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-th value, the last bound for +Inf
+        """
+        if not self.count:
+            return 0.0
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _render_labels(labels: Labels, extra: str = "") -> str:
+    pairs = [f'{k}="{v}"' for k, v in labels]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metrics:
+    """
+    Registry of labelled histograms, counters and gauges
+
+    Args:
+        buckets: Bucket bounds of every histogram
+        enabled: Whether anything is recorded
+    """
+
+    def __init__(
+        self, buckets: Tuple[float, ...] = LATENCY_BUCKETS, enabled: bool = METRICS_ENABLED
+    ):
+        self.buckets = buckets
+        self.enabled = enabled
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._gauges: Dict[Tuple[str, Labels], float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def inc(self, name: str, amount: float = 1, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self._gauges[key] = value
+
+    def histogram(self, name: str, **labels: Any) -> Optional[Histogram]:
+        return self._histograms.get((name, _labels(labels)))
+
+    def counter(self, name: str, **labels: Any) -> float:
+        return self._counters.get((name, _labels(labels)), 0)
+
+    def gauge(self, name: str, **labels: Any) -> float:
+        return self._gauges.get((name, _labels(labels)), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def _snapshot(self) -> Tuple[Dict[Tuple[str, Labels], Histogram], Dict, Dict]:
+        with self._lock:
+            histograms = {}
+            for key, histogram in self._histograms.items():
+                copy = histograms[key] = Histogram(histogram.buckets)
+                copy.counts = list(histogram.counts)
+                copy.sum, copy.count = histogram.sum, histogram.count
+            return histograms, dict(self._counters), dict(self._gauges)
+
+    def to_prometheus(self) -> str:
+        histograms, counters, gauges = self._snapshot()
+        lines: List[str] = []
+        typed = set()
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for (name, labels), value in sorted(values.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_render_labels(labels)} {value:g}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                bucket_labels = _render_labels(labels, f'le="{bound:g}"')
+                lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+            inf_labels = _render_labels(labels, 'le="+Inf"')
+            lines.append(f"{name}_bucket{inf_labels} {histogram.count}")
+            lines.append(f"{name}_sum{_render_labels(labels)} {histogram.sum:g}")
+            lines.append(f"{name}_count{_render_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def to_json_lines(self) -> str:
+        histograms, counters, gauges = self._snapshot()
+        records = [
+            {"name": name, "labels": dict(labels), "type": kind, "value": value}
+            for kind, values in (("counter", counters), ("gauge", gauges))
+            for (name, labels), value in sorted(values.items())
+        ]
+        records += [
+            {
+                "name": name,
+                "labels": dict(labels),
+                "type": "histogram",
+                "buckets": list(histogram.buckets),
+                "counts": histogram.counts,
+                "sum": histogram.sum,
+                "count": histogram.count,
+            }
+            for (name, labels), histogram in sorted(histograms.items())
+        ]
+        return "".join(json.dumps(record) + "\n" for record in records)
+
+
+@lru_cache(maxsize=None)
+def get_metrics() -> Metrics:
+    """
+    The registry every node, router, cache and LLM call records into
+    """
+    return Metrics()
+
+
+def record_cache(cache: str, hit: bool, count: int = 1) -> None:
+    if count:
+        get_metrics().inc(CACHE_LOOKUPS, count, cache=cache, result="hit" if hit else "miss")
+
+
+def _timed(name: str, on_result: Callable[[Any], None]) -> Callable[[F], F]:
+    def decorator(function: F) -> F:
+        def record(start: float, failed: bool) -> None:
+            metrics = get_metrics()
+            if failed:
+                metrics.inc(NODE_ERRORS, node=name)
+            metrics.observe(NODE_DURATION, time.perf_counter() - start, node=name)
+
+        # functools.wraps keeps the signature LangGraph inspects for config and writer
+        if inspect.iscoroutinefunction(function):
+
+            @functools.wraps(function)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                start = time.perf_counter()
+                try:
+                    result = await function(*args, **kwargs)
+                except BaseException:
+                    record(start, failed=True)
+                    raise
+                record(start, failed=False)
+                on_result(result)
+                return result
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                record(start, failed=True)
+                raise
+            record(start, failed=False)
+            on_result(result)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def instrument_node(name: str) -> Callable[[F], F]:
+    """
+    Records the wall time and the failures of a node under `node=name`
+    """
+    return _timed(name, lambda result: None)
+
+
+def instrument_router(function: F) -> F:
+    """
+    Records the wall time of a router like a node, and counts its decisions
+    """
+    name = function.__name__
+    return _timed(
+        name,
+        lambda decision: get_metrics().inc(ROUTE_DECISIONS, router=name, decision=decision),
+    )(function)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """
+    Records the latency, the token usage and the failures of every LLM call
+    made under it, labelled by model
+    """
+
+    # Called in the thread of the LLM call, the recording is cheap
+    run_inline = True
+
+    def __init__(self, metrics: Optional[Metrics] = None):
+        self.metrics = metrics if metrics is not None else get_metrics()
+        self._started: Dict[UUID, Tuple[str, float]] = {}
+
+    def _start(self, run_id: UUID, metadata: Optional[Dict[str, Any]]) -> None:
+        model = (metadata or {}).get("ls_model_name", "unknown")
+        self._started[run_id] = (model, time.perf_counter())
+
+    def on_llm_start(
+        self,
+        serialized: Dict[str, Any],
+        prompts: List[str],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, metadata)
+
+    def on_chat_model_start(
+        self,
+        serialized: Dict[str, Any],
+        messages: List[List[Any]],
+        *,
+        run_id: UUID,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> None:
+        self._start(run_id, metadata)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        if started is None:
+            return
+        model, start = started
+        self.metrics.observe(LLM_DURATION, time.perf_counter() - start, model=model)
+        prompt_tokens, completion_tokens = _token_usage(response)
+        self.metrics.inc(LLM_PROMPT_TOKENS, prompt_tokens, model=model)
+        self.metrics.inc(LLM_COMPLETION_TOKENS, completion_tokens, model=model)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        started = self._started.pop(run_id, None)
+        model = started[0] if started else "unknown"
+        self.metrics.inc(LLM_ERRORS, model=model)
+
+
+def _token_usage(response: LLMResult) -> Tuple[int, int]:
+    """
+    Prompt and completion tokens from the message usage metadata, or from
+    the provider's token_usage for models that do not report it
+    """
+    prompt_tokens = completion_tokens = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if usage:
+                found = True
+                prompt_tokens += usage.get("input_tokens", 0)
+                completion_tokens += usage.get("output_tokens", 0)
+    if not found:
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        prompt_tokens = usage.get("prompt_tokens", 0)
+        completion_tokens = usage.get("completion_tokens", 0)
+    return prompt_tokens, completion_tokens
+
+
+@lru_cache(maxsize=None)
+def get_metrics_handler() -> MetricsCallbackHandler:
+    return MetricsCallbackHandler()
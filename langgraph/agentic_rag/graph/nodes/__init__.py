@@ -1,6 +1,24 @@
-from .generate import generate
-from .grade_documents import grade_documents
-from .retrieve import retrieve_node
-from .web_search import web_search
+from .generate import agenerate, generate
+from .grade_documents import agrade_documents, grade_documents
+from .grade_generation import agrade_generation_node, grade_generation_node
+from .init_budgets import ainit_budgets, init_budgets
+from .rerank import arerank, rerank
+from .retrieve import aretrieve_node, retrieve_node
+from .web_search import aweb_search, web_search
 
-__all__ = ["generate", "grade_documents", "web_search", "retrieve_node"]
+__all__ = [
+    "generate",
+    "grade_documents",
+    "grade_generation_node",
+    "init_budgets",
+    "rerank",
+    "web_search",
+    "retrieve_node",
+    "agenerate",
+    "agrade_documents",
+    "agrade_generation_node",
+    "ainit_budgets",
+    "arerank",
+    "aweb_search",
+    "aretrieve_node",
+]
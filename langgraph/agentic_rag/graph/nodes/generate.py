@@ -1,19 +1,98 @@
-from typing import Any, Dict
+import time
+from typing import Any, Dict, List, Optional
 
 from dotenv import load_dotenv
+from langgraph.config import get_stream_writer
 
 load_dotenv()
+from graph.constants import GENERATE
+from graph.context_packing import get_context_packer
+from graph.documents import load_documents, store_documents
 from graph.state import GraphState
+from graph.tokens import count_tokens, total_tokens, track_usage
 
-from ..chains.generate import generation_chain
+from ..chains.generate import get_generation_chain
 
 
 def generate(state: GraphState) -> Dict[str, Any]:
     """
-    Generates a response to the user's question
+    Generates a response to the user's question. The tokens are forwarded to
+    the callers of `app.stream(..., stream_mode="custom")` as they arrive, the
+    graders only ever see the completed text.
     """
-    print("--- GENERATE NODE ---")
     question = state["question"]
-    documents = state["documents"]
-    result = generation_chain.invoke({"question": question, "context": documents})
-    return {"generation": result, "question": question, "documents": documents}
+    documents = load_documents(state["documents"])
+    # Only the most relevant, deduplicated documents that fit the budget are sent
+    packed = get_context_packer().pack(documents)
+    # A no-op unless the caller streams the "custom" mode
+    write = get_stream_writer()
+    generation = state.get("generations", 0) + 1
+    chunks = []
+    first_token_at = None
+    start = time.time()
+    with track_usage() as usage:
+        for chunk in get_generation_chain().stream(
+            {"question": question, "context": packed.documents}
+        ):
+            if first_token_at is None and chunk:
+                first_token_at = time.time()
+            chunks.append(chunk)
+            write({"node": GENERATE, "generation": generation, "token": chunk})
+    return _generated(state, packed, chunks, usage, start, first_token_at)
+
+
+async def agenerate(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    packed = get_context_packer().pack(load_documents(state["documents"]))
+    write = get_stream_writer()
+    generation = state.get("generations", 0) + 1
+    chunks = []
+    first_token_at = None
+    start = time.time()
+    with track_usage() as usage:
+        async for chunk in get_generation_chain().astream(
+            {"question": question, "context": packed.documents}
+        ):
+            if first_token_at is None and chunk:
+                first_token_at = time.time()
+            chunks.append(chunk)
+            write({"node": GENERATE, "generation": generation, "token": chunk})
+    return _generated(state, packed, chunks, usage, start, first_token_at)
+
+
+def _generated(
+    state: GraphState,
+    packed: Any,
+    chunks: List[str],
+    usage: Any,
+    start: float,
+    first_token_at: Optional[float],
+) -> Dict[str, Any]:
+    end = time.time()
+    question = state["question"]
+    generation = state.get("generations", 0) + 1
+    result = "".join(chunks)
+
+    # The documents are left as they are, not written again; the grader reads
+    # the packed context back instead of packing the documents a second time
+    update = {
+        "generation": result,
+        "question": question,
+        "generations": generation,
+        "context": store_documents(packed.documents),
+        "context_tokens_saved": packed.tokens_saved,
+        "tokens_used": state.get("tokens_used", 0) + total_tokens(usage),
+        "prompt_tokens_saved": state.get("prompt_tokens_saved", 0)
+        + packed.tokens_saved,
+    }
+    if first_token_at is not None:
+        decoding = end - first_token_at
+        # Streamed OpenAI calls report their output tokens, tiktoken counts the others
+        output_tokens = sum(
+            u.get("output_tokens", 0) for u in usage.usage_metadata.values()
+        ) or count_tokens(result)
+        update["tokens_per_s"] = output_tokens / decoding if decoding else 0.0
+        if state.get("ttft_s") is None:
+            # Perceived latency: from the start of the request to its first token
+            update["ttft_s"] = first_token_at - state.get("started_at", start)
+    return update
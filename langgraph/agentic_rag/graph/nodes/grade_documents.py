@@ -1,7 +1,272 @@
-from typing import Any, Dict
+import asyncio
+import hashlib
+import os
+from concurrent.futures import FIRST_COMPLETED, wait
+from typing import Any, Dict, List, Set, Tuple
 
-from graph.chains.retrieval_grader import retrieval_grader
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from batching import SingleFlight, get_single_flight
+from graph.chains.retrieval_grader import (
+    BATCH_GRADER_TOKEN_BUDGET,
+    GradeDocuments,
+    format_chunks,
+    get_batch_retrieval_grader,
+    get_retrieval_grader,
+    split_into_batches,
+)
+from graph.documents import load_documents, store_documents
 from graph.state import GraphState
+from graph.tokens import total_tokens, track_usage
+
+# Maximum number of grader calls in flight at the same time
+GRADER_MAX_CONCURRENCY = int(os.getenv("GRADER_MAX_CONCURRENCY", "8"))
+# Stop grading as soon as this many relevant chunks were found (0 = grade all of them)
+GRADER_MIN_RELEVANT = int(os.getenv("GRADER_MIN_RELEVANT", "0"))
+# "per_document" grades every chunk in its own call, "batched" grades them all at once
+GRADER_MODE = os.getenv("GRADER_MODE", "per_document")
+# Number of (question, chunk) grades shared with later requests
+RELEVANCE_GRADE_CACHE_SIZE = int(os.getenv("RELEVANCE_GRADE_CACHE_SIZE", "4096"))
+# Seconds a (question, chunk) grade is reused
+RELEVANCE_GRADE_CACHE_TTL = float(os.getenv("RELEVANCE_GRADE_CACHE_TTL", "3600"))
+
+
+def get_relevance_grades() -> SingleFlight:
+    """
+    The (question, chunk) grades in flight or recently given, shared by every request
+    """
+    return get_single_flight(
+        "relevance", RELEVANCE_GRADE_CACHE_SIZE, RELEVANCE_GRADE_CACHE_TTL
+    )
+
+
+def pair_key(question: str, document: Any) -> Tuple[str, str]:
+    text = getattr(document, "page_content", str(document))
+    return question, hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def grade_concurrently(
+    grader: Runnable,
+    question: str,
+    documents: List[Any],
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+    min_relevant: int = GRADER_MIN_RELEVANT,
+) -> Tuple[List[Any], bool]:
+    """
+    Grades every document against the question with at most `max_concurrency`
+    grader calls in flight.
+
+    Args:
+        grader: Runnable returning an object with a 'yes' / 'no' binary_score
+        question: The user question
+        documents: The retrieved documents
+        max_concurrency: Upper bound of concurrent grader calls
+        min_relevant: Stop early once this many relevant documents were found
+
+    Returns:
+        The relevant documents (in retrieval order) and whether a web search is needed
+    """
+    relevant: Dict[int, bool] = {}
+    stopped_early = False
+    executor = ContextThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    try:
+        pending = {
+            executor.submit(grader.invoke, {"documents": d, "question": question}): i
+            for i, d in enumerate(documents)
+        }
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                relevant[pending.pop(future)] = future.result().binary_score == "yes"
+            if min_relevant and sum(relevant.values()) >= min_relevant:
+                stopped_early = True
+                break
+    finally:
+        # Drops the calls that have not started yet when we stopped early
+        executor.shutdown(wait=not stopped_early, cancel_futures=True)
+
+    filtered_docs = [d for i, d in enumerate(documents) if relevant.get(i)]
+    # Enough relevant chunks were found, the ungraded ones do not matter
+    web_search = False if stopped_early else not all(relevant.values())
+    return filtered_docs, web_search
+
+
+async def agrade_concurrently(
+    grader: Runnable,
+    question: str,
+    documents: List[Any],
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+    min_relevant: int = GRADER_MIN_RELEVANT,
+) -> Tuple[List[Any], bool]:
+    """
+    `grade_concurrently` on the event loop, the calls still running when it
+    stops early are cancelled
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def grade(i: int, document: Any) -> Tuple[int, bool]:
+        async with semaphore:
+            result = await grader.ainvoke({"documents": document, "question": question})
+        return i, result.binary_score == "yes"
+
+    relevant: Dict[int, bool] = {}
+    stopped_early = False
+    tasks = [asyncio.ensure_future(grade(i, d)) for i, d in enumerate(documents)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            i, is_relevant = await next_done
+            relevant[i] = is_relevant
+            if min_relevant and sum(relevant.values()) >= min_relevant:
+                stopped_early = True
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    filtered_docs = [d for i, d in enumerate(documents) if relevant.get(i)]
+    web_search = False if stopped_early else not all(relevant.values())
+    return filtered_docs, web_search
+
+
+def _batch_input(question: str, documents: List[Any], indexes: List[int]) -> Dict[str, Any]:
+    return {"chunks": format_chunks([documents[i] for i in indexes]), "question": question}
+
+
+def _relevant_indexes(result: Any, indexes: List[int]) -> List[int]:
+    # Chunk ids are positions inside the batch, ids the model left out count as 'no'
+    return [
+        indexes[s.chunk_id]
+        for s in result.scores
+        if s.binary_score == "yes" and 0 <= s.chunk_id < len(indexes)
+    ]
+
+
+def grade_batched(
+    grader: Runnable,
+    question: str,
+    documents: List[Any],
+    token_budget: int = BATCH_GRADER_TOKEN_BUDGET,
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+) -> Tuple[List[Any], bool]:
+    """
+    Grades the documents with as few structured output calls as the token
+    budget allows, the batches are graded concurrently
+
+    Args:
+        grader: Runnable returning a `GradeDocumentsBatch` for formatted chunks
+        question: The user question
+        documents: The retrieved documents
+        token_budget: Maximum tokens of chunk text per call
+        max_concurrency: Upper bound of concurrent grader calls
+
+    Returns:
+        The relevant documents (in retrieval order) and whether a web search is needed
+    """
+    batches = split_into_batches(documents, token_budget)
+
+    def grade_batch(indexes: List[int]) -> List[int]:
+        result = grader.invoke(_batch_input(question, documents, indexes))
+        return _relevant_indexes(result, indexes)
+
+    with ContextThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        relevant = {i for batch in executor.map(grade_batch, batches) for i in batch}
+
+    filtered_docs = [d for i, d in enumerate(documents) if i in relevant]
+    return filtered_docs, len(filtered_docs) < len(documents)
+
+
+async def agrade_batched(
+    grader: Runnable,
+    question: str,
+    documents: List[Any],
+    token_budget: int = BATCH_GRADER_TOKEN_BUDGET,
+    max_concurrency: int = GRADER_MAX_CONCURRENCY,
+) -> Tuple[List[Any], bool]:
+    """
+    `grade_batched` with the batches graded by one `abatch` call
+    """
+    batches = split_into_batches(documents, token_budget)
+    results = await grader.abatch(
+        [_batch_input(question, documents, indexes) for indexes in batches],
+        {"max_concurrency": max(1, max_concurrency)},
+    )
+    relevant = {
+        i
+        for result, indexes in zip(results, batches)
+        for i in _relevant_indexes(result, indexes)
+    }
+    filtered_docs = [d for i, d in enumerate(documents) if i in relevant]
+    return filtered_docs, len(filtered_docs) < len(documents)
+
+
+def share_grades(grader: Runnable) -> Runnable:
+    """
+    The per document grader behind the shared grades, a pair graded by a
+    concurrent or recent request is not graded again
+    """
+    grades = get_relevance_grades()
+
+    def grade(inputs: Dict[str, Any]) -> Any:
+        key = pair_key(inputs["question"], inputs["documents"])
+        return grades.do(key, lambda: grader.invoke(inputs))
+
+    async def agrade(inputs: Dict[str, Any]) -> Any:
+        key = pair_key(inputs["question"], inputs["documents"])
+        return await grades.ado(key, lambda: grader.ainvoke(inputs))
+
+    return RunnableLambda(grade, afunc=agrade)
+
+
+def _share_batch_grades(
+    question: str, ungraded: List[Any], filtered: List[Any]
+) -> Set[int]:
+    grades = get_relevance_grades()
+    relevant = {id(d) for d in filtered}
+    for d in ungraded:
+        score = "yes" if id(d) in relevant else "no"
+        grades.put(pair_key(question, d), GradeDocuments(binary_score=score))
+    return relevant
+
+
+def _merge_grades(
+    documents: List[Any], known: List[Any], relevant: Set[int]
+) -> Tuple[List[Any], bool]:
+    filtered_docs = [
+        d
+        for d, grade in zip(documents, known)
+        if (grade.binary_score == "yes" if grade is not None else id(d) in relevant)
+    ]
+    return filtered_docs, len(filtered_docs) < len(documents)
+
+
+def grade_batched_shared(
+    grader: Runnable, question: str, documents: List[Any]
+) -> Tuple[List[Any], bool]:
+    """
+    `grade_batched` of the chunks without a shared grade, the new grades are shared
+    """
+    grades = get_relevance_grades()
+    known = [grades.get(pair_key(question, d)) for d in documents]
+    ungraded = [d for d, grade in zip(documents, known) if grade is None]
+    relevant: Set[int] = set()
+    if ungraded:
+        filtered, _ = grade_batched(grader, question, ungraded)
+        relevant = _share_batch_grades(question, ungraded, filtered)
+    return _merge_grades(documents, known, relevant)
+
+
+async def agrade_batched_shared(
+    grader: Runnable, question: str, documents: List[Any]
+) -> Tuple[List[Any], bool]:
+    grades = get_relevance_grades()
+    known = [grades.get(pair_key(question, d)) for d in documents]
+    ungraded = [d for d, grade in zip(documents, known) if grade is None]
+    relevant: Set[int] = set()
+    if ungraded:
+        filtered, _ = await agrade_batched(grader, question, ungraded)
+        relevant = _share_batch_grades(question, ungraded, filtered)
+    return _merge_grades(documents, known, relevant)
 
 
 def grade_documents(state: GraphState) -> Dict[str, Any]:
@@ -15,19 +280,44 @@ def grade_documents(state: GraphState) -> Dict[str, Any]:
     Returns:
         state (dict): Filtered out irrelevant documents and updated web_search state
     """
-    print("--- GRADE DOCUMENTS NODE ---")
     question = state["question"]
-    documents = state["documents"]
+    documents = load_documents(state["documents"])
+
+    with track_usage() as usage:
+        if state.get("grader_mode", GRADER_MODE) == "batched":
+            filtered_docs, web_search = grade_batched_shared(
+                get_batch_retrieval_grader(), question, documents
+            )
+        else:
+            filtered_docs, web_search = grade_concurrently(
+                share_grades(get_retrieval_grader()), question, documents
+            )
+    return _graded(state, filtered_docs, web_search, usage)
+
 
-    filtered_docs = []
-    web_search = False
+async def agrade_documents(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    documents = load_documents(state["documents"])
 
-    for d in documents:
-        result = retrieval_grader.invoke({"documents": d, "question": question})
-        if result.binary_score == "yes":
-            filtered_docs.append(d)
+    with track_usage() as usage:
+        if state.get("grader_mode", GRADER_MODE) == "batched":
+            filtered_docs, web_search = await agrade_batched_shared(
+                get_batch_retrieval_grader(), question, documents
+            )
         else:
-            web_search = True
-            continue
+            filtered_docs, web_search = await agrade_concurrently(
+                share_grades(get_retrieval_grader()), question, documents
+            )
+    return _graded(state, filtered_docs, web_search, usage)
+
 
-    return {"documents": filtered_docs, "web_search": web_search, "question": question}
+def _graded(
+    state: GraphState, filtered_docs: List[Any], web_search: bool, usage: Any
+) -> Dict[str, Any]:
+    return {
+        "documents": store_documents(filtered_docs),
+        # Nothing relevant survived (or was retrieved), the web has to answer
+        "web_search": web_search or not filtered_docs,
+        "question": state["question"],
+        "tokens_used": state.get("tokens_used", 0) + total_tokens(usage),
+    }
@@ -0,0 +1,109 @@
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from graph.budgets import ANSWERED, exhausted_budget, out_of_time_or_tokens
+from graph.chains.generation_grader import (
+    CONCURRENT_GENERATION_GRADING,
+    NOT_SUPPORTED,
+    NOT_USEFUL,
+    USEFUL,
+    agrade_generation,
+    grade_generation,
+)
+from graph.context_packing import get_context_packer
+from graph.documents import load_documents
+from graph.state import GraphState
+from graph.tokens import total_tokens, track_usage
+
+logger = logging.getLogger(__name__)
+
+
+def grade_generation_node(state: GraphState) -> Dict[str, Any]:
+    """
+    Grades the generation against the documents and the question, keeps the
+    best answer so far and ends the run when a budget does not allow acting
+    on the verdict
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): The verdict, the spent tokens and, once the run is over,
+        the stop reason with the best generation so far
+    """
+    if stopped := _stop_before_grading(state):
+        return stopped
+    context, tokens_saved = _context(state)
+    with track_usage() as usage:
+        verdict = grade_generation(
+            state["question"],
+            context,
+            state["generation"],
+            state.get("concurrent_grading", CONCURRENT_GENERATION_GRADING),
+        )
+    return _act_on_verdict(state, verdict, tokens_saved, usage)
+
+
+async def agrade_generation_node(state: GraphState) -> Dict[str, Any]:
+    if stopped := _stop_before_grading(state):
+        return stopped
+    context, tokens_saved = _context(state)
+    with track_usage() as usage:
+        verdict = await agrade_generation(
+            state["question"],
+            context,
+            state["generation"],
+            state.get("concurrent_grading", CONCURRENT_GENERATION_GRADING),
+        )
+    return _act_on_verdict(state, verdict, tokens_saved, usage)
+
+
+def _context(state: GraphState) -> Tuple[List[Any], int]:
+    # The hallucination grader checks the generation against the very documents
+    # the generate node packed into its prompt
+    if state.get("context") is not None:
+        return load_documents(state["context"]), state.get("context_tokens_saved", 0)
+    # Checkpointed before the generate node kept its context
+    packed = get_context_packer().pack(load_documents(state["documents"]))
+    return packed.documents, packed.tokens_saved
+
+
+def _stop_before_grading(state: GraphState) -> Optional[Dict[str, Any]]:
+    if reason := out_of_time_or_tokens(state):
+        # Grading would only spend more, answer with the best generation so far
+        logger.debug("%s budget exhausted before grading", reason)
+        return {
+            "verdict": None,
+            "stop_reason": reason,
+            "generation": state.get("grounded_generation") or state["generation"],
+        }
+    return None
+
+
+def _act_on_verdict(
+    state: GraphState, verdict: str, tokens_saved: int, usage: Any
+) -> Dict[str, Any]:
+    generation = state["generation"]
+    update: Dict[str, Any] = {
+        "verdict": verdict,
+        "tokens_used": state.get("tokens_used", 0) + total_tokens(usage),
+        "prompt_tokens_saved": state.get("prompt_tokens_saved", 0) + tokens_saved,
+    }
+    if verdict == USEFUL:
+        update["stop_reason"] = ANSWERED
+        return update
+    if verdict == NOT_USEFUL:
+        # Grounded in the documents, the best fallback answer so far
+        update["grounded_generation"] = generation
+        # The next web search must run even if the documents were all relevant
+        update["web_search"] = True
+
+    if reason := exhausted_budget({**state, **update}, verdict):
+        logger.debug("%s budget exhausted after a %s verdict", reason, verdict)
+        update["stop_reason"] = reason
+        update["generation"] = (
+            update.get("grounded_generation")
+            or state.get("grounded_generation")
+            or generation
+        )
+    return update
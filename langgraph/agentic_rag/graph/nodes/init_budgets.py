@@ -0,0 +1,37 @@
+import time
+from typing import Any, Dict
+
+from graph.budgets import (
+    MAX_REGENERATIONS,
+    MAX_TOKENS_PER_REQUEST,
+    MAX_WEB_SEARCHES,
+    REQUEST_DEADLINE_S,
+)
+from graph.state import GraphState
+
+
+def init_budgets(state: GraphState) -> Dict[str, Any]:
+    """
+    Starts the request clock and resolves the budgets of the request, the
+    values given in the input state win over the defaults
+    """
+    started_at = time.time()
+    deadline_s = state.get("deadline_s", REQUEST_DEADLINE_S)
+    return {
+        "started_at": started_at,
+        "deadline": started_at + deadline_s if deadline_s is not None else None,
+        "max_regenerations": state.get("max_regenerations", MAX_REGENERATIONS),
+        "max_web_searches": state.get("max_web_searches", MAX_WEB_SEARCHES),
+        "max_tokens": state.get("max_tokens", MAX_TOKENS_PER_REQUEST),
+        "generations": 0,
+        "web_searches": 0,
+        "tokens_used": 0,
+        "prompt_tokens_saved": 0,
+        "stop_reason": None,
+        "ttft_s": None,
+    }
+
+
+async def ainit_budgets(state: GraphState) -> Dict[str, Any]:
+    # Nothing to await, but a sync node would cost the async graph a thread hop
+    return init_budgets(state)
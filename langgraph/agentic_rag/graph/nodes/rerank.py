@@ -0,0 +1,110 @@
+import asyncio
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+
+from graph.documents import load_documents
+from graph.state import GraphState
+from ingestion import get_embeddings
+
+# Number of chunks kept for grading
+RERANK_K = int(os.getenv("RERANK_K", "4"))
+# Relevance vs diversity trade off of MMR, 1 ranks by relevance only
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Chunks whose cosine similarity to the question is below this are dropped
+RERANK_SCORE_CUTOFF = float(os.getenv("RERANK_SCORE_CUTOFF", "0.2"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def mmr_select(
+    query: np.ndarray,
+    candidates: np.ndarray,
+    k: int = RERANK_K,
+    lambda_mult: float = MMR_LAMBDA,
+    score_cutoff: float = RERANK_SCORE_CUTOFF,
+) -> List[int]:
+    """
+    Maximal marginal relevance over cosine similarities
+
+    Args:
+        query: The (dim,) question vector
+        candidates: The (n, dim) chunk vectors
+        k: Maximum number of chunks selected
+        lambda_mult: Weight of the relevance against the redundancy with the
+            chunks already selected
+        score_cutoff: Minimum similarity to the question
+
+    Returns:
+        The indexes of the selected chunks, in selection order
+    """
+    if not len(candidates):
+        return []
+    candidates = _normalize(np.asarray(candidates, dtype=np.float32))
+    relevance = candidates @ _normalize(np.asarray(query, dtype=np.float32))
+    eligible = relevance >= score_cutoff
+    # Highest similarity of every candidate to the chunks selected so far
+    redundancy = np.zeros(len(candidates), dtype=np.float32)
+    selected: List[int] = []
+    while len(selected) < k and eligible.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        best = int(np.argmax(np.where(eligible, scores, -np.inf)))
+        selected.append(best)
+        eligible[best] = False
+        redundancy = np.maximum(redundancy, candidates @ candidates[best])
+    return selected
+
+
+def rerank(state: GraphState) -> Dict[str, Any]:
+    """
+    Keeps the most relevant, least redundant retrieved chunks so fewer of them
+    reach the grader. The chunk vectors come from the embedding cache filled
+    at ingestion, the question one from the retrieval.
+
+    Args:
+        state (dict): The current graph state
+
+    Returns:
+        state (dict): The selected documents, most relevant first
+    """
+    question = state["question"]
+    refs = state["documents"]
+    if not refs:
+        return {"documents": refs}
+
+    documents = load_documents(refs)
+    embeddings = get_embeddings()
+    selected = mmr_select(
+        np.asarray(embeddings.embed_query(question)),
+        np.asarray(embeddings.embed_documents([d.page_content for d in documents])),
+        state.get("rerank_k", RERANK_K),
+        state.get("mmr_lambda", MMR_LAMBDA),
+        state.get("rerank_cutoff", RERANK_SCORE_CUTOFF),
+    )
+    return {"documents": [refs[i] for i in selected]}
+
+
+async def arerank(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    refs = state["documents"]
+    if not refs:
+        return {"documents": refs}
+
+    documents = load_documents(refs)
+    embeddings = get_embeddings()
+    query, candidates = await asyncio.gather(
+        embeddings.aembed_query(question),
+        embeddings.aembed_documents([d.page_content for d in documents]),
+    )
+    selected = mmr_select(
+        np.asarray(query),
+        np.asarray(candidates),
+        state.get("rerank_k", RERANK_K),
+        state.get("mmr_lambda", MMR_LAMBDA),
+        state.get("rerank_cutoff", RERANK_SCORE_CUTOFF),
+    )
+    return {"documents": [refs[i] for i in selected]}
@@ -1,17 +1,62 @@
-from typing import Any, Dict
+import asyncio
+import os
+from functools import lru_cache
+from typing import Any, Dict, List
 
 from dotenv import load_dotenv
+from langchain_core.documents import Document
+from langchain_core.runnables.config import ContextThreadPoolExecutor
 
+from graph.constants import RETRIEVE
+from graph.documents import store_documents
+from graph.speculation import get_speculator
 from graph.state import GraphState
-from ingestion import retriever
+from ingestion import get_retriever
 
+# Threads running the blocking vector store queries of the async graph
+RETRIEVER_MAX_THREADS = int(os.getenv("RETRIEVER_MAX_THREADS", "8"))
 
-def retrieve_node(state: GraphState) -> Dict[str, Any]:
-    print("--- RETRIVE NODE ---")
 
-    question = state["question"]
+def retrieve_documents(question: str) -> List[Document]:
     # Gets the relevant documents from the ChromaDB embeddings
-    documents = retriever.invoke(question)
+    return get_retriever().invoke(question)
+
+
+@lru_cache(maxsize=None)
+def get_blocking_executor() -> ContextThreadPoolExecutor:
+    """
+    The bounded pool the async graph runs Chroma queries on. Chroma has no
+    async client, a query awaited on the loop itself would stall every other
+    request, and on the default executor it would compete with everything
+    else offloaded there.
+    """
+    return ContextThreadPoolExecutor(
+        max_workers=RETRIEVER_MAX_THREADS, thread_name_prefix="retriever"
+    )
+
+
+async def aretrieve_documents(question: str) -> List[Document]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_blocking_executor(), retrieve_documents, question
+    )
+
 
-    # Updates the state with the retrieved documents
-    return {"documents": documents, "question": question}
+def retrieve_node(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    # Reuses the retrieval started during routing in speculative mode
+    speculative = get_speculator().take(RETRIEVE, question)
+    documents = speculative.result() if speculative else retrieve_documents(question)
+
+    # Updates the state with the references of the retrieved documents
+    return {"documents": store_documents(documents), "question": question}
+
+
+async def aretrieve_node(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    speculative = get_speculator().take(RETRIEVE, question)
+    if speculative:
+        documents = await asyncio.wrap_future(speculative)
+    else:
+        documents = await aretrieve_documents(question)
+    return {"documents": store_documents(documents), "question": question}
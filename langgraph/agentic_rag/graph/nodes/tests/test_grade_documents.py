@@ -0,0 +1,54 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+from ..grade_documents import grade_concurrently
+
+
+def make_grader(relevant_words, latency=0.0):
+    lock = threading.Lock()
+    stats = {"calls": 0, "in_flight": 0, "max_in_flight": 0}
+
+    def grade(inputs):
+        with lock:
+            stats["calls"] += 1
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        time.sleep(latency)
+        with lock:
+            stats["in_flight"] -= 1
+        relevant = any(w in inputs["documents"].page_content for w in relevant_words)
+        return SimpleNamespace(binary_score="yes" if relevant else "no")
+
+    return RunnableLambda(grade), stats
+
+
+def test_grade_concurrently_keeps_retrieval_order() -> None:
+    documents = [Document(page_content=f"memory {i}") for i in range(6)]
+    documents.append(Document(page_content="pizza"))
+    grader, stats = make_grader(["memory"], latency=0.01)
+
+    filtered, web_search = grade_concurrently(
+        grader, "agent memory", documents, max_concurrency=3
+    )
+
+    assert filtered == documents[:6]
+    assert web_search is True
+    assert stats["calls"] == 7
+    assert 1 < stats["max_in_flight"] <= 3
+
+
+def test_grade_concurrently_stops_early() -> None:
+    documents = [Document(page_content=f"memory {i}") for i in range(20)]
+    grader, stats = make_grader(["memory"], latency=0.01)
+
+    filtered, web_search = grade_concurrently(
+        grader, "agent memory", documents, max_concurrency=2, min_relevant=2
+    )
+
+    assert len(filtered) >= 2
+    assert web_search is False
+    assert stats["calls"] < 20
@@ -0,0 +1,30 @@
+import numpy as np
+
+from ..rerank import mmr_select
+
+
+def test_mmr_skips_near_duplicates() -> None:
+    query = np.array([1.0, 0.0, 0.0])
+    candidates = np.array(
+        [
+            [0.9, 0.1, 0.0],
+            [0.9, 0.11, 0.0],  # Near copy of the first chunk
+            [0.7, 0.0, 0.7],
+            [0.0, 1.0, 0.0],  # Unrelated to the question
+        ]
+    )
+
+    diverse = mmr_select(query, candidates, k=2, lambda_mult=0.3, score_cutoff=0.1)
+    # Relevance only keeps the duplicates
+    relevant = mmr_select(query, candidates, k=2, lambda_mult=1.0, score_cutoff=0.1)
+
+    assert diverse == [0, 2]
+    assert relevant == [0, 1]
+
+
+def test_cutoff_drops_irrelevant_chunks() -> None:
+    query = np.array([1.0, 0.0])
+    candidates = np.array([[1.0, 0.0], [0.0, 1.0], [0.1, 1.0]])
+
+    assert mmr_select(query, candidates, k=3, lambda_mult=0.7, score_cutoff=0.5) == [0]
+    assert mmr_select(query, np.zeros((0, 2)), k=3) == []
@@ -0,0 +1,87 @@
+import sys
+
+from langchain_core.documents import Document
+
+from graph.documents import load_documents, store_documents
+
+from ..web_search import WebSearchCache, normalize_query, to_documents
+
+
+class FakeSearchTool:
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, query):
+        self.queries.append(query)
+        results = [("a", "agent memory", 1), ("b", "more memory", 0)]
+        return {
+            "query": query,
+            "results": [
+                {"url": f"https://{n}", "title": n.upper(), "content": c, "score": s}
+                for n, c, s in results
+            ],
+        }
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_every_result_is_its_own_document() -> None:
+    documents = to_documents(FakeSearchTool()("agent memory"))
+
+    assert [d.page_content for d in documents] == ["agent memory", "more memory"]
+    assert documents[0].metadata == {"url": "https://a", "title": "A", "score": 1}
+
+
+def test_normalized_queries_share_cached_results() -> None:
+    tool = FakeSearchTool()
+    cache = WebSearchCache(tool)
+
+    first = cache.search("What is agent memory?")
+    second = cache.search("  what is   AGENT memory ")
+
+    assert normalize_query("What is agent memory?") == "what is agent memory"
+    assert tool.queries == ["What is agent memory?"]
+    assert second == first
+    assert cache.stats()["hits"] == 1
+
+
+def test_entries_expire_and_are_evicted() -> None:
+    tool, clock = FakeSearchTool(), Clock()
+    cache = WebSearchCache(tool, ttl=10, capacity=1, clock=clock)
+
+    cache.search("agent memory")
+    clock.now = 11
+    cache.search("agent memory")
+    cache.search("pizza dough")
+    cache.search("agent memory")
+
+    assert tool.queries == [
+        "agent memory",
+        "agent memory",
+        "pizza dough",
+        "agent memory",
+    ]
+
+
+def test_node_does_not_mutate_the_state(monkeypatch) -> None:
+    module = sys.modules["graph.nodes.web_search"]
+    cache = WebSearchCache(FakeSearchTool())
+    monkeypatch.setattr(module, "get_web_search_cache", lambda: cache)
+    retrieved = store_documents(
+        [Document(page_content="retrieved", metadata={"url": "https://a"})]
+    )
+    state = {"question": "agent memory", "documents": retrieved, "web_search": True}
+
+    update = module.web_search(state)
+
+    assert len(retrieved) == 1
+    assert update["documents"][0] == retrieved[0]
+    # The page already in the documents is not added a second time
+    urls = [d.metadata["url"] for d in load_documents(update["documents"])]
+    assert urls == ["https://a", "https://b"]
+    assert update["web_searches"] == 1
@@ -1,47 +1,205 @@
-from typing import Any, Dict
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
 
 from dotenv import load_dotenv
 from langchain.schema import Document
 from langchain_tavily import TavilySearch
 
 load_dotenv()
+from cassettes import CassetteSearch, get_cassette
+from graph.constants import WEBSEARCH
+from graph.documents import load_documents, store_documents
+from graph.metrics import record_cache
+from graph.speculation import get_speculator
 from graph.state import GraphState
 
-web_search_tool = TavilySearch(max_results=3)
+# Seconds the results of a query are reused before searching again
+WEB_SEARCH_CACHE_TTL = float(os.getenv("WEB_SEARCH_CACHE_TTL", "3600"))
+# Maximum number of cached queries, least recently used are evicted first
+WEB_SEARCH_CACHE_SIZE = int(os.getenv("WEB_SEARCH_CACHE_SIZE", "256"))
+
+_SPACES = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=None)
+def get_web_search_tool() -> Any:
+    cassette = get_cassette()
+    if cassette is None:
+        return TavilySearch(max_results=3)
+    # A replay needs no Tavily key
+    tool = TavilySearch(max_results=3) if cassette.recording else None
+    return CassetteSearch(cassette, tool)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case, surrounding punctuation and repeated whitespace do not change the results
+    """
+    return _SPACES.sub(" ", query).strip(" ?!.").lower()
+
+
+def to_documents(results: Any) -> List[Document]:
+    """
+    Turns a Tavily response into one document per result, with its url and
+    score in the metadata
+    """
+    if isinstance(results, dict):
+        results = results.get("results", [])
+    if not isinstance(results, list):
+        results = [results]
+    documents = []
+    for result in results:
+        if isinstance(result, Document):
+            documents.append(result)
+        elif isinstance(result, dict):
+            metadata = {
+                k: result[k] for k in ("url", "title", "score") if k in result
+            }
+            documents.append(
+                Document(page_content=result.get("content", ""), metadata=metadata)
+            )
+        else:
+            documents.append(Document(page_content=str(result)))
+    return documents
+
+
+class WebSearchCache:
+    """
+    Results of previous web searches, keyed by normalized query
+
+    Args:
+        search: Runs the actual search for a query
+        asearch: Its async counterpart, `search` runs on a thread without it
+        ttl: Seconds an entry stays valid
+        capacity: Maximum number of entries
+        clock: Time source, monotonic by default
+    """
+
+    def __init__(
+        self,
+        search: Callable[[str], Any],
+        ttl: float = WEB_SEARCH_CACHE_TTL,
+        capacity: int = WEB_SEARCH_CACHE_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+        asearch: Optional[Callable[[str], Awaitable[Any]]] = None,
+    ):
+        self._search = search
+        self._asearch = asearch
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self._entries: "OrderedDict[str, Tuple[List[Document], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, key: str) -> Optional[List[Document]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[1] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record_cache("web_search", hit=True)
+                return list(entry[0])
+            self.misses += 1
+        record_cache("web_search", hit=False)
+        return None
+
+    def _store(self, key: str, results: Any) -> List[Document]:
+        documents = to_documents(results)
+        with self._lock:
+            self._entries[key] = (documents, self.clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        return list(documents)
+
+    def search(self, query: str) -> List[Document]:
+        key = normalize_query(query)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        return self._store(key, self._search(query))
+
+    async def asearch(self, query: str) -> List[Document]:
+        key = normalize_query(query)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        if self._asearch is not None:
+            results = await self._asearch(query)
+        else:
+            results = await asyncio.to_thread(self._search, query)
+        return self._store(key, results)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self._entries),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_web_search_cache() -> WebSearchCache:
+    return WebSearchCache(
+        lambda query: get_web_search_tool().invoke(query),
+        asearch=lambda query: get_web_search_tool().ainvoke(query),
+    )
+
+
+def search_web(question: str) -> List[Document]:
+    return get_web_search_cache().search(question)
+
+
+async def asearch_web(question: str) -> List[Document]:
+    return await get_web_search_cache().asearch(question)
 
 
 def web_search(state: GraphState) -> Dict[str, Any]:
     """
     Executes a web search if the documents are not relevant to the question
     """
-    print("--- WEBSEARCH NODE ---")
     question = state["question"]
-    documents = state["documents"]
-    web_search = state["web_search"]
-    if web_search:
-        results = web_search_tool.invoke(question)
-        # Handle different result formats from TavilySearch
-        if isinstance(results, list):
-            # If results is a list of documents
-            joined_results = "\n".join(
-                [
-                    r.page_content if hasattr(r, "page_content") else str(r)
-                    for r in results
-                ]
-            )
-        else:
-            # If results is a single document or string
-            joined_results = (
-                results.page_content
-                if hasattr(results, "page_content")
-                else str(results)
-            )
+    results = []
+    if state.get("web_search", True):
+        # Reuses the search started during routing in speculative mode
+        speculative = get_speculator().take(WEBSEARCH, question)
+        results = speculative.result() if speculative else search_web(question)
+    return _add_results(state, results)
 
-        web_results = Document(page_content=joined_results)
 
-        if documents:
-            documents.append(web_results)
+async def aweb_search(state: GraphState) -> Dict[str, Any]:
+    question = state["question"]
+    results = []
+    if state.get("web_search", True):
+        speculative = get_speculator().take(WEBSEARCH, question)
+        if speculative:
+            results = await asyncio.wrap_future(speculative)
         else:
-            documents = [web_results]
+            results = await asearch_web(question)
+    return _add_results(state, results)
+
 
-    return {"documents": documents, "question": question}
+def _add_results(state: GraphState, results: List[Document]) -> Dict[str, Any]:
+    # Not set yet when the question is routed straight to web search
+    refs = list(state.get("documents") or [])
+    web_searches = state.get("web_searches", 0)
+    if state.get("web_search", True):
+        web_searches += 1
+        # A repeated search returns the pages already in the documents
+        seen = {url for d in load_documents(refs) if (url := d.metadata.get("url"))}
+        refs += store_documents([r for r in results if r.metadata.get("url") not in seen])
+    return {
+        "documents": refs,
+        "question": state["question"],
+        "web_searches": web_searches,
+    }
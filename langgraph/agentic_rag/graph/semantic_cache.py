@@ -0,0 +1,202 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import RunnableConfig
+from langgraph.graph.state import CompiledStateGraph
+
+from graph.documents import load_documents
+from graph.metrics import record_cache
+
+# Minimum cosine similarity between two questions to reuse an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+# Seconds an answer can be served from the cache
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "3600"))
+# Maximum number of cached answers, least recently used are evicted first
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "1000"))
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    vector: np.ndarray
+    result: Dict[str, Any]
+    latency: float
+    created_at: float
+
+
+class SemanticCache:
+    """
+    Answers of previous questions, looked up by question embedding similarity
+
+    Args:
+        embeddings: Embeds the questions
+        threshold: Minimum cosine similarity for a hit
+        ttl: Seconds an entry stays valid
+        capacity: Maximum number of entries
+        clock: Time source, monotonic by default
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        ttl: float = SEMANTIC_CACHE_TTL,
+        capacity: int = SEMANTIC_CACHE_CAPACITY,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.capacity = capacity
+        self.clock = clock
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _evict_expired(self, now: float) -> None:
+        expired = [i for i, e in self._entries.items() if now - e.created_at > self.ttl]
+        for i in expired:
+            del self._entries[i]
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the cached final state of the most similar question, if any is
+        similar enough
+        """
+        vector = self._embed(question)
+        with self._lock:
+            self._evict_expired(self.clock())
+            if self._entries:
+                ids = list(self._entries)
+                matrix = np.stack([self._entries[i].vector for i in ids])
+                similarities = matrix @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry = self._entries[ids[best]]
+                    self._entries.move_to_end(ids[best])
+                    self.hits += 1
+                    self.latency_saved += entry.latency
+                    record_cache("semantic", hit=True)
+                    return entry.result
+            self.misses += 1
+        record_cache("semantic", hit=False)
+        return None
+
+    def store(self, question: str, result: Dict[str, Any], latency: float) -> None:
+        vector = self._embed(question)
+        with self._lock:
+            self._entries[self._next_id] = CacheEntry(
+                question, vector, result, latency, self.clock()
+            )
+            self._next_id += 1
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_s": self.latency_saved,
+            "size": len(self._entries),
+        }
+
+
+class SemanticCachedGraph:
+    """
+    Serves near-duplicate questions from a `SemanticCache` without running the
+    graph, any other attribute is forwarded to the compiled graph. A cached
+    answer carries its documents rather than their references, which the
+    document store may have evicted since (`load_documents` takes both).
+
+    Args:
+        app: The compiled agentic RAG graph
+        cache: Where graded answers are kept
+    """
+
+    def __init__(self, app: CompiledStateGraph, cache: SemanticCache):
+        self.app = app
+        self.cache = cache
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.app, name)
+
+    def invoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Dict[str, Any]:
+        question = input["question"]
+        cached = self.cache.lookup(question)
+        if cached is not None:
+            return {**cached, "question": question}
+
+        start = time.perf_counter()
+        result = self.app.invoke(input, config, **kwargs)
+        self._store(question, result, time.perf_counter() - start)
+        return result
+
+    def stream(
+        self,
+        input: Dict[str, Any],
+        config: Optional[RunnableConfig] = None,
+        *,
+        stream_mode: Any = "values",
+        **kwargs,
+    ) -> Iterator[Any]:
+        """
+        Streams the graph like `CompiledStateGraph.stream`. A cached answer is
+        replayed as one "custom" token chunk and one "values" chunk, the other
+        modes stay silent. Only runs streamed with the "values" mode are cached.
+        """
+        modes = [stream_mode] if isinstance(stream_mode, str) else list(stream_mode)
+
+        def emit(mode: str, payload: Any) -> Any:
+            return payload if isinstance(stream_mode, str) else (mode, payload)
+
+        question = input["question"]
+        cached = self.cache.lookup(question)
+        if cached is not None:
+            if "custom" in modes:
+                yield emit("custom", {"node": "cache", "token": cached["generation"]})
+            if "values" in modes:
+                yield emit("values", {**cached, "question": question})
+            return
+
+        start = time.perf_counter()
+        final = None
+        for chunk in self.app.stream(input, config, stream_mode=stream_mode, **kwargs):
+            if isinstance(stream_mode, str):
+                if stream_mode == "values":
+                    final = chunk
+            elif chunk[0] == "values":
+                final = chunk[1]
+            yield chunk
+        if final is not None:
+            self._store(question, final, time.perf_counter() - start)
+
+    def _store(self, question: str, result: Dict[str, Any], latency: float) -> None:
+        # Answers returned because a budget ran out were never accepted by the graders
+        answered = result.get("stop_reason", "answered") == "answered"
+        if answered and result.get("generation"):
+            # The entry outlives the references of the run in the document
+            # store, it keeps the (interned) documents themselves
+            if result.get("documents"):
+                result = {**result, "documents": load_documents(result["documents"])}
+            self.cache.store(question, result, latency)
@@ -0,0 +1,91 @@
+import asyncio
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+from batching import SingleFlight
+
+# Maximum number of questions of a batch answered at the same time
+SERVING_MAX_CONCURRENCY = int(os.getenv("SERVING_MAX_CONCURRENCY", "16"))
+
+
+def request_key(input: Dict[str, Any]) -> str:
+    """
+    Identity of a request, questions only differing in case or whitespace are the same
+    """
+    normalized = {**input, "question": " ".join(input["question"].lower().split())}
+    return json.dumps(normalized, sort_keys=True, default=str)
+
+
+class ServingGraph:
+    """
+    Serves many questions at once: identical requests in flight run the graph
+    a single time and share its answer, any other attribute is forwarded to
+    the wrapped graph
+
+    Args:
+        app: The agentic RAG graph, compiled or behind the semantic cache
+        max_concurrency: Questions of a batch answered at the same time
+    """
+
+    def __init__(self, app: Any, max_concurrency: int = SERVING_MAX_CONCURRENCY):
+        self.app = app
+        self.max_concurrency = max_concurrency
+        self.flight = SingleFlight("request")
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.app, name)
+
+    def invoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Dict[str, Any]:
+        result = self.flight.do(
+            request_key(input), lambda: self.app.invoke(input, config, **kwargs)
+        )
+        # Every caller gets its own copy of the shared final state
+        return {**result, "question": input["question"]}
+
+    def batch(
+        self,
+        inputs: List[Dict[str, Any]],
+        config: Optional[RunnableConfig] = None,
+        *,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """
+        Answers every input concurrently, in input order
+        """
+        workers = max(1, min(len(inputs), max_concurrency or self.max_concurrency))
+        with ContextThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda i: self.invoke(i, config, **kwargs), inputs))
+
+    async def ainvoke(
+        self, input: Dict[str, Any], config: Optional[RunnableConfig] = None, **kwargs
+    ) -> Dict[str, Any]:
+        result = await self.flight.ado(
+            request_key(input), lambda: self.app.ainvoke(input, config, **kwargs)
+        )
+        return {**result, "question": input["question"]}
+
+    async def abatch(
+        self,
+        inputs: List[Dict[str, Any]],
+        config: Optional[RunnableConfig] = None,
+        *,
+        max_concurrency: Optional[int] = None,
+        **kwargs,
+    ) -> List[Dict[str, Any]]:
+        """
+        `batch` on the event loop, wrap an app compiled from the async workflow
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency or self.max_concurrency))
+
+        async def answer(input: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.ainvoke(input, config, **kwargs)
+
+        return await asyncio.gather(*(answer(i) for i in inputs))
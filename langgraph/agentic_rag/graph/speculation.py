@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from functools import lru_cache
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from langchain_core.runnables.config import ContextThreadPoolExecutor
+
+# Starts retrieval and web search while the router and the graders are still thinking
+SPECULATIVE_MODE = os.getenv("SPECULATIVE_MODE", "false").lower() == "true"
+# Speculation pauses while more than this fraction of the recent calls were wasted
+SPECULATION_MAX_WASTE_RATIO = float(os.getenv("SPECULATION_MAX_WASTE_RATIO", "0.5"))
+# How many recent speculation decisions the waste ratio is computed over
+SPECULATION_WINDOW = int(os.getenv("SPECULATION_WINDOW", "20"))
+# Results nobody claimed after this many seconds are dropped as wasted
+SPECULATION_TTL = float(os.getenv("SPECULATION_TTL", "120"))
+
+
+class Speculator:
+    """
+    Runs calls ahead of time and hands their results to the node that needs
+    them, keyed by (kind, question). Calls whose result is never used count as
+    wasted, and no new call is started while the waste ratio over the last
+    `window` decisions is above `max_waste_ratio`. Skipped speculations count
+    as not wasted, so the ratio recovers and speculation resumes on its own.
+
+    Args:
+        max_waste_ratio: Highest tolerated fraction of wasted calls
+        window: Number of recent decisions the ratio is computed over
+        ttl: Seconds an unclaimed result is kept
+        max_workers: Maximum number of speculative calls in flight
+    """
+
+    def __init__(
+        self,
+        max_waste_ratio: float = SPECULATION_MAX_WASTE_RATIO,
+        window: int = SPECULATION_WINDOW,
+        ttl: float = SPECULATION_TTL,
+        max_workers: int = 8,
+    ):
+        self.max_waste_ratio = max_waste_ratio
+        self.ttl = ttl
+        self._executor = ContextThreadPoolExecutor(max_workers=max_workers)
+        self._pending: Dict[Tuple[str, str], Tuple[Future, float]] = {}
+        self._outcomes: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.started = 0
+        self.used = 0
+        self.wasted = 0
+        self.skipped = 0
+
+    def waste_ratio(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def _record(self, wasted: bool) -> None:
+        self._outcomes.append(wasted)
+        if wasted:
+            self.wasted += 1
+
+    def _expire(self, now: float) -> None:
+        for key, (future, started_at) in list(self._pending.items()):
+            if now - started_at > self.ttl:
+                del self._pending[key]
+                future.cancel()
+                self._record(wasted=True)
+
+    def start(self, kind: str, question: str, fn: Callable[[], Any]) -> bool:
+        """
+        Starts `fn` in the background unless the waste budget is exhausted
+
+        Returns:
+            Whether the call was started
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            key = (kind, question)
+            if key in self._pending:
+                return True
+            if self.waste_ratio() > self.max_waste_ratio:
+                self.skipped += 1
+                self._record(wasted=False)
+                return False
+            self._pending[key] = (self._executor.submit(fn), time.monotonic())
+            self.started += 1
+            return True
+
+    def take(self, kind: str, question: str) -> Optional[Future]:
+        """
+        Claims the speculative call for the question, None if there is none
+        """
+        with self._lock:
+            entry = self._pending.pop((kind, question), None)
+            if entry is None:
+                return None
+            self.used += 1
+            self._record(wasted=False)
+            return entry[0]
+
+    def discard(self, kind: str, question: str) -> None:
+        """
+        Drops the speculative call for the question, its result is not needed
+        """
+        with self._lock:
+            entry = self._pending.pop((kind, question), None)
+            if entry is not None:
+                entry[0].cancel()
+                self._record(wasted=True)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "started": self.started,
+            "used": self.used,
+            "wasted": self.wasted,
+            "skipped": self.skipped,
+            "waste_ratio": self.waste_ratio(),
+        }
+
+
+@lru_cache(maxsize=None)
+def get_speculator() -> Speculator:
+    return Speculator()
@@ -1,4 +1,4 @@
-from typing import List, TypedDict
+from typing import List, NotRequired, Optional, TypedDict
 
 
 class GraphState(TypedDict):
@@ -8,10 +8,59 @@ class GraphState(TypedDict):
         - question: The question to answer
         - generation: LLM generation
         - web_search: wether to add search
-        - documents: list of documents
+        - documents: references of the documents in graph/documents.py, the
+          nodes load the ones they read
+        - speculative: start retrieval and web search ahead of the routing
+          decisions (defaults to SPECULATIVE_MODE)
+        - grader_mode: "per_document" or "batched" relevance grading
+          (defaults to GRADER_MODE)
+        - concurrent_grading: run the hallucination and answer graders
+          concurrently (defaults to CONCURRENT_GENERATION_GRADING)
+        - rerank_k, mmr_lambda, rerank_cutoff: how many retrieved chunks MMR
+          keeps, its relevance weight and the minimum similarity to the
+          question (default to RERANK_K, MMR_LAMBDA and RERANK_SCORE_CUTOFF)
+        - max_regenerations, max_web_searches, max_tokens, deadline_s: budgets
+          of the request (default to the values in graph/budgets.py)
+        - started_at, deadline: wall clock start and end of the request
+        - generations, web_searches, tokens_used: what the request spent so far
+        - verdict: the last grade of the generation
+        - grounded_generation: the last generation grounded in the documents,
+          returned when a budget ends the run
+        - stop_reason: "answered" or the budget that ended the run
+        - ttft_s: seconds from the start of the request to its first token
+        - tokens_per_s: decoding speed of the last generation
+        - prompt_tokens_saved: document tokens context packing kept out of
+          the generation and hallucination prompts
+        - context: references of the packed documents the last generation
+          was given, the hallucination grader checks it against them
+        - context_tokens_saved: document tokens packing kept out of that
+          context
     """
 
     question: str
     generation: str
     web_search: bool
     documents: List[str]
+    speculative: NotRequired[bool]
+    grader_mode: NotRequired[str]
+    concurrent_grading: NotRequired[bool]
+    rerank_k: NotRequired[int]
+    mmr_lambda: NotRequired[float]
+    rerank_cutoff: NotRequired[float]
+    max_regenerations: NotRequired[int]
+    max_web_searches: NotRequired[int]
+    max_tokens: NotRequired[Optional[float]]
+    deadline_s: NotRequired[Optional[float]]
+    started_at: NotRequired[float]
+    deadline: NotRequired[Optional[float]]
+    generations: NotRequired[int]
+    web_searches: NotRequired[int]
+    tokens_used: NotRequired[int]
+    verdict: NotRequired[Optional[str]]
+    grounded_generation: NotRequired[str]
+    stop_reason: NotRequired[Optional[str]]
+    ttft_s: NotRequired[Optional[float]]
+    tokens_per_s: NotRequired[float]
+    prompt_tokens_saved: NotRequired[int]
+    context: NotRequired[List[str]]
+    context_tokens_saved: NotRequired[int]
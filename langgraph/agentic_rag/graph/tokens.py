@@ -0,0 +1,46 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Iterator, Optional
+
+import tiktoken
+from langchain_core.callbacks import UsageMetadataCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from graph.chains.llm import DEFAULT_MODEL
+
+_usage_handler: ContextVar[Optional[UsageMetadataCallbackHandler]] = ContextVar(
+    "agentic_rag_usage_handler", default=None
+)
+register_configure_hook(_usage_handler, inheritable=True)
+
+
+@lru_cache(maxsize=None)
+def get_encoding() -> tiktoken.Encoding:
+    try:
+        return tiktoken.encoding_for_model(DEFAULT_MODEL)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text: str) -> int:
+    return len(get_encoding().encode(text, disallowed_special=()))
+
+
+@contextmanager
+def track_usage() -> Iterator[UsageMetadataCallbackHandler]:
+    """
+    Collects the token usage reported by every chat model called inside the
+    block, threads started with a ContextThreadPoolExecutor included
+    """
+    handler = UsageMetadataCallbackHandler()
+    token = _usage_handler.set(handler)
+    try:
+        yield handler
+    finally:
+        _usage_handler.reset(token)
+
+
+def total_tokens(handler: UsageMetadataCallbackHandler) -> int:
+    usage = handler.usage_metadata.values()
+    return sum(u.get("total_tokens", 0) for u in usage)
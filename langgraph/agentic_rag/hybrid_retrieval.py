@@ -0,0 +1,154 @@
+"""
+Keyword (BM25) retrieval next to the vector store, fused with reciprocal-rank
+fusion behind the LangChain retriever interface.
+
+The BM25 index lives in memory. It is built from the chunks already in the
+vector store on first use and `ingestion.ingest` applies the same additions
+and deletions to it, so both sides always rank the same chunks.
+"""
+
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
+from pydantic import ConfigDict
+
+from graph.documents import document_ref
+
+_TOKEN = re.compile(r"\w+")
+# Constant of reciprocal-rank fusion, dampens the weight of the very first ranks
+RRF_K = 60
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index of term -> {chunk id: term frequency}
+
+    Args:
+        k1: Term frequency saturation
+        b: Strength of the document length normalization
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self._lengths: Dict[str, int] = {}
+        self._documents: Dict[str, Document] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def get(self, chunk_id: str) -> Optional[Document]:
+        return self._documents.get(chunk_id)
+
+    def add(self, ids: Sequence[str], documents: Sequence[Document]) -> None:
+        """
+        Indexes the documents, an id already in the index is replaced
+        """
+        with self._lock:
+            self._delete(ids)
+            for chunk_id, document in zip(ids, documents):
+                terms = Counter(tokenize(document.page_content))
+                for term, frequency in terms.items():
+                    self._postings[term][chunk_id] = frequency
+                length = sum(terms.values())
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                self._documents[chunk_id] = document
+
+    def delete(self, ids: Iterable[str]) -> None:
+        with self._lock:
+            self._delete(ids)
+
+    def _delete(self, ids: Iterable[str]) -> None:
+        for chunk_id in ids:
+            document = self._documents.pop(chunk_id, None)
+            if document is None:
+                continue
+            for term in set(tokenize(document.page_content)):
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+            self._total_length -= self._lengths.pop(chunk_id)
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[str, float]]:
+        """
+        Returns the ids and scores of the k best matching chunks
+        """
+        with self._lock:
+            n = len(self._documents)
+            if not n:
+                return []
+            average_length = self._total_length / n
+            scores: Dict[str, float] = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, frequency in postings.items():
+                    length = self._lengths[chunk_id] / average_length
+                    norm = self.k1 * (1 - self.b + self.b * length)
+                    scores[chunk_id] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+def reciprocal_rank_fusion(
+    rankings: Sequence[Sequence[str]], k: int = RRF_K
+) -> List[Tuple[str, float]]:
+    """
+    Fuses rankings of ids, every id scores 1 / (k + rank) in every ranking it is in
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, start=1):
+            scores[chunk_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    Retrieves `fetch_k` candidates from the vector store and from the BM25
+    index and returns the `k` best after reciprocal-rank fusion
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    vectorstore: VectorStore
+    index: BM25Index
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = RRF_K
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> List[Document]:
+        vector_hits = self.vectorstore.similarity_search(query, k=self.fetch_k)
+        keyword_hits = self.index.search(query, k=self.fetch_k)
+
+        # Stores that return documents without ids (FAISS, the PDF examples)
+        # are fused by content hash, their hits never match a BM25 id
+        documents = {d.id or document_ref(d): d for d in vector_hits}
+        fused = reciprocal_rank_fusion(
+            [list(documents), [chunk_id for chunk_id, _ in keyword_hits]], self.rrf_k
+        )
+        results = []
+        for chunk_id, _ in fused[: self.k]:
+            document = documents.get(chunk_id) or self.index.get(chunk_id)
+            if document is not None:
+                results.append(document)
+        return results
@@ -2,41 +2,279 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+import hashlib
+import json
+import os
+from functools import lru_cache, partial
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import tiktoken
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
 from langchain_community.document_loaders import WebBaseLoader
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.vectorstores import VectorStore
 from langchain_openai import OpenAIEmbeddings
 
+from batching import QueryBatcher
+from cassettes import CassetteEmbeddings, CassetteRetriever, get_cassette
+from embedding_cache import CachedEmbeddings
+from graph.metrics import record_cache
+from hybrid_retrieval import BM25Index, HybridRetriever
+from mmap_index import MmapVectorStore
+
 urls = [
     "https://lilianweng.github.io/posts/2023-06-23-agent/",
     "https://lilianweng.github.io/posts/2023-03-15-prompt-engineering/",
     "https://lilianweng.github.io/posts/2023-10-25-adv-attack-llm/",
 ]
 
-docs = [WebBaseLoader(url).load() for url in urls]
-docs_list = [item for sublist in docs for item in sublist]
-
-text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    chunk_size=250, chunk_overlap=0
+PERSIST_DIRECTORY = "./.chroma"
+COLLECTION_NAME = "rag-chroma"
+# "chroma" or "mmap", the embedded memory-mapped IVF index of mmap_index.py
+VECTOR_STORE = os.getenv("VECTOR_STORE", "chroma")
+MMAP_INDEX_DIRECTORY = "./.mmap_index"
+# Keeps track of what is already embedded in the vector store
+MANIFEST_PATH = os.path.join(
+    MMAP_INDEX_DIRECTORY if VECTOR_STORE == "mmap" else PERSIST_DIRECTORY,
+    "manifest.json",
 )
+# "hybrid" fuses BM25 and vector results, "vector" only asks the vector store
+RETRIEVER_MODE = os.getenv("RETRIEVER_MODE", "hybrid")
+# Chunks retrieved per question, the rerank node narrows them down for grading
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "8"))
+# Tokenizer the chunks are measured with, context packing counts with it too
+SPLITTER_ENCODING = "gpt2"
 
-docs_splits = text_splitter.split_documents(docs_list)
 
-# I run it only once to seed the Chroma db
-# Commented out to avoid doing it every time we call the functions as its already there
-vectorstore = Chroma.from_documents(
-    documents=docs_splits,
-    embedding=OpenAIEmbeddings(),
-    collection_name="rag-chroma",
-    persist_directory="./.chroma",
-)
+@lru_cache(maxsize=None)
+def get_splitter_encoding() -> tiktoken.Encoding:
+    return tiktoken.get_encoding(SPLITTER_ENCODING)
+
+
+@lru_cache(maxsize=None)
+def get_text_splitter() -> RecursiveCharacterTextSplitter:
+    return RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+        encoding_name=SPLITTER_ENCODING, chunk_size=250, chunk_overlap=0
+    )
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def chunk_id(chunk: Document) -> str:
+    """
+    Content addressed id of a chunk, the same text from the same source always
+    gets the same id so it is never embedded twice
+    """
+    return content_hash(f"{chunk.metadata.get('source', '')}\0{chunk.page_content}")
+
+
+def load_url(url: str) -> List[Document]:
+    return WebBaseLoader(url).load()
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> Dict[str, Any]:
+    """
+    Manifest layout: {"sources": {url: {"hash": page hash, "chunks": [chunk ids]}}}
+    """
+    if not os.path.exists(path):
+        return {"sources": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: Dict[str, Any], path: str = MANIFEST_PATH) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    # Atomic swap, a crash never leaves a half written manifest behind
+    os.replace(tmp_path, path)
+
+
+def split_source(pages: List[Document]) -> Dict[str, Document]:
+    """
+    Splits the pages of a source into chunks keyed by their content hash
+    """
+    chunks = {}
+    for chunk in get_text_splitter().split_documents(pages):
+        chunk.id = chunk_id(chunk)
+        chunks[chunk.id] = chunk
+    return chunks
+
+
+def plan_ingestion(
+    manifest: Dict[str, Any], pages_by_source: Dict[str, List[Document]]
+) -> Tuple[Dict[str, Document], List[str], Dict[str, Any]]:
+    """
+    Compares the current corpus against the manifest
+
+    Args:
+        manifest: The manifest of the previous ingestion
+        pages_by_source: The freshly loaded pages of every source
+
+    Returns:
+        The chunks to embed keyed by id, the stale chunk ids to delete and the new manifest
+    """
+    old_sources = manifest.get("sources", {})
+    new_sources: Dict[str, Any] = {}
+    to_add: Dict[str, Document] = {}
+    to_delete: List[str] = []
+
+    for source, pages in pages_by_source.items():
+        page_hash = content_hash("\0".join(p.page_content for p in pages))
+        previous = old_sources.get(source)
+        if previous and previous["hash"] == page_hash:
+            # Unchanged page, not even worth re-splitting it
+            new_sources[source] = previous
+            continue
+
+        chunks = split_source(pages)
+        previous_ids = set(previous["chunks"]) if previous else set()
+        to_add.update({i: c for i, c in chunks.items() if i not in previous_ids})
+        to_delete.extend(i for i in previous_ids if i not in chunks)
+        new_sources[source] = {"hash": page_hash, "chunks": list(chunks)}
+
+    for source, previous in old_sources.items():
+        if source not in pages_by_source:
+            to_delete.extend(previous["chunks"])
+
+    return to_add, to_delete, {"sources": new_sources}
+
+
+def ingest(
+    sources: List[str] = urls,
+    vectorstore: Optional[VectorStore] = None,
+    manifest_path: str = MANIFEST_PATH,
+    loader: Callable[[str], List[Document]] = load_url,
+    index: Optional[BM25Index] = None,
+) -> Dict[str, int]:
+    """
+    Incrementally syncs the vector store with the sources, only new or changed
+    chunks are embedded and chunks that disappeared are deleted. The BM25
+    index gets the same changes: the given one, or the one of this process if
+    it was already built from the default vector store.
+
+    Without a manifest the stored rows are not known to be chunks of the
+    sources: a collection ingested before the manifests has random ids. Every
+    row whose id is not the content id of a current chunk is deleted then,
+    and the chunks already stored under their content id are kept.
+
+    Returns:
+        How many chunks were added, deleted and left untouched
+    """
+    if index is None and vectorstore is None and get_bm25_index.cache_info().currsize:
+        index = get_bm25_index()
+    vectorstore = vectorstore or get_vectorstore()
+    manifest = load_manifest(manifest_path)
+    pages_by_source = {source: loader(source) for source in sources}
+
+    to_add, to_delete, new_manifest = plan_ingestion(manifest, pages_by_source)
+    if not os.path.exists(manifest_path):
+        stored = set(vectorstore.get(include=[])["ids"])
+        to_delete.extend(stored.difference(to_add))
+        to_add = {i: c for i, c in to_add.items() if i not in stored}
+
+    if to_delete:
+        vectorstore.delete(ids=to_delete)
+    if to_add:
+        vectorstore.add_documents(list(to_add.values()), ids=list(to_add))
+    if index is not None:
+        index.delete(to_delete)
+        index.add(list(to_add), list(to_add.values()))
+    save_manifest(new_manifest, manifest_path)
+
+    total = sum(len(s["chunks"]) for s in new_manifest["sources"].values())
+    return {
+        "added": len(to_add),
+        "deleted": len(to_delete),
+        "unchanged": total - len(to_add),
+    }
+
+
+def _cached_openai_embeddings() -> CachedEmbeddings:
+    return CachedEmbeddings(
+        OpenAIEmbeddings(), on_lookup=partial(record_cache, "embedding")
+    )
+
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> Embeddings:
+    """
+    OpenAI embeddings behind the on-disk cache, re-ingesting or re-asking the
+    same text never calls the API twice. Concurrent queries are embedded
+    together, one call per tick. A cassette records or replays the texts the
+    batches ask for, a replay needs neither the API nor the cache.
+    """
+    cassette = get_cassette()
+    if cassette is None:
+        return QueryBatcher(_cached_openai_embeddings())
+    embeddings = _cached_openai_embeddings() if cassette.recording else None
+    return QueryBatcher(CassetteEmbeddings(cassette, embeddings))
+
+
+@lru_cache(maxsize=None)
+def get_vectorstore() -> VectorStore:
+    if VECTOR_STORE == "mmap":
+        return MmapVectorStore(MMAP_INDEX_DIRECTORY, get_embeddings())
+    # chromadb takes most of the import time, only pay for it when the store is used
+    from langchain_chroma import Chroma
+
+    return Chroma(
+        persist_directory=PERSIST_DIRECTORY,
+        embedding_function=get_embeddings(),
+        collection_name=COLLECTION_NAME,
+    )
+
+
+@lru_cache(maxsize=None)
+def get_bm25_index() -> BM25Index:
+    """
+    Keyword index over the chunks of the vector store, built in memory on first use
+    """
+    stored = get_vectorstore().get(include=["documents", "metadatas"])
+    index = BM25Index()
+    index.add(
+        stored["ids"],
+        [
+            Document(id=i, page_content=text, metadata=metadata or {})
+            for i, text, metadata in zip(
+                stored["ids"], stored["documents"], stored["metadatas"]
+            )
+        ],
+    )
+    return index
+
+
+@lru_cache(maxsize=None)
+def get_retriever() -> BaseRetriever:
+    cassette = get_cassette()
+    if cassette is not None:
+        # The replayed documents do not need the collection
+        retriever = _open_retriever() if cassette.recording else None
+        return CassetteRetriever(cassette=cassette, retriever=retriever)
+    return _open_retriever()
+
+
+def _open_retriever() -> BaseRetriever:
+    # Only opens the already seeded collection, run this file to (re)ingest
+    if RETRIEVER_MODE == "hybrid":
+        return HybridRetriever(
+            vectorstore=get_vectorstore(), index=get_bm25_index(), k=RETRIEVER_K
+        )
+    return get_vectorstore().as_retriever(search_kwargs={"k": RETRIEVER_K})
+
 
-retriever = Chroma(
-    persist_directory="./.chroma",
-    embedding_function=OpenAIEmbeddings(),
-    collection_name="rag-chroma",
-).as_retriever()
+def __getattr__(name: str) -> Any:
+    # `from ingestion import retriever` opens the collection on first access
+    if name == "retriever":
+        return get_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 if __name__ == "__main__":
     print("Ingesting...")
+    print(ingest())
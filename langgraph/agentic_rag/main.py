@@ -1,11 +1,37 @@
+import sys
+
 from dotenv import load_dotenv
 
 load_dotenv()
-from graph.graph import app
+from graph.graph import get_cached_app
+from graph.metrics import get_metrics
 
 if __name__ == "__main__":
-    result = app.invoke({"question": "What is agent memory?"})
+    question = "What is agent memory?"
+    if "--stream" in sys.argv:
+        # Tokens are printed as the generate node produces them
+        result, generation = {}, None
+        for mode, chunk in get_cached_app().stream(
+            {"question": question}, stream_mode=["custom", "values"]
+        ):
+            if mode == "custom":
+                if generation is not None and chunk.get("generation") != generation:
+                    print("\n--- REGENERATING ---")
+                generation = chunk.get("generation")
+                print(chunk["token"], end="", flush=True)
+            else:
+                result = chunk
+        print()
+    else:
+        result = get_cached_app().invoke({"question": question})
     print("=" * 50)
     print("FINAL RESULT")
     print("=" * 50)
     print(result["generation"])
+    print(f"Stop reason: {result.get('stop_reason')}")
+    if result.get("ttft_s") is not None:
+        print(f"Time to first token: {result['ttft_s']:.2f}s")
+        print(f"Tokens per second: {result['tokens_per_s']:.1f}")
+    print(f"Prompt tokens saved: {result.get('prompt_tokens_saved', 0)}")
+    if "--metrics" in sys.argv:
+        print(get_metrics().to_prometheus(), end="")
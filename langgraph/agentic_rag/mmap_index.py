@@ -0,0 +1,335 @@
+"""
+Embedded vector index served straight from memory-mapped files.
+
+A built index is a directory of flat files, written once and never modified:
+
+    index.json      dimension, counts and storage type
+    centroids.npy   float32 (nlist, dim) IVF centroids
+    offsets.npy     int64 (nlist + 1) first row of every inverted list
+    vectors.npy     float16 / float32 (n, dim) L2 normalized vectors, grouped by list
+    records.bin     one JSON record (id, text, metadata) per row, back to back
+    records.npy     int64 (n + 1) byte offset of every record
+
+Opening an index only maps the files, nothing is deserialized until a query
+touches it, and any number of processes can share the pages read-only.
+Writers build a new version next to the current one and switch the CURRENT
+pointer atomically, readers that are still mapping the old version keep it
+until they reopen.
+
+intro-vector-dbs keeps a copy of the module (checked by tests/test_copies.py).
+"""
+
+import json
+import os
+import shutil
+import time
+import uuid
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+# Inverted lists scanned per query, more lists means better recall and slower queries
+MMAP_INDEX_NPROBE = int(os.getenv("MMAP_INDEX_NPROBE", "8"))
+# Storage type of the vectors, float16 halves the file at a negligible recall cost
+MMAP_INDEX_DTYPE = os.getenv("MMAP_INDEX_DTYPE", "float16")
+
+_POINTER = "CURRENT"
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def kmeans(
+    vectors: np.ndarray, k: int, iterations: int = 10, seed: int = 0
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Spherical k-means on normalized vectors
+
+    Returns:
+        The (k, dim) centroids and the list of every vector
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for i in range(k):
+            members = vectors[assignment == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids, np.argmax(vectors @ centroids.T, axis=1)
+
+
+def write_index(
+    directory: str,
+    ids: Sequence[str],
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    vectors: np.ndarray,
+    nlist: Optional[int] = None,
+    dtype: str = MMAP_INDEX_DTYPE,
+) -> str:
+    """
+    Builds a new version of the index in `directory` and makes it current
+
+    Args:
+        nlist: Number of inverted lists, the square root of the row count by default
+
+    Returns:
+        The path of the new version
+    """
+    os.makedirs(directory, exist_ok=True)
+    version = os.path.join(directory, f"v-{time.time_ns()}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(version)
+
+    vectors = _normalize(np.asarray(vectors, dtype=np.float32))
+    n, dim = vectors.shape
+    if n:
+        nlist = max(1, min(n, nlist or int(np.sqrt(n))))
+        centroids, assignment = kmeans(vectors, nlist)
+        order = np.argsort(assignment, kind="stable")
+        counts = np.bincount(assignment, minlength=nlist)
+    else:
+        nlist, centroids, order, counts = 0, np.zeros((0, dim), np.float32), [], []
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    np.save(os.path.join(version, "centroids.npy"), centroids.astype(np.float32))
+    np.save(os.path.join(version, "offsets.npy"), offsets)
+    np.save(os.path.join(version, "vectors.npy"), vectors[order].astype(dtype))
+    record_offsets = [0]
+    with open(os.path.join(version, "records.bin"), "wb") as f:
+        for row in order:
+            record = json.dumps(
+                {"id": ids[row], "text": texts[row], "metadata": metadatas[row]},
+                separators=(",", ":"),
+            ).encode("utf-8")
+            f.write(record)
+            record_offsets.append(record_offsets[-1] + len(record))
+    np.save(os.path.join(version, "records.npy"), np.asarray(record_offsets, np.int64))
+    with open(os.path.join(version, "index.json"), "w", encoding="utf-8") as f:
+        json.dump({"count": n, "dim": dim, "nlist": nlist, "dtype": dtype}, f)
+
+    pointer = os.path.join(directory, _POINTER)
+    with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version))
+    os.replace(pointer + ".tmp", pointer)
+    # The previous version stays for readers that resolved the pointer just
+    # before the switch, processes mapping older ones keep their pages anyway
+    versions = sorted(name for name in os.listdir(directory) if name.startswith("v-"))
+    for name in versions[:-2]:
+        shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return version
+
+
+class MmapIndex:
+    """
+    Read-only view of the current version of an index directory
+    """
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, _POINTER), encoding="utf-8") as f:
+            version = os.path.join(directory, f.read().strip())
+        with open(os.path.join(version, "index.json"), encoding="utf-8") as f:
+            header = json.load(f)
+        self.count: int = header["count"]
+        self.dim: int = header["dim"]
+        self.version = version
+
+        def load(name: str) -> np.ndarray:
+            # Empty arrays cannot be memory-mapped, they are tiny anyway
+            return np.load(
+                os.path.join(version, name), mmap_mode="r" if self.count else None
+            )
+
+        self.centroids = load("centroids.npy")
+        self.offsets = load("offsets.npy")
+        self.vectors = load("vectors.npy")
+        self.record_offsets = load("records.npy")
+        self._records = (
+            np.memmap(os.path.join(version, "records.bin"), dtype=np.uint8, mode="r")
+            if self.count and self.record_offsets[-1]
+            else np.zeros(0, np.uint8)
+        )
+
+    def __len__(self) -> int:
+        return self.count
+
+    def record(self, row: int) -> Dict[str, Any]:
+        start, end = self.record_offsets[row], self.record_offsets[row + 1]
+        return json.loads(self._records[start:end].tobytes())
+
+    def search(
+        self, query: Sequence[float], k: int = 4, nprobe: int = MMAP_INDEX_NPROBE
+    ) -> List[Tuple[int, float]]:
+        """
+        Returns the rows and cosine similarities of the approximate k nearest vectors
+        """
+        if not self.count:
+            return []
+        query = np.asarray(query, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1)
+        lists = np.argsort(-(self.centroids @ query))[:nprobe]
+        rows = np.concatenate(
+            [np.arange(self.offsets[i], self.offsets[i + 1]) for i in lists]
+        )
+        if not len(rows):
+            return []
+        scores = self.vectors[rows].astype(np.float32) @ query
+        best = np.argsort(-scores)[:k]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    def all_rows(self) -> Tuple[List[Dict[str, Any]], np.ndarray]:
+        records = [self.record(row) for row in range(self.count)]
+        return records, np.asarray(self.vectors, dtype=np.float32)
+
+
+class MmapVectorStore(VectorStore):
+    """
+    LangChain vector store over a memory-mapped IVF index. Queries only read
+    the probed lists; writes rebuild the index into a new version, which
+    suits corpora that are ingested in batches, not row by row.
+
+    Args:
+        directory: Where the index versions live, an empty index is created if missing
+        embeddings: Embeds the texts and the queries
+        nprobe: Inverted lists scanned per query
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        embeddings: Embeddings,
+        nprobe: int = MMAP_INDEX_NPROBE,
+    ):
+        self.directory = directory
+        self._embeddings = embeddings
+        self.nprobe = nprobe
+        if not os.path.exists(os.path.join(directory, _POINTER)):
+            write_index(directory, [], [], [], np.zeros((0, 0), np.float32))
+        self.index = MmapIndex(directory)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embeddings
+
+    def _rewrite(
+        self,
+        keep: Callable[[Dict[str, Any]], bool],
+        records: List[Dict[str, Any]],
+        vectors: np.ndarray,
+    ) -> None:
+        old_records, old_vectors = self.index.all_rows()
+        kept = [i for i, r in enumerate(old_records) if keep(r)]
+        parts = [old_vectors[kept]] if kept else []
+        if records:
+            parts.append(vectors)
+        vectors = (
+            np.concatenate(parts) if parts else np.zeros((0, self.index.dim), np.float32)
+        )
+        records = [old_records[i] for i in kept] + records
+        write_index(
+            self.directory,
+            [r["id"] for r in records],
+            [r["text"] for r in records],
+            [r["metadata"] for r in records],
+            vectors,
+            dtype=MMAP_INDEX_DTYPE,
+        )
+        self.index = MmapIndex(self.directory)
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        ids = list(ids) if ids else [uuid.uuid4().hex for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        vectors = np.asarray(self._embeddings.embed_documents(texts), dtype=np.float32)
+        new_ids = set(ids)
+        records = [
+            {"id": i, "text": t, "metadata": m or {}}
+            for i, t, m in zip(ids, texts, metadatas)
+        ]
+        # Re-added ids replace their old rows
+        self._rewrite(lambda r: r["id"] not in new_ids, records, vectors)
+        return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return None
+        removed = set(ids)
+        self._rewrite(lambda r: r["id"] not in removed, [], np.zeros((0, 0)))
+        return True
+
+    def get(self, include: Optional[List[str]] = None) -> Dict[str, List[Any]]:
+        """
+        Every stored chunk, in the layout of `Chroma.get`
+        """
+        records = [self.index.record(row) for row in range(len(self.index))]
+        return {
+            "ids": [r["id"] for r in records],
+            "documents": [r["text"] for r in records],
+            "metadatas": [r["metadata"] for r in records],
+        }
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        wanted = set(ids)
+        return [
+            Document(id=r["id"], page_content=r["text"], metadata=r["metadata"])
+            for r in (self.index.record(row) for row in range(len(self.index)))
+            if r["id"] in wanted
+        ]
+
+    def similarity_search_by_vector_with_score(
+        self, embedding: List[float], k: int = 4
+    ) -> List[Tuple[Document, float]]:
+        results = []
+        for row, score in self.index.search(embedding, k, self.nprobe):
+            record = self.index.record(row)
+            document = Document(
+                id=record["id"], page_content=record["text"], metadata=record["metadata"]
+            )
+            results.append((document, score))
+        return results
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        return [d for d, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embeddings.embed_query(query)
+        return self.similarity_search_by_vector_with_score(embedding, k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [d for d, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self) -> Callable[[float], float]:
+        # Cosine similarity of normalized vectors, mapped from [-1, 1] to [0, 1]
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[dict]] = None,
+        *,
+        ids: Optional[List[str]] = None,
+        directory: str = "./.mmap_index",
+        **kwargs: Any,
+    ) -> "MmapVectorStore":
+        store = cls(directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
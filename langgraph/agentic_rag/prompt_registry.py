@@ -0,0 +1,157 @@
+"""
+Versioned local copies of the LangChain hub prompts the projects use.
+
+Every prompt is a JSON file under prompts/ holding the serialized template
+and the sha256 of its content, checked on load. Loading reads the file once
+per process, nothing goes over the network: a process starts the same with
+or without the hub. The copies only change through `refresh`, which pulls
+the current hub version and reports which hashes moved, so a prompt change
+shows up as a diff in review.
+
+    python prompt_registry.py list
+    python prompt_registry.py refresh [rlm/rag-prompt ...]
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import warnings
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from langchain_core.load import dumpd, load
+from langchain_core.prompts import BasePromptTemplate
+
+# Directory of the prompt copies
+PROMPTS_DIR = os.getenv(
+    "PROMPTS_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "prompts")
+)
+
+# The hub prompts vendored here, `refresh` pulls them all by default
+HUB_PROMPTS = ("rlm/rag-prompt", "langchain-ai/retrieval-qa-chat")
+
+
+def prompt_path(name: str, directory: str = PROMPTS_DIR) -> str:
+    owner, _, repo = name.partition("/")
+    return os.path.join(directory, owner, f"{repo}.json")
+
+
+def content_hash(serialized: Dict[str, Any]) -> str:
+    canonical = json.dumps(serialized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def read_entry(name: str, directory: str = PROMPTS_DIR) -> Dict[str, Any]:
+    """
+    The stored entry of a prompt, its hash checked against its content
+
+    Raises:
+        FileNotFoundError: The prompt was never vendored
+        ValueError: The content does not match its hash
+    """
+    path = prompt_path(name, directory)
+    try:
+        with open(path, encoding="utf-8") as file:
+            entry = json.load(file)
+    except FileNotFoundError as error:
+        raise FileNotFoundError(
+            f"No local copy of the {name} prompt at {path}, "
+            f"run python prompt_registry.py refresh {name}"
+        ) from error
+    if content_hash(entry["prompt"]) != entry["sha256"]:
+        raise ValueError(
+            f"{path} does not match its sha256, it was edited by hand: "
+            f"run python prompt_registry.py refresh {name}"
+        )
+    return entry
+
+
+@lru_cache(maxsize=None)
+def load_prompt(name: str, directory: str = PROMPTS_DIR) -> BasePromptTemplate:
+    """
+    The local copy of the hub prompt `name`, a drop-in for `hub.pull(name)`
+    """
+    with warnings.catch_warnings():
+        # langchain_core.load is flagged beta, the prompt classes it revives are not
+        warnings.simplefilter("ignore")
+        return load(read_entry(name, directory)["prompt"], allowed_objects="core")
+
+
+def save_prompt(
+    name: str,
+    prompt: BasePromptTemplate,
+    directory: str = PROMPTS_DIR,
+    hub_commit: Optional[str] = None,
+) -> str:
+    """
+    Writes the copy of a prompt, atomically
+
+    Returns:
+        The sha256 of its content
+    """
+    serialized = dumpd(prompt)
+    # The hub stamps its own bookkeeping in the metadata, it is not part of the prompt
+    serialized["kwargs"].pop("metadata", None)
+    entry = {
+        "name": name,
+        "hub_commit": hub_commit,
+        "sha256": content_hash(serialized),
+        "prompt": serialized,
+    }
+    path = prompt_path(name, directory)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w", encoding="utf-8") as file:
+        json.dump(entry, file, indent=2, sort_keys=True)
+        file.write("\n")
+    os.replace(path + ".tmp", path)
+    load_prompt.cache_clear()
+    return entry["sha256"]
+
+
+def refresh(
+    names: Iterable[str] = HUB_PROMPTS, directory: str = PROMPTS_DIR
+) -> Dict[str, Tuple[Optional[str], str]]:
+    """
+    Pulls the current hub version of every prompt and stores it
+
+    Returns:
+        The previous (None if new) and the current hash of every prompt
+    """
+    # Only the refresh talks to the hub. langchain.hub.pull refuses public
+    # prompts, the copy is reviewed as a diff before it is committed instead
+    from langsmith import Client
+
+    client = Client()
+    changes = {}
+    for name in names:
+        try:
+            previous = read_entry(name, directory)["sha256"]
+        except (FileNotFoundError, ValueError):
+            previous = None
+        prompt = client.pull_prompt(name, dangerously_pull_public_prompt=True)
+        commit = (prompt.metadata or {}).get("lc_hub_commit_hash")
+        changes[name] = (previous, save_prompt(name, prompt, directory, commit))
+    return changes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local copies of the hub prompts")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="Show the stored prompts and their hashes")
+    refresh_parser = commands.add_parser("refresh", help="Pull the prompts from the hub")
+    refresh_parser.add_argument("names", nargs="*", default=list(HUB_PROMPTS))
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for name in HUB_PROMPTS:
+            entry = read_entry(name)
+            print(f"{name:<32} {entry['sha256'][:12]} hub commit {entry['hub_commit']}")
+    else:
+        for name, (previous, current) in refresh(args.names).items():
+            status = (
+                "unchanged"
+                if previous == current
+                else f"{(previous or 'new')[:12]} -> {current[:12]}"
+            )
+            print(f"{name:<32} {current[:12]} {status}")
@@ -0,0 +1,16 @@
+"""
+Draws the compiled agentic RAG graph, kept out of the import path on purpose
+
+    python render.py [--output graph.png]
+"""
+
+import argparse
+
+from graph.graph import get_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--output", default="graph.png")
+    args = parser.parse_args()
+    get_app().get_graph().draw_mermaid_png(output_file_path=args.output)
+    print(f"Graph written to {args.output}")
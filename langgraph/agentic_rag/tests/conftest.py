@@ -0,0 +1,145 @@
+import sys
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Iterator, List
+
+import pytest
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableGenerator, RunnableLambda
+
+import graph.graph as graph_module
+import ingestion
+from graph.context_packing import ContextPacker
+from graph.embeddings import HashingEmbeddings
+
+
+class WordEncoding:
+    """
+    Stands in for tiktoken, whose vocabulary files need a download: one token
+    per whitespace separated word
+    """
+
+    def encode(self, text: str, disallowed_special=()) -> List[str]:
+        return text.split()
+
+    def decode(self, tokens: List[str]) -> str:
+        return " ".join(tokens)
+
+
+@pytest.fixture
+def word_encoding() -> WordEncoding:
+    return WordEncoding()
+
+
+@pytest.fixture
+def word_splitter(monkeypatch, word_encoding) -> None:
+    """
+    Ingestion chunks by words instead of by tiktoken tokens
+    """
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=250,
+        chunk_overlap=0,
+        length_function=lambda text: len(word_encoding.encode(text)),
+    )
+    monkeypatch.setattr(ingestion, "get_text_splitter", lambda: splitter)
+
+
+@pytest.fixture
+def fake_graph(monkeypatch, word_encoding):
+    """
+    The compiled graph with every LLM and search call replaced, `verdicts` is
+    the sequence of generation grades the graders hand out
+    """
+    calls = {"generations": 0, "searches": 0, "verdicts": []}
+
+    def generation(inputs: Iterator[Any]) -> Iterator[str]:
+        for _ in inputs:
+            pass
+        calls["generations"] += 1
+        yield from ["answer", " ", str(calls["generations"])]
+
+    async def agenerate(inputs: AsyncIterator[Any]) -> AsyncIterator[str]:
+        async for _ in inputs:
+            pass
+        calls["generations"] += 1
+        for token in ["answer", " ", str(calls["generations"])]:
+            yield token
+
+    def grade(question, documents, generation, concurrent=False):
+        verdicts = calls["verdicts"]
+        return verdicts.pop(0) if len(verdicts) > 1 else verdicts[0]
+
+    def search(question):
+        calls["searches"] += 1
+        return [Document(page_content="from the web", metadata={"url": "https://a"})]
+
+    # graph.nodes re-exports the node functions under the module names
+    nodes = {
+        name: sys.modules[f"graph.nodes.{name}"]
+        for name in (
+            "generate",
+            "grade_documents",
+            "grade_generation",
+            "rerank",
+            "retrieve",
+            "web_search",
+        )
+    }
+    router = SimpleNamespace(route=lambda q: "vectorstore")
+    monkeypatch.setattr(graph_module, "get_local_router", lambda: router)
+    monkeypatch.setattr(
+        nodes["retrieve"],
+        "retrieve_documents",
+        lambda q: [Document(page_content="memory")],
+    )
+    monkeypatch.setattr(nodes["rerank"], "get_embeddings", HashingEmbeddings)
+    monkeypatch.setattr(
+        nodes["grade_documents"],
+        "get_retrieval_grader",
+        lambda: RunnableLambda(lambda inputs: SimpleNamespace(binary_score="yes")),
+    )
+    monkeypatch.setattr(
+        nodes["generate"],
+        "get_generation_chain",
+        lambda: RunnableGenerator(generation, agenerate),
+    )
+    monkeypatch.setattr(nodes["generate"], "count_tokens", lambda t: len(t.split()))
+    packer = ContextPacker(encoding=word_encoding)
+    for name in ("generate", "grade_generation"):
+        monkeypatch.setattr(nodes[name], "get_context_packer", lambda: packer)
+    monkeypatch.setattr(nodes["grade_generation"], "grade_generation", grade)
+    monkeypatch.setattr(nodes["web_search"], "search_web", search)
+    # Grades shared by earlier tests must not answer for this one's grader
+    nodes["grade_documents"].get_relevance_grades().clear()
+    return graph_module.workflow.compile(), calls
+
+
+@pytest.fixture
+def fake_async_graph(monkeypatch, fake_graph):
+    """
+    `fake_graph` compiled from the async workflow, with the same fakes
+    """
+    _, calls = fake_graph
+    nodes = {
+        name: sys.modules[f"graph.nodes.{name}"]
+        for name in ("grade_generation", "retrieve", "web_search")
+    }
+    retrieve, grade, search = (
+        nodes["retrieve"].retrieve_documents,
+        nodes["grade_generation"].grade_generation,
+        nodes["web_search"].search_web,
+    )
+
+    async def aretrieve(question):
+        return retrieve(question)
+
+    async def agrade(question, documents, generation, concurrent=False):
+        return grade(question, documents, generation, concurrent)
+
+    async def asearch(question):
+        return search(question)
+
+    monkeypatch.setattr(nodes["retrieve"], "aretrieve_documents", aretrieve)
+    monkeypatch.setattr(nodes["grade_generation"], "agrade_generation", agrade)
+    monkeypatch.setattr(nodes["web_search"], "asearch_web", asearch)
+    return graph_module.async_workflow.compile(), calls
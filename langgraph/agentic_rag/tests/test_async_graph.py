@@ -0,0 +1,89 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from langchain_core.runnables import RunnableLambda
+
+from batching import SingleFlight
+from graph.budgets import ANSWERED, WEB_SEARCHES
+from graph.chains.generation_grader import NOT_SUPPORTED, NOT_USEFUL, USEFUL
+from graph.nodes.grade_documents import agrade_concurrently
+
+
+def test_async_graph_answers_like_the_sync_one(fake_graph, fake_async_graph) -> None:
+    app, calls = fake_graph
+    async_app, _ = fake_async_graph
+    question = {"question": "What is agent memory?", "max_web_searches": 1}
+
+    calls["verdicts"] = [NOT_USEFUL, NOT_SUPPORTED, NOT_USEFUL]
+    expected = app.invoke(question)
+    calls.update(generations=0, searches=0, verdicts=[NOT_USEFUL, NOT_SUPPORTED, NOT_USEFUL])
+    result = asyncio.run(async_app.ainvoke(question))
+
+    assert result["stop_reason"] == expected["stop_reason"] == WEB_SEARCHES
+    assert result["generation"] == expected["generation"] == "answer 3"
+    assert calls["searches"] == 1
+
+
+def test_async_graph_streams_tokens(fake_async_graph) -> None:
+    app, calls = fake_async_graph
+    calls["verdicts"] = [USEFUL]
+
+    async def stream():
+        return [
+            chunk["token"]
+            async for chunk in app.astream(
+                {"question": "What is agent memory?"}, stream_mode="custom"
+            )
+        ]
+
+    assert asyncio.run(stream()) == ["answer", " ", "1"]
+
+
+def test_async_graph_serves_concurrent_questions(fake_async_graph) -> None:
+    app, calls = fake_async_graph
+    calls["verdicts"] = [USEFUL]
+
+    async def answer_all():
+        questions = [{"question": f"What is agent memory {i}?"} for i in range(20)]
+        return await app.abatch(questions)
+
+    results = asyncio.run(answer_all())
+
+    assert [r["stop_reason"] for r in results] == [ANSWERED] * 20
+    assert calls["generations"] == 20
+
+
+def test_async_grading_stops_early_and_cancels_the_rest() -> None:
+    async def grade(inputs):
+        await asyncio.sleep(0 if inputs["documents"] in ("a", "b") else 1)
+        return SimpleNamespace(binary_score="yes")
+
+    grader = RunnableLambda(lambda inputs: None, afunc=grade)
+    start = time.perf_counter()
+    relevant, web_search = asyncio.run(
+        agrade_concurrently(
+            grader, "q", ["a", "b", "c", "d"], max_concurrency=4, min_relevant=2
+        )
+    )
+
+    assert relevant == ["a", "b"]
+    assert web_search is False
+    assert time.perf_counter() - start < 0.5
+
+
+def test_single_flight_shares_a_coroutine_with_concurrent_callers() -> None:
+    flight = SingleFlight("test")
+    calls = []
+
+    async def call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def ask_all():
+        return await asyncio.gather(*(flight.ado("key", call) for _ in range(5)))
+
+    assert asyncio.run(ask_all()) == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats()["shared"] == 4
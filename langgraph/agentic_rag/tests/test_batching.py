@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import time
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.runnables import RunnableLambda
+
+import graph.chains.retrieval_grader as retrieval_grader
+from batching import QueryBatcher, SingleFlight
+from graph.chains.retrieval_grader import ChunkGrade, GradeDocuments, GradeDocumentsBatch
+from graph.nodes.grade_documents import (
+    get_relevance_grades,
+    grade_batched_shared,
+    grade_concurrently,
+    pair_key,
+    share_grades,
+)
+from graph.serving import ServingGraph
+from tests.test_embedding_cache import CountingEmbeddings
+
+
+def run_concurrently(function, count: int) -> List:
+    results = [None] * count
+
+    def target(i: int) -> None:
+        results[i] = function(i)
+
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_concurrent_calls_of_a_key_share_one_call() -> None:
+    flight = SingleFlight("test")
+    calls = []
+
+    def slow(i: int) -> str:
+        calls.append(i)
+        time.sleep(0.05)
+        return "answer"
+
+    results = run_concurrently(lambda i: flight.do("key", lambda: slow(i)), 8)
+
+    assert results == ["answer"] * 8
+    assert len(calls) == 1
+    assert flight.stats()["calls"] == 1
+    assert flight.stats()["shared"] == 7
+    # Nothing is kept without a capacity, the next call runs again
+    flight.do("key", lambda: slow(-1))
+    assert len(calls) == 2
+
+
+def test_failures_reach_every_waiting_caller_and_are_not_kept() -> None:
+    flight = SingleFlight("test")
+
+    def failing() -> None:
+        time.sleep(0.05)
+        raise RuntimeError("backend down")
+
+    def call(i: int) -> str:
+        try:
+            flight.do("key", failing)
+        except RuntimeError as error:
+            return str(error)
+
+    assert run_concurrently(call, 4) == ["backend down"] * 4
+    assert flight.do("key", lambda: "recovered") == "recovered"
+
+
+def test_kept_results_expire() -> None:
+    now = [0.0]
+    flight = SingleFlight("test", capacity=2, ttl=10, clock=lambda: now[0])
+
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("a", lambda: 2) == 1
+    now[0] = 11
+    assert flight.do("a", lambda: 3) == 3
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others() -> None:
+    flight = SingleFlight("test")
+    calls = []
+
+    async def slow() -> str:
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "answer"
+
+    async def main(cancelled: int) -> List:
+        tasks = [asyncio.create_task(flight.ado("key", slow)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        tasks[cancelled].cancel()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+
+    # A follower gives up, the leader and the other follower get the answer
+    results = asyncio.run(main(cancelled=1))
+    assert results[0] == results[2] == "answer"
+    assert isinstance(results[1], asyncio.CancelledError)
+    assert len(calls) == 1
+
+    # The leader gives up, a follower makes the call for the one left
+    results = asyncio.run(main(cancelled=0))
+    assert isinstance(results[0], asyncio.CancelledError)
+    assert results[1:] == ["answer", "answer"]
+    assert len(calls) == 3
+    assert not flight._inflight
+
+
+def test_queries_of_a_tick_are_embedded_in_one_call() -> None:
+    inner = CountingEmbeddings()
+    batcher = QueryBatcher(inner, tick=0.05)
+    texts = ["agent", "memory", "agent", "planning"]
+
+    vectors = run_concurrently(lambda i: batcher.embed_query(texts[i]), len(texts))
+
+    assert sorted(inner.embedded) == ["agent", "memory", "planning"]
+    assert batcher.stats()["calls"] == 1
+    assert vectors == [inner.embed_query(t) for t in texts]
+
+
+def test_cancelled_queries_do_not_strand_their_tick() -> None:
+    inner = CountingEmbeddings()
+    batcher = QueryBatcher(inner, tick=0.05)
+
+    async def main() -> List:
+        # The leader of the tick and a caller of a shared query give up
+        leader = asyncio.create_task(batcher.aembed_query("agent"))
+        await asyncio.sleep(0.01)
+        others = [asyncio.create_task(batcher.aembed_query(t)) for t in ("memory", "memory")]
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        others[0].cancel()
+        vector = await asyncio.wait_for(others[1], 1)
+        # The next tick starts afresh
+        return [vector, await asyncio.wait_for(batcher.aembed_query("planning"), 1)]
+
+    assert asyncio.run(main()) == [inner.embed_query("memory"), inner.embed_query("planning")]
+    assert not batcher._pending
+    assert batcher.stats()["calls"] == 2
+
+
+def test_batch_runs_identical_requests_once() -> None:
+    calls = []
+
+    class App:
+        def invoke(self, input, config=None):
+            calls.append(input["question"])
+            time.sleep(0.05)
+            return {"question": input["question"], "generation": input["question"].upper()}
+
+    inputs = [{"question": q} for q in ["a?", "b?", "A? ", "a?"]]
+    results = ServingGraph(App(), max_concurrency=4).batch(inputs)
+
+    assert len(calls) == 2
+    assert [r["question"] for r in results] == ["a?", "b?", "A? ", "a?"]
+    assert results[1]["generation"] == "B?"
+
+
+@pytest.fixture
+def grades():
+    get_relevance_grades().clear()
+    yield get_relevance_grades()
+    get_relevance_grades().clear()
+
+
+def test_question_chunk_grades_are_shared_across_requests(grades) -> None:
+    graded = []
+
+    def grade(inputs):
+        graded.append(inputs["documents"].page_content)
+        return GradeDocuments(binary_score="yes" if "memory" in graded[-1] else "no")
+
+    grader = share_grades(RunnableLambda(grade))
+    documents = [Document(page_content="memory"), Document(page_content="football")]
+
+    first = grade_concurrently(grader, "What is memory?", documents)
+    second = grade_concurrently(grader, "What is memory?", list(reversed(documents)))
+
+    assert first == ([documents[0]], True)
+    assert second == ([documents[0]], True)
+    assert sorted(graded) == ["football", "memory"]
+
+
+def test_batched_grading_only_grades_unknown_pairs(grades, monkeypatch) -> None:
+    monkeypatch.setattr(retrieval_grader, "count_tokens", lambda t: len(t.split()))
+    graded = []
+
+    def grade(inputs):
+        graded.append(inputs["chunks"])
+        ids = range(inputs["chunks"].count("<chunk id="))
+        return GradeDocumentsBatch(
+            scores=[ChunkGrade(chunk_id=i, binary_score="yes") for i in ids]
+        )
+
+    memory, agents = Document(page_content="memory"), Document(page_content="agents")
+    grades.put(pair_key("What is memory?", memory), GradeDocuments(binary_score="no"))
+
+    filtered, web_search = grade_batched_shared(
+        RunnableLambda(grade), "What is memory?", [memory, agents]
+    )
+
+    assert filtered == [agents]
+    assert web_search
+    assert len(graded) == 1 and "memory" not in graded[0]
+    assert grades.get(pair_key("What is memory?", agents)).binary_score == "yes"
@@ -0,0 +1,45 @@
+from graph.budgets import ANSWERED, DEADLINE, REGENERATIONS, WEB_SEARCHES
+from graph.chains.generation_grader import NOT_SUPPORTED, NOT_USEFUL, USEFUL
+
+
+def test_useful_generation_is_answered(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [USEFUL]
+
+    result = app.invoke({"question": "What is agent memory?"})
+
+    assert result["stop_reason"] == ANSWERED
+    assert result["generation"] == "answer 1"
+
+
+def test_regenerations_are_bounded(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_SUPPORTED]
+
+    result = app.invoke({"question": "What is agent memory?", "max_regenerations": 2})
+
+    assert result["stop_reason"] == REGENERATIONS
+    assert calls["generations"] == 3
+
+
+def test_web_searches_are_bounded_and_keep_best_answer(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_USEFUL, NOT_SUPPORTED, NOT_USEFUL]
+
+    result = app.invoke({"question": "What is agent memory?", "max_web_searches": 1})
+
+    assert result["stop_reason"] == WEB_SEARCHES
+    assert calls["searches"] == 1
+    # The ungrounded second answer is never returned
+    assert result["generation"] == "answer 3"
+
+
+def test_deadline_returns_best_answer_without_grading(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_USEFUL]
+
+    result = app.invoke({"question": "What is agent memory?", "deadline_s": 0})
+
+    assert result["stop_reason"] == DEADLINE
+    assert result["verdict"] is None
+    assert calls["generations"] == 1
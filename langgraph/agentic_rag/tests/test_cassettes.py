@@ -0,0 +1,163 @@
+import asyncio
+import json
+from typing import Any, Dict, List
+
+import httpx
+import pytest
+from langchain_core.documents import Document
+from langchain_core.vectorstores import InMemoryVectorStore
+from langchain_openai import ChatOpenAI
+
+import ingestion
+from cassettes import (
+    RECORD,
+    REPLAY,
+    Cassette,
+    CassetteEmbeddings,
+    CassetteMiss,
+    CassetteRetriever,
+    CassetteSearch,
+    CassetteTransport,
+    get_cassette,
+    use_cassette,
+)
+from graph.chains.clients import ClientRegistry
+from graph.embeddings import HashingEmbeddings
+from graph.nodes.web_search import get_web_search_tool
+
+MODEL = "gpt-test"
+
+
+def chunk(delta: Dict[str, Any]) -> str:
+    body = {
+        "id": "chatcmpl-1",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": MODEL,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(body)}\n\n"
+
+
+def provider(requests: List[Dict[str, Any]]) -> httpx.MockTransport:
+    """
+    Answers chat completions with "hello", streamed when asked to
+    """
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        if body.get("stream"):
+            events = [chunk({"role": "assistant", "content": "hel"}), chunk({"content": "lo"})]
+            return httpx.Response(
+                200,
+                headers={"content-type": "text/event-stream"},
+                content="".join(events + ["data: [DONE]\n\n"]).encode(),
+            )
+        message = {"role": "assistant", "content": "hello"}
+        return httpx.Response(
+            200,
+            json={
+                "id": "chatcmpl-1",
+                "object": "chat.completion",
+                "created": 0,
+                "model": MODEL,
+                "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+            },
+        )
+
+    return httpx.MockTransport(handle)
+
+
+def test_chat_calls_replay_offline(tmp_path, monkeypatch) -> None:
+    path = str(tmp_path / "chat.json")
+    requests: List[Dict[str, Any]] = []
+    transport = CassetteTransport(Cassette(path, RECORD), provider(requests))
+    recording = ChatOpenAI(
+        model=MODEL, api_key="test", http_client=httpx.Client(transport=transport)
+    )
+    recording.invoke("What is  agent\nmemory?")
+    "".join(c.content for c in recording.stream("Stream it"))
+    assert len(requests) == 2
+
+    # No key, and nothing listens on the discard port
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    registry = ClientRegistry(cassette=Cassette(path, REPLAY))
+    model = registry.chat_model(MODEL, base_url="http://127.0.0.1:9/v1", max_retries=0)
+
+    # Whitespace does not change the key
+    assert model.invoke("What is agent memory?").content == "hello"
+    assert "".join(c.content for c in model.stream("Stream it")) == "hello"
+    assert asyncio.run(model.ainvoke("What is agent memory?")).content == "hello"
+    assert len(requests) == 2
+    # The limiter never saw the replayed calls
+    assert registry.stats()[MODEL]["in_flight"] == 0
+
+
+def test_embeddings_replay_whatever_the_batches(tmp_path) -> None:
+    path = str(tmp_path / "embeddings.json")
+    inner = HashingEmbeddings(n_features=64)
+    recorder = CassetteEmbeddings(Cassette(path, RECORD), inner)
+    vectors = recorder.embed_documents(["agent memory", "task planning"])
+    # Attributes of the wrapped embeddings stay reachable while recording
+    assert recorder.model == "hashing-64"
+
+    replayer = CassetteEmbeddings(Cassette(path, REPLAY))
+    assert replayer.embed_query("task planning") == vectors[1]
+    assert asyncio.run(replayer.aembed_documents(["task planning", "agent memory"])) == [
+        vectors[1],
+        vectors[0],
+    ]
+    with pytest.raises(CassetteMiss, match="never asked"):
+        replayer.embed_query("never asked")
+
+
+def test_repeated_requests_replay_their_responses_in_turn(tmp_path) -> None:
+    path = str(tmp_path / "search.json")
+    answers = iter(["first", "second"])
+
+    class Tool:
+        def invoke(self, query: str) -> Dict[str, Any]:
+            return {"query": query, "answer": next(answers)}
+
+    recorder = CassetteSearch(Cassette(path, RECORD), Tool())
+    recorder.invoke("agent memory")
+    recorder.invoke("agent memory")
+
+    replayer = CassetteSearch(Cassette(path, REPLAY))
+    assert [replayer.invoke("agent memory")["answer"] for _ in range(3)] == [
+        "first",
+        "second",
+        "first",
+    ]
+
+
+def test_replay_can_take_the_recorded_latency(tmp_path) -> None:
+    path = str(tmp_path / "latency.json")
+    Cassette(path, RECORD).record("search", {"query": "q"}, {"results": []}, 0.25)
+    slept = []
+
+    for latency in (True, False):
+        cassette = Cassette(path, REPLAY, latency=latency, sleep=slept.append)
+        assert cassette.call("search", {"query": "q"}, None) == {"results": []}
+
+    assert slept == [0.25]
+
+
+def test_use_cassette_serves_the_app_backends(tmp_path, monkeypatch) -> None:
+    path = str(tmp_path / "app.json")
+    documents = [Document(id="1", page_content="agent memory", metadata={"source": "a"})]
+    store = InMemoryVectorStore(HashingEmbeddings(n_features=64))
+    store.add_documents(documents)
+    recorder = CassetteRetriever(cassette=Cassette(path, RECORD), retriever=store.as_retriever())
+    assert recorder.invoke("agent memory") == documents
+
+    # Neither the collection nor the keys are needed to replay
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("TAVILY_API_KEY", raising=False)
+    with use_cassette(Cassette(path, REPLAY)):
+        assert ingestion.get_retriever().invoke("agent memory") == documents
+        assert isinstance(ingestion.get_embeddings().embeddings, CassetteEmbeddings)
+        assert isinstance(get_web_search_tool(), CassetteSearch)
+    assert get_cassette() is None
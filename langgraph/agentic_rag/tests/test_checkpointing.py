@@ -0,0 +1,145 @@
+import sys
+import time
+
+import pytest
+from langchain_core.documents import Document
+
+import graph.graph as graph_module
+from graph.documents import get_document_store, load_documents
+from graph.chains.generation_grader import NOT_USEFUL, USEFUL
+from graph.checkpointing import (
+    CheckpointedGraph,
+    DocumentRefSerializer,
+    QuestionThreads,
+    SqliteDocumentStore,
+    get_checkpointer,
+    thread_id_for,
+)
+
+pytest.importorskip("langgraph.checkpoint.sqlite")
+
+
+def test_snapshots_refer_to_documents_stored_once(tmp_path) -> None:
+    store = SqliteDocumentStore(str(tmp_path / "checkpoints.sqlite"))
+    serde = DocumentRefSerializer(store)
+    document = Document(id="a", page_content="long page text " * 50, metadata={"page": 3})
+    state = {"question": "q", "documents": [document, document]}
+
+    first = serde.dumps_typed(state)
+    second = serde.dumps_typed({**state, "generation": "answer"})
+
+    assert b"long page text" not in first[1] + second[1]
+    assert store._conn.execute("SELECT COUNT(*) FROM documents").fetchone() == (1,)
+    store._cache.clear()
+    assert serde.loads_typed(first) == state
+
+
+def test_thread_ids_ignore_case_and_whitespace() -> None:
+    assert thread_id_for("What is  agent memory?") == thread_id_for("what is agent memory?")
+    assert thread_id_for("What is agent memory?") != thread_id_for("What is a prompt?")
+
+
+@pytest.fixture
+def checkpointed(fake_graph, monkeypatch, tmp_path):
+    _, calls = fake_graph
+    calls["retrievals"] = 0
+
+    def retrieve(question):
+        calls["retrievals"] += 1
+        return [Document(page_content="memory")]
+
+    monkeypatch.setattr(sys.modules["graph.nodes.retrieve"], "retrieve_documents", retrieve)
+    path = str(tmp_path / "checkpoints.sqlite")
+    app = graph_module.workflow.compile(checkpointer=get_checkpointer(path))
+    yield CheckpointedGraph(app, QuestionThreads(path)), calls
+    get_checkpointer.cache_clear()
+    get_document_store.cache_clear()
+
+
+def test_an_interrupted_run_resumes_after_the_last_completed_node(
+    checkpointed, monkeypatch
+) -> None:
+    app, calls = checkpointed
+    calls["verdicts"] = [USEFUL]
+    grader = sys.modules["graph.nodes.grade_generation"]
+    grade = grader.grade_generation
+
+    def crash(*args, **kwargs):
+        raise TimeoutError("grader timed out")
+
+    monkeypatch.setattr(grader, "grade_generation", crash)
+    question = {"question": "What is agent memory?", "deadline_s": 60}
+    with pytest.raises(TimeoutError):
+        app.invoke(question)
+    thread_id = app.thread_of(question["question"])
+    started_at = app.get_state({"configurable": {"thread_id": thread_id}}).values["started_at"]
+
+    monkeypatch.setattr(grader, "grade_generation", grade)
+    time.sleep(0.01)
+    result = app.invoke(question)
+
+    assert result["stop_reason"] == "answered"
+    assert app.thread_of(question["question"]) == thread_id
+    assert calls["retrievals"] == 1
+    assert calls["generations"] == 1
+    assert result["started_at"] > started_at
+    assert result["deadline"] == pytest.approx(result["started_at"] + 60)
+
+
+def test_a_finished_question_runs_again_in_a_new_thread(checkpointed) -> None:
+    app, calls = checkpointed
+    # The first run keeps a grounded fallback answer before the useful one
+    calls["verdicts"] = [NOT_USEFUL, USEFUL]
+    first = app.invoke({"question": "What is agent memory?"})
+    first_thread = app.thread_of("What is agent memory?")
+    assert first["grounded_generation"] == "answer 1"
+
+    # Out of time before grading, the run answers with its own generation
+    calls["verdicts"] = [USEFUL]
+    result = app.invoke({"question": "What is agent memory?", "deadline_s": 0})
+
+    assert result["stop_reason"] == "deadline"
+    assert result["generation"] == "answer 3"
+    assert "grounded_generation" not in result
+    assert calls["retrievals"] == 2
+    assert app.thread_of("What is agent memory?") != first_thread
+    config = {"configurable": {"thread_id": first_thread}}
+    assert app.get_state(config).values["generation"] == "answer 2"
+
+
+def test_concurrent_runs_of_a_question_get_their_own_threads(checkpointed) -> None:
+    app, calls = checkpointed
+    calls["verdicts"] = [USEFUL]
+    question = "What is agent memory?"
+
+    threads = [app._claim_thread(question), app._claim_thread(question)]
+    for thread_id in threads:
+        app._release({"configurable": {"thread_id": thread_id}})
+
+    assert threads[0] != threads[1]
+    assert all(t.startswith(thread_id_for(question)) for t in threads)
+
+
+def test_another_process_resumes_with_the_documents_of_the_database(
+    checkpointed, monkeypatch
+) -> None:
+    app, calls = checkpointed
+    calls["verdicts"] = [USEFUL]
+    grader = sys.modules["graph.nodes.grade_generation"]
+    grade = grader.grade_generation
+
+    def crash(*args, **kwargs):
+        raise TimeoutError("grader timed out")
+
+    monkeypatch.setattr(grader, "grade_generation", crash)
+    with pytest.raises(TimeoutError):
+        app.invoke({"question": "What is agent memory?"})
+    # Nothing left in memory, as in a new process
+    get_document_store()._documents.clear()
+    app = CheckpointedGraph(app.app, QuestionThreads(app.threads.path))
+    monkeypatch.setattr(grader, "grade_generation", grade)
+    result = app.invoke({"question": "What is agent memory?"})
+
+    assert result["stop_reason"] == "answered"
+    assert calls["retrievals"] == 1
+    assert [d.page_content for d in load_documents(result["documents"])] == ["memory"]
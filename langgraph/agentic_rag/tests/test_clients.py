@@ -0,0 +1,191 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List
+
+import openai
+import pytest
+
+import graph.metrics as metrics_module
+from graph.chains.clients import ClientRegistry, ModelLimiter, Overloaded
+from graph.metrics import LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_SHED, Metrics
+
+MODEL = "gpt-test"
+
+
+class StandIn:
+    """
+    Local OpenAI chat completions endpoint: records the client port of every
+    request and the limiter state seen while answering, `statuses` are
+    answered first, then 200s
+    """
+
+    def __init__(self) -> None:
+        self.ports: List[int] = []
+        self.in_flight: List[int] = []
+        self.statuses: List[int] = []
+        self.limiter: Any = None
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                self.rfile.read(int(self.headers["Content-Length"]))
+                stand_in.ports.append(self.client_address[1])
+                if stand_in.limiter is not None:
+                    stand_in.in_flight.append(stand_in.limiter.in_flight)
+                status = stand_in.statuses.pop(0) if stand_in.statuses else 200
+                body = json.dumps(stand_in.completion() if status == 200 else {})
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                if status == 429:
+                    self.send_header("retry-after", "20")
+                self.end_headers()
+                self.wfile.write(body.encode())
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    @staticmethod
+    def completion() -> Dict[str, Any]:
+        return {
+            "id": "chatcmpl-1",
+            "object": "chat.completion",
+            "created": 0,
+            "model": MODEL,
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "hello"},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 5, "completion_tokens": 1, "total_tokens": 6},
+        }
+
+
+@pytest.fixture
+def stand_in() -> Iterator[StandIn]:
+    server = StandIn()
+    thread = threading.Thread(target=server.server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.server.shutdown()
+    server.server.server_close()
+
+
+@pytest.fixture
+def metrics(monkeypatch) -> Metrics:
+    registry = Metrics(enabled=True)
+    monkeypatch.setattr(metrics_module, "get_metrics", lambda: registry)
+    monkeypatch.setattr("graph.chains.clients.get_metrics", lambda: registry)
+    return registry
+
+
+def chat_model(registry: ClientRegistry, stand_in: StandIn, **kwargs: Any) -> Any:
+    return registry.chat_model(
+        MODEL, base_url=stand_in.url, api_key="test", max_retries=0, **kwargs
+    )
+
+
+def test_chat_models_of_a_model_share_one_keep_alive_pool(stand_in, metrics) -> None:
+    registry = ClientRegistry()
+    stand_in.limiter = registry.limiter(MODEL)
+    first, second = chat_model(registry, stand_in), chat_model(registry, stand_in)
+
+    for model in (first, second, first, second):
+        assert model.invoke("hi").content == "hello"
+
+    # One connection served every call of both chat models
+    assert len(set(stand_in.ports)) == 1
+    assert stand_in.in_flight == [1, 1, 1, 1]
+    assert registry.stats()[MODEL] == {"queued": 0, "in_flight": 0, "shed": 0}
+    assert metrics.gauge(LLM_IN_FLIGHT, model=MODEL) == 0
+
+
+def test_calls_over_the_request_budget_are_shed_locally(stand_in, metrics) -> None:
+    registry = ClientRegistry(limits={MODEL: (2, 10**6)}, max_wait=1)
+    model = chat_model(registry, stand_in)
+
+    model.invoke("hi")
+    model.invoke("hi")
+    with pytest.raises(openai.RateLimitError):
+        model.invoke("hi")
+
+    # The third call never reached the provider
+    assert len(stand_in.ports) == 2
+    assert metrics.counter(LLM_SHED, model=MODEL) == 1
+
+
+def test_a_provider_429_pauses_the_model(stand_in, metrics) -> None:
+    registry = ClientRegistry(max_wait=5)
+    model = chat_model(registry, stand_in)
+    stand_in.statuses = [429]
+
+    with pytest.raises(openai.RateLimitError):
+        model.invoke("hi")
+    # The provider asked for 20 seconds, more than this registry waits
+    with pytest.raises(openai.RateLimitError):
+        model.invoke("hi")
+    assert len(stand_in.ports) == 1
+
+
+def test_async_calls_share_the_limiter(stand_in, metrics) -> None:
+    registry = ClientRegistry()
+    stand_in.limiter = registry.limiter(MODEL)
+    model = chat_model(registry, stand_in)
+
+    async def ask_all():
+        return await asyncio.gather(*(model.ainvoke("hi") for _ in range(3)))
+
+    assert [m.content for m in asyncio.run(ask_all())] == ["hello"] * 3
+    assert registry.limiter(MODEL).in_flight == 0
+
+
+def test_every_event_loop_gets_its_own_async_pool(stand_in, metrics) -> None:
+    registry = ClientRegistry()
+    model = chat_model(registry, stand_in)
+    transports = registry._async_transports[MODEL]
+
+    # A pool bound to the loop of the first run would fail in the second
+    for _ in range(2):
+        assert asyncio.run(model.ainvoke("hi")).content == "hello"
+    assert len(transports) == 1
+
+    async def ask_and_close():
+        answer = await model.ainvoke("hi")
+        await registry.aclose()
+        return answer
+
+    assert asyncio.run(ask_and_close()).content == "hello"
+    assert len(transports) == 0
+    assert registry.limiter(MODEL).in_flight == 0
+
+
+def test_calls_queue_for_the_token_budget_then_shed(metrics) -> None:
+    now = [0.0]
+    waits = []
+
+    def sleep(seconds: float) -> None:
+        waits.append((seconds, metrics.gauge(LLM_QUEUE_DEPTH, model=MODEL)))
+        now[0] += seconds
+
+    limiter = ModelLimiter(
+        MODEL, rpm=600, tpm=6000, max_queue=1, max_wait=2, clock=lambda: now[0], sleep=sleep
+    )
+    limiter.acquire(6000)
+    # 100 tokens per second refill, 150 tokens wait 1.5 seconds in the queue
+    limiter.acquire(150)
+    assert waits == [(1.5, 1)]
+    assert limiter.queued == 0
+    assert limiter.in_flight == 2
+
+    with pytest.raises(Overloaded) as shed:
+        limiter.reserve(1000)
+    assert shed.value.retry_after == pytest.approx(10)
@@ -0,0 +1,77 @@
+import sys
+
+from langchain_core.documents import Document
+
+from graph.chains.generation_grader import USEFUL
+from graph.context_packing import ContextPacker
+from graph.documents import load_documents
+
+
+def test_duplicates_are_dropped_and_the_retrieval_order_is_kept(word_encoding) -> None:
+    documents = [
+        Document(page_content="pizza dough needs flour water and yeast"),
+        Document(page_content="agent memory stores past steps of the agent"),
+        Document(page_content="Agent memory  stores past steps of the agent"),
+        Document(page_content="agent memory stores past steps of the agent run"),
+    ]
+    packer = ContextPacker(token_budget=100, encoding=word_encoding)
+
+    packed = packer.pack(documents)
+
+    # The first of the duplicates is kept, the pizza chunk stays ahead of it
+    assert packed.documents == [documents[0], documents[1]]
+    assert packed.duplicates == 2
+    assert packed.tokens_before == 32
+    assert packed.tokens_after == 15
+    assert packed.tokens_saved == 17
+
+
+def test_budget_is_filled_greedily(word_encoding) -> None:
+    documents = [
+        Document(page_content="agent memory " * 4),
+        Document(page_content="agent memory long term " + "filler words " * 10),
+        Document(page_content="short agent note"),
+    ]
+    packer = ContextPacker(token_budget=12, encoding=word_encoding)
+
+    packed = packer.pack(documents)
+
+    # The second chunk does not fit, the smaller third one still does
+    assert packed.documents == [documents[0], documents[2]]
+    assert packed.over_budget == 1
+    assert packed.tokens_after == 11
+
+
+def test_oversized_best_chunk_is_truncated(word_encoding) -> None:
+    documents = [Document(page_content="agent memory " * 20, metadata={"url": "u"})]
+    packer = ContextPacker(token_budget=5, encoding=word_encoding)
+
+    packed = packer.pack(documents)
+
+    assert packed.documents[0].page_content == "agent memory agent memory agent"
+    assert packed.documents[0].metadata == {"url": "u"}
+    assert packed.tokens_after == 5
+
+
+def test_the_grader_checks_the_context_the_generation_was_given(
+    monkeypatch, fake_graph
+) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [USEFUL]
+    node = sys.modules["graph.nodes.grade_generation"]
+    graded = []
+
+    def grade(question, documents, generation, concurrent=False):
+        graded.append(documents)
+        return USEFUL
+
+    def pack_again():
+        raise AssertionError("the grader packed the documents again")
+
+    monkeypatch.setattr(node, "grade_generation", grade)
+    monkeypatch.setattr(node, "get_context_packer", pack_again)
+
+    result = app.invoke({"question": "What is agent memory?"})
+
+    assert graded == [load_documents(result["context"])]
+    assert [d.page_content for d in graded[0]] == ["memory"]
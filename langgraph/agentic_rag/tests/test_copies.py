@@ -0,0 +1,29 @@
+import filecmp
+import os
+
+import pytest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES_DIR = os.path.join(PROJECT_DIR, "..", "..", "intro-vector-dbs")
+
+
+def code(path: str) -> str:
+    """
+    The module without its docstring, where the copies say what they are
+    """
+    with open(path, encoding="utf-8") as f:
+        return f.read().split('"""', 2)[2]
+
+
+@pytest.mark.parametrize("module", ["embedding_cache.py", "mmap_index.py"])
+def test_the_examples_copy_the_modules_verbatim(module: str) -> None:
+    assert code(os.path.join(EXAMPLES_DIR, module)) == code(
+        os.path.join(PROJECT_DIR, module)
+    )
+
+
+def test_the_examples_copy_the_prompts_verbatim() -> None:
+    name = os.path.join("prompts", "langchain-ai", "retrieval-qa-chat.json")
+    assert filecmp.cmp(
+        os.path.join(EXAMPLES_DIR, name), os.path.join(PROJECT_DIR, name), shallow=False
+    )
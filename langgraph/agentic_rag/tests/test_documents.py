@@ -0,0 +1,37 @@
+from langchain_core.documents import Document
+
+from graph.chains.generation_grader import USEFUL
+from graph.checkpointing import SqliteDocumentStore
+from graph.documents import DocumentStore, document_ref, load_documents
+
+
+def test_equal_documents_are_stored_once() -> None:
+    store = DocumentStore()
+    first = Document(id="a", page_content="agent memory", metadata={"page": 1})
+    copy = Document(id="a", page_content="agent memory", metadata={"page": 1})
+
+    assert store.put(first) == store.put(copy) == document_ref(copy)
+    assert store.put(Document(id="a", page_content="agent memory")) != document_ref(first)
+    assert len(store) == 2
+    # The first copy is the one kept
+    assert store.get(document_ref(copy)) is first
+
+
+def test_evicted_documents_come_back_from_the_backing(tmp_path) -> None:
+    store = DocumentStore(max_entries=1, backing=SqliteDocumentStore(str(tmp_path / "db")))
+    first = store.put(Document(page_content="first"))
+    store.put(Document(page_content="second"))
+
+    assert first not in store
+    assert store.get(first).page_content == "first"
+    assert first in store
+
+
+def test_the_state_carries_references(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [USEFUL]
+
+    result = app.invoke({"question": "What is agent memory?"})
+
+    assert all(isinstance(ref, str) for ref in result["documents"])
+    assert [d.page_content for d in load_documents(result["documents"])] == ["memory"]
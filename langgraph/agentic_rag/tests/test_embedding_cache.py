@@ -0,0 +1,99 @@
+import threading
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class CountingEmbeddings(Embeddings):
+    model = "counting"
+
+    def __init__(self):
+        self.embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return [[float(len(t)), float(t.count("a")), 1.0] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def test_repeated_embeddings_hit_the_cache(tmp_path) -> None:
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, EmbeddingCache(str(tmp_path)))
+
+    first = embeddings.embed_documents(["agent", "memory", "agent"])
+    second = embeddings.embed_documents(["memory", "agent"])
+    query = embeddings.embed_query("agent")
+
+    assert inner.embedded == ["agent", "memory"]
+    assert second == [first[1], first[0]]
+    assert query == first[0]
+
+
+def test_cache_persists_across_instances(tmp_path) -> None:
+    CachedEmbeddings(CountingEmbeddings(), EmbeddingCache(str(tmp_path))).embed_query(
+        "planning"
+    )
+
+    inner = CountingEmbeddings()
+    vector = CachedEmbeddings(inner, EmbeddingCache(str(tmp_path))).embed_query(
+        "planning"
+    )
+
+    assert inner.embedded == []
+    assert vector == [8.0, 1.0, 1.0]
+
+
+def test_least_recently_used_vectors_are_evicted(tmp_path) -> None:
+    cache = EmbeddingCache(str(tmp_path), max_entries=2)
+    inner = CountingEmbeddings()
+    embeddings = CachedEmbeddings(inner, cache)
+
+    embeddings.embed_documents(["a", "bb"])
+    embeddings.embed_query("a")
+    embeddings.embed_query("ccc")
+    inner.embedded.clear()
+
+    assert embeddings.embed_documents(["a", "ccc"]) == [[1.0, 1.0, 1.0], [3.0, 0.0, 1.0]]
+    assert inner.embedded == []
+    assert len(cache) == 2
+    embeddings.embed_query("bb")
+    assert inner.embedded == ["bb"]
+
+
+def test_rows_added_by_another_process_are_readable(tmp_path) -> None:
+    reader = EmbeddingCache(str(tmp_path))
+    writer = EmbeddingCache(str(tmp_path))
+    reader.put_many({"first": [0.0, 1.0]})
+    # Mapped before the file grows past its first 1024 rows
+    assert reader.get_many(["first"]) == {"first": [0.0, 1.0]}
+
+    writer.put_many({f"key-{i}": [float(i), 1.0] for i in range(2000)})
+
+    assert reader.get_many(["key-1999"]) == {"key-1999": [1999.0, 1.0]}
+
+
+def test_concurrent_writers_never_share_a_row(tmp_path) -> None:
+    # Each cache has its own connection and mapping, as another process would
+    caches = [EmbeddingCache(str(tmp_path)) for _ in range(4)]
+
+    def write(n: int) -> None:
+        for i in range(20):
+            caches[n].put_many({f"{n}-{i}-{j}": [n, i, j] for j in range(10)})
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(len(caches))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    expected = {
+        f"{n}-{i}-{j}": [float(n), float(i), float(j)]
+        for n in range(4)
+        for i in range(20)
+        for j in range(10)
+    }
+    assert EmbeddingCache(str(tmp_path)).get_many(list(expected)) == expected
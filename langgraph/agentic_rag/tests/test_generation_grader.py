@@ -0,0 +1,56 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from langchain_core.runnables import RunnableLambda
+
+import graph.chains.generation_grader as generation_grader
+from graph.chains.generation_grader import NOT_SUPPORTED, _agrade, _grade
+
+
+@pytest.fixture
+def slow_answer_grader(monkeypatch):
+    """
+    The hallucination grader rejects the generation at once, the answer
+    grader takes a second
+    """
+
+    def answer(inputs):
+        time.sleep(1)
+        return SimpleNamespace(binary_score=True)
+
+    async def aanswer(inputs):
+        await asyncio.sleep(1)
+        return SimpleNamespace(binary_score=True)
+
+    monkeypatch.setattr(
+        generation_grader,
+        "get_hallucination_grader",
+        lambda: RunnableLambda(lambda inputs: SimpleNamespace(binary_score=False)),
+    )
+    monkeypatch.setattr(
+        generation_grader, "get_answer_grader", lambda: RunnableLambda(answer, aanswer)
+    )
+
+
+def test_an_ungrounded_generation_does_not_wait_for_the_answer_grade(
+    slow_answer_grader,
+) -> None:
+    start = time.perf_counter()
+    verdict = _grade("What is agent memory?", ["memory"], "answer", concurrent=True)
+
+    assert verdict == NOT_SUPPORTED
+    assert time.perf_counter() - start < 0.5
+
+
+def test_an_ungrounded_generation_does_not_await_the_answer_grade(
+    slow_answer_grader,
+) -> None:
+    start = time.perf_counter()
+    verdict = asyncio.run(
+        _agrade("What is agent memory?", ["memory"], "answer", concurrent=True)
+    )
+
+    assert verdict == NOT_SUPPORTED
+    assert time.perf_counter() - start < 0.5
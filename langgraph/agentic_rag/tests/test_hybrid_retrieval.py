@@ -0,0 +1,87 @@
+from langchain_core.documents import Document
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from graph.embeddings import HashingEmbeddings
+from hybrid_retrieval import BM25Index, HybridRetriever, reciprocal_rank_fusion
+from ingestion import ingest
+from tests.test_ingestion import PARAGRAPH, RecordingVectorStore, make_loader
+
+CHUNKS = {
+    "gcg": "Greedy Coordinate Gradient (GCG) is a token level jailbreak attack.",
+    "memory": "Agents keep long term memory in an external vector store.",
+    "cot": "Chain of thought prompting asks the model to think step by step.",
+    "react": "ReAct interleaves reasoning traces and actions of the agent.",
+}
+
+
+def make_index() -> BM25Index:
+    index = BM25Index()
+    index.add(
+        list(CHUNKS),
+        [Document(id=i, page_content=text) for i, text in CHUNKS.items()],
+    )
+    return index
+
+
+def test_bm25_ranks_rare_keywords_first() -> None:
+    index = make_index()
+
+    assert index.search("What is the GCG attack?", k=1)[0][0] == "gcg"
+    assert index.search("pizza") == []
+
+
+def test_bm25_deletes_and_replaces_chunks() -> None:
+    index = make_index()
+
+    index.delete(["gcg"])
+    index.add(["memory"], [Document(page_content="GCG attacks agents")])
+
+    assert len(index) == 3
+    assert [i for i, _ in index.search("GCG")] == ["memory"]
+
+
+def test_reciprocal_rank_fusion_rewards_agreement() -> None:
+    fused = reciprocal_rank_fusion([["a", "b"], ["b", "c"]], k=60)
+
+    assert [i for i, _ in fused] == ["b", "a", "c"]
+    assert fused[0][1] == 1 / 62 + 1 / 61
+
+
+def test_hybrid_retriever_finds_keyword_matches() -> None:
+    store = InMemoryVectorStore(HashingEmbeddings())
+    store.add_documents(
+        [Document(id=i, page_content=text) for i, text in CHUNKS.items()],
+        ids=list(CHUNKS),
+    )
+    retriever = HybridRetriever(vectorstore=store, index=make_index(), k=2, fetch_k=4)
+
+    documents = retriever.invoke("GCG jailbreak")
+
+    assert documents[0].id == "gcg"
+    assert len(documents) == 2
+
+
+def test_vector_hits_without_ids_are_fused_by_content() -> None:
+    # A store whose documents come back without their ids
+    store = InMemoryVectorStore(HashingEmbeddings())
+    store.similarity_search = lambda query, k: [
+        Document(page_content=text) for text in list(CHUNKS.values())[:k]
+    ]
+    retriever = HybridRetriever(vectorstore=store, index=BM25Index(), k=3, fetch_k=4)
+
+    documents = retriever.invoke("agent memory")
+
+    assert [d.page_content for d in documents] == list(CHUNKS.values())[:3]
+
+
+def test_ingest_keeps_the_index_in_sync(tmp_path, word_splitter) -> None:
+    manifest_path = str(tmp_path / "manifest.json")
+    store, index = RecordingVectorStore(), BM25Index()
+    pages = {"a": PARAGRAPH, "b": "Adversarial attacks on LLMs."}
+
+    ingest(["a", "b"], store, manifest_path, make_loader(pages), index)
+    assert len(index) == len(store.ids)
+
+    ingest(["a"], store, manifest_path, make_loader(pages), index)
+    assert len(index) == len(store.ids)
+    assert index.search("adversarial") == []
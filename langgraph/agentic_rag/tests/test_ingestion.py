@@ -0,0 +1,78 @@
+from langchain_core.documents import Document
+
+from ingestion import ingest, load_manifest
+
+PARAGRAPH = "Agents use memory, planning and tools to solve tasks. " * 40
+
+
+class RecordingVectorStore:
+    def __init__(self):
+        self.ids = set()
+        self.added = []
+        self.deleted = []
+
+    def add_documents(self, documents, ids):
+        self.added.extend(ids)
+        self.ids.update(ids)
+
+    def delete(self, ids):
+        self.deleted.extend(ids)
+        self.ids.difference_update(ids)
+
+    def get(self, include):
+        return {"ids": sorted(self.ids)}
+
+
+def make_loader(pages):
+    return lambda url: [Document(page_content=pages[url], metadata={"source": url})]
+
+
+def test_ingest_is_incremental(tmp_path, word_splitter) -> None:
+    manifest_path = str(tmp_path / "manifest.json")
+    store = RecordingVectorStore()
+    pages = {"a": PARAGRAPH, "b": PARAGRAPH + " Prompt engineering."}
+
+    first = ingest(["a", "b"], store, manifest_path, make_loader(pages))
+    assert first["added"] == len(store.ids) > 0
+    assert first["deleted"] == 0
+
+    store.added.clear()
+    second = ingest(["a", "b"], store, manifest_path, make_loader(pages))
+    assert second == {"added": 0, "deleted": 0, "unchanged": len(store.ids)}
+    assert store.added == []
+
+
+def test_ingest_replaces_changed_and_removed_sources(tmp_path, word_splitter) -> None:
+    manifest_path = str(tmp_path / "manifest.json")
+    store = RecordingVectorStore()
+    pages = {"a": PARAGRAPH, "b": "Adversarial attacks on LLMs."}
+    ingest(["a", "b"], store, manifest_path, make_loader(pages))
+    b_chunks = load_manifest(manifest_path)["sources"]["b"]["chunks"]
+
+    pages["a"] = PARAGRAPH + " A brand new closing sentence."
+    result = ingest(["a"], store, manifest_path, make_loader(pages))
+
+    assert result["added"] >= 1
+    assert set(b_chunks) <= set(store.deleted)
+    assert set(load_manifest(manifest_path)["sources"]) == {"a"}
+    assert store.ids == set(load_manifest(manifest_path)["sources"]["a"]["chunks"])
+
+
+def test_ingest_without_a_manifest_replaces_the_rows_of_a_legacy_collection(
+    tmp_path, word_splitter
+) -> None:
+    store = RecordingVectorStore()
+    pages = {"a": PARAGRAPH, "b": "Adversarial attacks on LLMs."}
+    ingest(["a", "b"], store, str(tmp_path / "first.json"), make_loader(pages))
+    kept = set(store.ids)
+    # Rows of a collection ingested before the manifests, under random ids
+    legacy = {"0b8e2f9e-uuid-1", "5d41c7a0-uuid-2"}
+    store.ids.update(legacy)
+    store.added.clear()
+
+    result = ingest(["a", "b"], store, str(tmp_path / "missing.json"), make_loader(pages))
+
+    assert set(store.deleted) == legacy
+    assert store.added == []
+    assert store.ids == kept
+    assert result == {"added": 0, "deleted": 2, "unchanged": len(kept)}
@@ -0,0 +1,20 @@
+from langchain_core.language_models import FakeListChatModel
+from langchain_core.prompts import ChatPromptTemplate
+
+import graph.chains.generate as generate
+import graph.chains.llm as llm
+
+
+def test_chains_built_inside_use_llm_run_on_the_override(monkeypatch) -> None:
+    prompt = ChatPromptTemplate.from_template("{context}\n{question}")
+    monkeypatch.setattr(generate, "get_rag_prompt", lambda: prompt)
+    fake = FakeListChatModel(responses=["first", "second"])
+
+    with llm.use_llm(fake):
+        assert llm.get_llm() is fake
+        chain = generate.get_generation_chain()
+        assert chain.invoke({"context": "c", "question": "q"}) == "first"
+        assert generate.get_generation_chain() is chain
+
+    assert llm._override is None
+    assert generate.get_generation_chain.cache_info().currsize == 0
@@ -0,0 +1,78 @@
+import json
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from graph.chains.local_router import DecisionLog, LocalRouter, load_logged_decisions
+
+
+class TableEmbeddings(Embeddings):
+    """
+    The vector of every text is given
+    """
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.vectors[t] for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.vectors[text]
+
+
+def test_decisions_are_written_off_the_request_path_and_bounded(tmp_path) -> None:
+    path = str(tmp_path / "decisions.jsonl")
+    retrained = []
+    log = DecisionLog(
+        path, max_decisions=3, retrain_every=4, on_retrain=lambda: retrained.append(1)
+    )
+
+    for i in range(7):
+        log.log(f"question {i}", "websearch")
+    log.flush()
+
+    # Cut back to the last 3 decisions once the log held more than 6
+    assert [q for q, _ in load_logged_decisions(path)] == [f"question {i}" for i in (4, 5, 6)]
+    assert retrained == [1]
+
+
+def test_a_failed_write_does_not_stop_the_log(tmp_path) -> None:
+    log = DecisionLog(str(tmp_path / "missing" / "decisions.jsonl"), retrain_every=0)
+    log.log("What is agent memory?", "vectorstore")
+    log.flush()
+
+    log.path = str(tmp_path / "decisions.jsonl")
+    log.log("What is agent memory?", "vectorstore")
+    log.flush()
+
+    with open(log.path, encoding="utf-8") as f:
+        assert json.loads(f.readline())["datasource"] == "vectorstore"
+
+
+def test_the_threshold_is_calibrated_to_the_agreement_asked_for() -> None:
+    embeddings = TableEmbeddings(
+        {
+            "memory": [1.0, 0.0],
+            "planning": [0.9, 0.1],
+            "prompting": [0.95, 0.2],
+            "weather": [0.0, 1.0],
+            "football": [0.1, 0.9],
+            "news": [0.2, 0.95],
+            # Labeled vectorstore by the LLM router, closer to the web questions
+            "agent news": [0.45, 0.55],
+            "ambiguous": [0.5, 0.5],
+        }
+    )
+    questions = ["memory", "planning", "prompting", "weather", "football", "news", "agent news"]
+    labels = ["vectorstore"] * 3 + ["websearch"] * 3 + ["vectorstore"]
+
+    router = LocalRouter(embeddings, min_agreement=1.0).fit(questions, labels)
+
+    assert 0 < router.threshold < float("inf")
+    assert router.route("memory") == "vectorstore"
+    assert router.route("weather") == "websearch"
+    assert router.route("ambiguous") is None
+    # An agreement no threshold reaches leaves every question to the LLM router
+    impossible = LocalRouter(embeddings, min_agreement=1.1).fit(questions, labels)
+    assert impossible.route("memory") is None
@@ -0,0 +1,112 @@
+import json
+
+import pytest
+from langchain_core.language_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+
+import graph.metrics as metrics_module
+from graph.chains.generation_grader import NOT_SUPPORTED, USEFUL
+from graph.constants import GENERATE, RETRIEVE
+from graph.metrics import (
+    LLM_COMPLETION_TOKENS,
+    LLM_DURATION,
+    LLM_PROMPT_TOKENS,
+    NODE_DURATION,
+    NODE_ERRORS,
+    ROUTE_DECISIONS,
+    Histogram,
+    Metrics,
+    MetricsCallbackHandler,
+    instrument_node,
+)
+
+
+@pytest.fixture
+def metrics(monkeypatch) -> Metrics:
+    registry = Metrics(enabled=True)
+    monkeypatch.setattr(metrics_module, "get_metrics", lambda: registry)
+    return registry
+
+
+def test_histogram_buckets_are_upper_bound_inclusive() -> None:
+    histogram = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.count == 4
+    assert histogram.sum == pytest.approx(2.65)
+    assert histogram.quantile(0.5) == 0.1
+    assert histogram.quantile(0.99) == 1.0
+
+
+def test_exports_prometheus_text_and_json_lines() -> None:
+    registry = Metrics(buckets=(0.1, 1.0), enabled=True)
+    registry.observe(NODE_DURATION, 0.5, node="retrieve")
+    registry.inc(ROUTE_DECISIONS, router="route_question", decision="retrieve")
+
+    assert registry.to_prometheus().splitlines() == [
+        f"# TYPE {ROUTE_DECISIONS} counter",
+        f'{ROUTE_DECISIONS}{{decision="retrieve",router="route_question"}} 1',
+        f"# TYPE {NODE_DURATION} histogram",
+        f'{NODE_DURATION}_bucket{{node="retrieve",le="0.1"}} 0',
+        f'{NODE_DURATION}_bucket{{node="retrieve",le="1"}} 1',
+        f'{NODE_DURATION}_bucket{{node="retrieve",le="+Inf"}} 1',
+        f'{NODE_DURATION}_sum{{node="retrieve"}} 0.5',
+        f'{NODE_DURATION}_count{{node="retrieve"}} 1',
+    ]
+    records = [json.loads(line) for line in registry.to_json_lines().splitlines()]
+    assert [(r["name"], r["type"]) for r in records] == [
+        (ROUTE_DECISIONS, "counter"),
+        (NODE_DURATION, "histogram"),
+    ]
+    assert records[1]["counts"] == [0, 1, 0]
+
+
+def test_disabled_metrics_record_nothing() -> None:
+    registry = Metrics(enabled=False)
+    registry.observe(NODE_DURATION, 0.5, node="retrieve")
+    registry.inc(ROUTE_DECISIONS, router="route_question", decision="retrieve")
+
+    assert registry.to_prometheus() == "\n"
+
+
+def test_node_failures_are_counted_and_timed(metrics) -> None:
+    @instrument_node("broken")
+    def broken(state):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        broken({})
+
+    assert metrics.counter(NODE_ERRORS, node="broken") == 1
+    assert metrics.histogram(NODE_DURATION, node="broken").count == 1
+
+
+def test_graph_records_nodes_and_routing_decisions(fake_graph, metrics) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_SUPPORTED, USEFUL]
+
+    app.invoke({"question": "What is agent memory?"})
+
+    assert metrics.histogram(NODE_DURATION, node=RETRIEVE).count == 1
+    assert metrics.histogram(NODE_DURATION, node=GENERATE).count == 2
+    assert metrics.counter(ROUTE_DECISIONS, router="route_question", decision=RETRIEVE) == 1
+    router = "grade_generation_grounded_in_documents_and_question"
+    assert metrics.counter(ROUTE_DECISIONS, router=router, decision=NOT_SUPPORTED) == 1
+    assert metrics.counter(ROUTE_DECISIONS, router=router, decision="__end__") == 1
+
+
+def test_callback_handler_records_llm_latency_and_tokens() -> None:
+    registry = Metrics(enabled=True)
+    message = AIMessage(
+        content="hello",
+        usage_metadata={"input_tokens": 12, "output_tokens": 3, "total_tokens": 15},
+    )
+    llm = GenericFakeChatModel(messages=iter([message]))
+
+    llm.invoke("hi", {"callbacks": [MetricsCallbackHandler(registry)]})
+
+    assert registry.histogram(LLM_DURATION, model="unknown").count == 1
+    assert registry.counter(LLM_PROMPT_TOKENS, model="unknown") == 12
+    assert registry.counter(LLM_COMPLETION_TOKENS, model="unknown") == 3
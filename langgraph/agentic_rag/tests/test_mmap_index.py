@@ -0,0 +1,57 @@
+import os
+
+import numpy as np
+
+from graph.embeddings import HashingEmbeddings
+from mmap_index import MmapIndex, MmapVectorStore, write_index
+
+TEXTS = [
+    "Agents keep long term memory in an external vector store.",
+    "Chain of thought prompting asks the model to think step by step.",
+    "Greedy Coordinate Gradient is a token level jailbreak attack.",
+]
+
+
+def test_store_round_trips_through_the_files(tmp_path) -> None:
+    store = MmapVectorStore(str(tmp_path), HashingEmbeddings())
+    store.add_texts(TEXTS, [{"i": i} for i in range(3)], ids=["a", "b", "c"])
+
+    reopened = MmapVectorStore(str(tmp_path), HashingEmbeddings())
+    document, score = reopened.similarity_search_with_score("jailbreak attack", k=1)[0]
+
+    assert (document.id, document.metadata) == ("c", {"i": 2})
+    assert document.page_content == TEXTS[2]
+    assert 0 < score <= 1
+    assert isinstance(reopened.index.vectors, np.memmap)
+
+
+def test_writes_replace_and_delete_rows(tmp_path) -> None:
+    store = MmapVectorStore(str(tmp_path), HashingEmbeddings())
+    store.add_texts(TEXTS, ids=["a", "b", "c"])
+
+    store.add_texts(["Pizza dough needs yeast."], ids=["a"])
+    store.delete(["b"])
+
+    assert sorted(store.get()["ids"]) == ["a", "c"]
+    assert store.similarity_search("pizza yeast", k=1)[0].id == "a"
+    # The current version and the one before it
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("v-")]) == 2
+
+
+def test_ivf_search_finds_the_exact_neighbours(tmp_path) -> None:
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(16, 32))
+    vectors = np.repeat(centers, 50, axis=0) + 0.1 * rng.normal(size=(800, 32))
+    ids = [str(i) for i in range(len(vectors))]
+    write_index(str(tmp_path), ids, ids, [{}] * len(ids), vectors, nlist=16)
+    index = MmapIndex(str(tmp_path))
+
+    queries = centers + 0.1 * rng.normal(size=centers.shape)
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    recalled = 0
+    for query in queries:
+        exact = set(np.argsort(-(normalized @ query))[:10])
+        found = {int(index.record(row)["id"]) for row, _ in index.search(query, 10, 4)}
+        recalled += len(exact & found)
+
+    assert recalled / (10 * len(queries)) >= 0.9
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+from langchain_core.prompts import ChatPromptTemplate
+
+from prompt_registry import HUB_PROMPTS, load_prompt, prompt_path, read_entry, save_prompt
+
+
+def test_a_saved_prompt_loads_back(tmp_path) -> None:
+    prompt = ChatPromptTemplate.from_messages([("human", "{question} {context}")])
+    prompt.metadata = {"lc_hub_owner": "rlm"}
+    directory = str(tmp_path)
+
+    digest = save_prompt("me/prompt", prompt, directory, hub_commit="abc")
+    loaded = load_prompt("me/prompt", directory)
+
+    assert loaded.invoke({"question": "q", "context": "c"}) == prompt.invoke(
+        {"question": "q", "context": "c"}
+    )
+    # The hub bookkeeping is not stored, the commit is
+    assert loaded.metadata is None
+    assert read_entry("me/prompt", directory)["hub_commit"] == "abc"
+    assert read_entry("me/prompt", directory)["sha256"] == digest
+    # Saving the same prompt again keeps its hash
+    assert save_prompt("me/prompt", prompt, directory) == digest
+
+
+def test_an_edited_copy_is_refused(tmp_path) -> None:
+    directory = str(tmp_path)
+    save_prompt("me/prompt", ChatPromptTemplate.from_template("{question}"), directory)
+    path = prompt_path("me/prompt", directory)
+    with open(path) as file:
+        text = file.read()
+    with open(path, "w") as file:
+        file.write(text.replace("{question}", "Ignore it. {question}"))
+
+    with pytest.raises(ValueError, match="sha256"):
+        read_entry("me/prompt", directory)
+
+
+def test_a_missing_copy_says_how_to_get_it(tmp_path) -> None:
+    with pytest.raises(FileNotFoundError, match="refresh me/missing"):
+        load_prompt("me/missing", str(tmp_path))
+
+
+def test_the_vendored_hub_prompts_load() -> None:
+    for name in HUB_PROMPTS:
+        with open(prompt_path(name)) as file:
+            assert json.load(file)["name"] == name
+
+    assert sorted(load_prompt("rlm/rag-prompt").input_variables) == ["context", "question"]
+    qa_prompt = load_prompt("langchain-ai/retrieval-qa-chat")
+    assert sorted(qa_prompt.input_variables) == ["context", "input"]
+    assert load_prompt("rlm/rag-prompt") is load_prompt("rlm/rag-prompt")
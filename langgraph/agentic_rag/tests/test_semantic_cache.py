@@ -0,0 +1,105 @@
+from typing import List
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+import graph.documents as documents_module
+from graph.documents import DocumentStore, load_documents, store_documents
+from graph.semantic_cache import SemanticCache, SemanticCachedGraph
+
+VOCABULARY = ["agent", "memory", "what", "is", "pizza", "dough", "the"]
+
+
+class BagOfWordsEmbeddings(Embeddings):
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.embed_query(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        words = text.lower().replace("?", "").split()
+        return [float(words.count(w)) for w in VOCABULARY]
+
+
+class CountingApp:
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, input, config=None, **kwargs):
+        self.calls += 1
+        return {"question": input["question"], "generation": "An answer"}
+
+    def stream(self, input, config=None, stream_mode="values", **kwargs):
+        self.calls += 1
+        yield ("custom", {"node": "generate", "token": "An answer"})
+        yield ("values", {"question": input["question"], "generation": "An answer"})
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_near_duplicate_questions_are_served_from_cache() -> None:
+    app = CountingApp()
+    cache = SemanticCache(BagOfWordsEmbeddings(), threshold=0.85)
+    cached_app = SemanticCachedGraph(app, cache)
+
+    cached_app.invoke({"question": "What is agent memory?"})
+    result = cached_app.invoke({"question": "what is the agent memory"})
+    cached_app.invoke({"question": "pizza dough"})
+
+    assert app.calls == 2
+    assert result == {"question": "what is the agent memory", "generation": "An answer"}
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["hit_rate"] == 1 / 3
+
+
+def test_entries_expire_and_are_evicted() -> None:
+    clock = Clock()
+    cache = SemanticCache(BagOfWordsEmbeddings(), ttl=10, capacity=1, clock=clock)
+
+    cache.store("agent memory", {"generation": "a"}, latency=1.0)
+    clock.now = 11
+    assert cache.lookup("agent memory") is None
+
+    cache.store("agent memory", {"generation": "a"}, latency=1.0)
+    cache.store("pizza dough", {"generation": "b"}, latency=1.0)
+    assert cache.lookup("agent memory") is None
+    assert cache.lookup("pizza dough") == {"generation": "b"}
+    assert cache.stats()["latency_saved_s"] == 1.0
+
+
+def test_streamed_answers_are_cached_and_replayed() -> None:
+    app = CountingApp()
+    cached_app = SemanticCachedGraph(app, SemanticCache(BagOfWordsEmbeddings()))
+    modes = ["custom", "values"]
+
+    first = list(cached_app.stream({"question": "agent memory"}, stream_mode=modes))
+    second = list(cached_app.stream({"question": "agent memory"}, stream_mode=modes))
+
+    assert app.calls == 1
+    assert [m for m, _ in second] == modes
+    assert second[0][1]["token"] == first[0][1]["token"]
+    assert second[1] == first[1]
+
+
+def test_cached_answers_outlive_the_references_of_their_run(monkeypatch) -> None:
+    store = DocumentStore(max_entries=2)
+    monkeypatch.setattr(documents_module, "get_document_store", lambda: store)
+    refs = store_documents([Document(page_content="agent memory")])
+
+    class App(CountingApp):
+        def invoke(self, input, config=None, **kwargs):
+            return {**super().invoke(input, config), "documents": refs}
+
+    cached_app = SemanticCachedGraph(App(), SemanticCache(BagOfWordsEmbeddings()))
+    cached_app.invoke({"question": "What is agent memory?"})
+    # Later runs evict the documents of the first one
+    store_documents([Document(page_content="planning"), Document(page_content="tools")])
+    with pytest.raises(KeyError):
+        load_documents(refs)
+
+    cached = cached_app.invoke({"question": "What is agent memory?"})
+    assert [d.page_content for d in load_documents(cached["documents"])] == ["agent memory"]
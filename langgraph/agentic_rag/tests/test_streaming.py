@@ -0,0 +1,40 @@
+from graph.chains.generation_grader import NOT_SUPPORTED, USEFUL
+
+
+def test_tokens_are_streamed_and_graded_as_a_whole(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_SUPPORTED, USEFUL]
+
+    tokens, final = [], None
+    for mode, chunk in app.stream(
+        {"question": "What is agent memory?"}, stream_mode=["custom", "values"]
+    ):
+        if mode == "custom":
+            tokens.append((chunk["generation"], chunk["token"]))
+        else:
+            final = chunk
+
+    assert tokens == [
+        (1, "answer"),
+        (1, " "),
+        (1, "1"),
+        (2, "answer"),
+        (2, " "),
+        (2, "2"),
+    ]
+    assert final["generation"] == "answer 2"
+    assert final["ttft_s"] >= 0
+    assert final["tokens_per_s"] >= 0
+
+
+def test_time_to_first_token_is_kept_from_the_first_generation(fake_graph) -> None:
+    app, calls = fake_graph
+    calls["verdicts"] = [NOT_SUPPORTED, USEFUL]
+    ttfts = []
+
+    question = {"question": "What is agent memory?"}
+    for chunk in app.stream(question, stream_mode="values"):
+        ttfts.append(chunk.get("ttft_s"))
+
+    first = next(t for t in ttfts if t is not None)
+    assert ttfts[-1] == first
@@ -2,11 +2,13 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+from functools import lru_cache
+
 from langgraph.graph import MessagesState, START, END, StateGraph
+from langgraph.graph.state import CompiledStateGraph
 from langchain_core.messages import SystemMessage, HumanMessage
 
-from nodes import run_agent, tool_node
-from react import llm_with_tools
+from nodes import get_tool_node, run_agent
 
 AGENT_REASON = "agent_reason"
 ACT = "act"
@@ -24,31 +26,33 @@ def should_continue(state: MessagesState) -> bool:
     )
 
 
-flow = StateGraph(MessagesState)
-
-flow.add_node(AGENT_REASON, run_agent)
-flow.add_node(ACT, tool_node)
-flow.add_edge(START, AGENT_REASON)
+@lru_cache(maxsize=None)
+def get_app() -> CompiledStateGraph:
+    """
+    Builds and compiles the graph on first use, run render.py to draw graph.png
+    """
+    flow = StateGraph(MessagesState)
 
+    flow.add_node(AGENT_REASON, run_agent)
+    flow.add_node(ACT, get_tool_node())
+    flow.add_edge(START, AGENT_REASON)
 
-flow.add_conditional_edges(
-    AGENT_REASON,
-    should_continue,
-    {
-        ACT: ACT,
-        END: END,
-    },
-)
+    flow.add_conditional_edges(
+        AGENT_REASON,
+        should_continue,
+        {
+            ACT: ACT,
+            END: END,
+        },
+    )
 
-flow.add_edge(ACT, AGENT_REASON)
+    flow.add_edge(ACT, AGENT_REASON)
 
-app = flow.compile()
+    return flow.compile()
 
-with open("graph.png", "wb") as f:
-    f.write(app.get_graph().draw_mermaid_png())
 
 if __name__ == "__main__":
-    result = app.invoke(
+    result = get_app().invoke(
         {
             "messages": [
                 HumanMessage(
@@ -6,7 +6,7 @@ from langgraph.prebuilt import ToolNode
 
 load_dotenv()
 
-from react import llm_with_tools, tools
+from react import get_llm_with_tools, get_tools
 
 SYSTEM_MESSAGE = """
 You're a helpful assistant that can access to tools to answer questions.
@@ -18,11 +18,12 @@ def run_agent(state: MessagesState) -> MessagesState:
     This function is used to run the agent
     """
 
-    response = llm_with_tools.invoke(
+    response = get_llm_with_tools().invoke(
         [SystemMessage(content=SYSTEM_MESSAGE), *state["messages"]]
     )
 
     return {"messages": [response]}
 
 
-tool_node = ToolNode(tools)
+def get_tool_node() -> ToolNode:
+    return ToolNode(get_tools())
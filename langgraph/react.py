@@ -1,9 +1,13 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
 from dotenv import load_dotenv
-from langchain_core.tools import tool
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool, tool
 from langchain_openai import ChatOpenAI
 from langchain_tavily import TavilySearch
 
-from langgraph.graph import END, START, MessagesState, StateGraph
+from langgraph.graph import END, START
 from langgraph.prebuilt import ToolNode
 
 load_dotenv()
@@ -22,9 +26,33 @@ def triple(num: int) -> int:
     return float(num * 3)
 
 
-tools = [triple, TavilySearch(max_results=1)]
+@lru_cache(maxsize=None)
+def get_tavily_search() -> TavilySearch:
+    return TavilySearch(max_results=1)
+
 
-llm = ChatOpenAI(model="gpt-4.1-nano", temperature=0)
-llm_with_tools = llm.bind_tools(tools)
+@tool
+def tavily_search(query: str) -> Dict[str, Any]:
+    """
+    A search engine optimized for comprehensive, accurate, and trusted results.
+    Useful for when you need to answer questions about current events.
+    Args:
+        query: The search query
+    """
+    # The Tavily client reads its API key when it is created, the first search
+    # creates it so that building the graph needs no keys
+    return get_tavily_search().invoke({"query": query})
 
-graph = StateGraph(MessagesState)
+
+@lru_cache(maxsize=None)
+def get_tools() -> List[BaseTool]:
+    return [triple, tavily_search]
+
+
+@lru_cache(maxsize=None)
+def get_llm_with_tools() -> Runnable:
+    """
+    The clients are only created the first time the agent runs
+    """
+    llm = ChatOpenAI(model="gpt-4.1-nano", temperature=0)
+    return llm.bind_tools(get_tools())
@@ -2,7 +2,10 @@ from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage, BaseMessage
 from langgraph.graph import MessagesState, START, END, StateGraph
+from functools import lru_cache
 from typing import TypedDict, Annotated
+from langchain_core.runnables import Runnable
+from langgraph.graph.state import CompiledStateGraph
 from langgraph.graph.message import add_messages
 from dotenv import load_dotenv
 
@@ -33,9 +36,19 @@ generation_prompt = ChatPromptTemplate.from_messages(
 )
 
 
-llm = ChatOpenAI()
-generate_chain = generation_prompt | llm
-reflect_chain = reflection_prompt | llm
+@lru_cache(maxsize=None)
+def get_llm() -> ChatOpenAI:
+    return ChatOpenAI()
+
+
+@lru_cache(maxsize=None)
+def get_generate_chain() -> Runnable:
+    return generation_prompt | get_llm()
+
+
+@lru_cache(maxsize=None)
+def get_reflect_chain() -> Runnable:
+    return reflection_prompt | get_llm()
 
 
 class MessageGraph(TypedDict):
@@ -51,7 +64,7 @@ def generation_node(state: MessagesState) -> MessagesState:
     Returns:
         The state of the graph with the generated tweet
     """
-    return {"messages": [generate_chain.invoke(state["messages"])]}
+    return {"messages": [get_generate_chain().invoke(state["messages"])]}
 
 
 def reflection_node(state: MessagesState) -> MessagesState:
@@ -62,7 +75,7 @@ def reflection_node(state: MessagesState) -> MessagesState:
     Returns:
         The state of the graph with the critique and recommendations
     """
-    res = reflect_chain.invoke(state["messages"])
+    res = get_reflect_chain().invoke(state["messages"])
     return {"messages": [HumanMessage(content=res.content)]}
 
 
@@ -97,10 +110,13 @@ graph.add_conditional_edges(
 graph.add_edge(REFLECTION, GENERATION)
 
 
-app = graph.compile()
+@lru_cache(maxsize=None)
+def get_app() -> CompiledStateGraph:
+    """
+    Compiles the graph on first use, run render.py to draw graph.png
+    """
+    return graph.compile()
 
-with open("graph.png", "wb") as f:
-    f.write(app.get_graph().draw_mermaid_png())
 
 if __name__ == "__main__":
 
@@ -108,6 +124,6 @@ if __name__ == "__main__":
         content="Improve the following tweet: 'I'm so excited to be here! presenting the latest Langgraph features!', also add a question to the end of the tweet."
     )
 
-    result = app.invoke({"messages": [input]})
+    result = get_app().invoke({"messages": [input]})
     for message in result["messages"]:
         print(message.pretty_print())
@@ -0,0 +1,21 @@
+"""
+Draws the compiled graphs, kept out of the import path on purpose
+
+    python render.py main|reflection [--output graph.png]
+"""
+
+import argparse
+import importlib
+
+ENTRY_POINTS = {"main": "main", "reflection": "reflection_agent"}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("graph", choices=sorted(ENTRY_POINTS))
+    parser.add_argument("--output", default="graph.png")
+    args = parser.parse_args()
+
+    app = importlib.import_module(ENTRY_POINTS[args.graph]).get_app()
+    with open(args.output, "wb") as f:
+        f.write(app.get_graph().draw_mermaid_png())
+    print(f"Graph written to {args.output}")
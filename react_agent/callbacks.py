@@ -5,24 +5,79 @@
 
 # chain.invoke({"number": 25}, {"callbacks": [handler]})
 
-from typing import Any, List
+import logging
+import time
+from bisect import bisect_left
+from typing import Any, Dict, List
+from uuid import UUID
 
 from langchain.schema import LLMResult
 from langchain_core.callbacks import BaseCallbackHandler
 
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds of the latency buckets, those of the agentic RAG metrics
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
 
 class AgentCallbackHandler(BaseCallbackHandler):
+    """
+    Records the latency and the token usage of every LLM call in fixed-size
+    counters, a latency histogram in the Prometheus bucket layout. Prompts and
+    responses are only logged at DEBUG level, formatting them on every call
+    is not free.
+    """
+
+    # Called in the thread of the LLM call, the recording is cheap
+    run_inline = True
+
+    def __init__(self):
+        # latency_counts[i] counts the calls in (LATENCY_BUCKETS[i - 1], LATENCY_BUCKETS[i]]
+        self.latency_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_s = 0.0
+        self.calls = 0
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        # Calls in flight only, every one is popped when it ends or fails
+        self._started: Dict[UUID, float] = {}
+
+    def _observe(self, run_id: UUID) -> None:
+        start = self._started.pop(run_id, None)
+        if start is not None:
+            latency = time.perf_counter() - start
+            self.latency_counts[bisect_left(LATENCY_BUCKETS, latency)] += 1
+            self.latency_s += latency
+            self.calls += 1
 
     def on_llm_start(
-        self, serialized: dict[str, Any], prompts: List[str], **kwargs: Any
+        self, serialized: dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any
     ) -> Any:
         """Run when LLM starts running."""
-        print(" *** LLM Started ***")
-        print(" **** Prompt: ", prompts[0])
-        print(" *********************************** ")
+        self._started[run_id] = time.perf_counter()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("LLM started, prompt: %s", prompts[0])
 
-    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> Any:
-        """Run when LLM starts running."""
-        print(" *** LLM Ended ***")
-        print(" **** Response: ", response.generations[0][0].text)
-        print(" ----------------------------------- ")
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> Any:
+        """Run when LLM ends running."""
+        self._observe(run_id)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        self.prompt_tokens += usage.get("prompt_tokens", 0)
+        self.completion_tokens += usage.get("completion_tokens", 0)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("LLM ended, response: %s", response.generations[0][0].text)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> Any:
+        """Run when LLM errors."""
+        self._observe(run_id)
+        self.errors += 1
+        logger.debug("LLM failed: %r", error)
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "latency_s": self.latency_s,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }